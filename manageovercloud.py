@@ -25,18 +25,2654 @@ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
 
 
 # Import Python's native modules
+import argparse
+import atexit
+import base64
+import bisect
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import gc
 import os
 import gzip 
-from typing import Union
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import platform
+import random
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from typing import BinaryIO, Union
 
 # Import PIP packages
 import logging
-import dropbox
 
 
 logger = logging.getLogger(__name__)
 
+
+class _LazyModule(object):
+    """Stand-in for a module that is imported on first attribute access, so that importing this file stays cheap"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# The dropbox SDK (and requests under it) take a good part of a second to import; only cloud operations need them.
+# asyncio is only needed by AsyncManageOvercloud.
+dropbox = _LazyModule("dropbox")
+requests = _LazyModule("requests")
+asyncio = _LazyModule("asyncio")
+
+# files_upload() only takes files below this size; bigger files must go through an upload session
+DBX_SINGLE_UPLOAD_LIMIT = 150_000_000
+# In a concurrent upload session, every appended chunk except the last must be a multiple of 4 MiB
+DBX_SESSION_CHUNK_ALIGNMENT = 4 * 1024 * 1024
+# Block size of the dropbox content_hash
+DBX_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+# Upper bounds in seconds of the latency histogram buckets of OperationStats; a last +Inf bucket is implied
+STATS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Deflate window: each block of a parallel gzip is primed with this many bytes of the block before it
+GZIP_WINDOW_SIZE = 32 * 1024
+# Sidecar file next to a gzip file, holding its GzipIndex
+GZIP_INDEX_SUFFIX = ".gzindex"
+
+
+def dropbox_content_hash(f: Union[bytes, BinaryIO]) -> str:
+    """
+    Dropbox content_hash of f (bytes, or a binary file object that is read to the end):
+    the hex SHA-256 of the concatenated SHA-256 digests of every 4 MiB block.
+    See https://www.dropbox.com/developers/reference/content-hash
+    """
+    block_digests = hashlib.sha256()
+    if isinstance(f, (bytes, bytearray, memoryview)):
+        view = memoryview(f).cast("B")
+        for offset in range(0, view.nbytes, DBX_HASH_BLOCK_SIZE):
+            block_digests.update(hashlib.sha256(view[offset:offset + DBX_HASH_BLOCK_SIZE]).digest())
+    else:
+        while True:
+            block = f.read(DBX_HASH_BLOCK_SIZE)
+            if not block:
+                break
+            block_digests.update(hashlib.sha256(block).digest())
+    return block_digests.hexdigest()
+
+
+class _ContentHasher(object):
+    """Incremental dropbox_content_hash(), for data that is produced piece by piece"""
+
+    def __init__(self):
+        self._block_digests = hashlib.sha256()
+        self._block = hashlib.sha256()
+        self._block_size = 0
+
+    def update(self, data):
+        view = memoryview(data).cast("B")
+        while view.nbytes:
+            take = min(view.nbytes, DBX_HASH_BLOCK_SIZE - self._block_size)
+            self._block.update(view[:take])
+            self._block_size += take
+            view = view[take:]
+            if self._block_size == DBX_HASH_BLOCK_SIZE:
+                self._block_digests.update(self._block.digest())
+                self._block = hashlib.sha256()
+                self._block_size = 0
+
+    def hexdigest(self):
+        block_digests = self._block_digests.copy()
+        if self._block_size:
+            block_digests.update(self._block.digest())
+        return block_digests.hexdigest()
+
+
+def is_gzip(data: bytes) -> bool:
+    """True if data starts with a gzip member header (magic bytes, deflate method, no reserved flags)"""
+    return len(data) >= 10 and data[:3] == b"\x1f\x8b\x08" and not data[3] & 0xE0
+
+
+def _deflate_block(view, start, stop, level):
+    """Raw deflate of view[start:stop] primed with the preceding window, ended by a sync flush (or the final block)"""
+    dictionary = view[max(0, start - GZIP_WINDOW_SIZE):start]
+    if dictionary.nbytes:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(view[start:stop]) + compressor.flush(zlib.Z_FINISH if stop >= view.nbytes else zlib.Z_SYNC_FLUSH)
+
+
+def parallel_gzip_compress(data: bytes, compresslevel = 9, block_size = 1024 * 1024, executor = None, index = None, hasher = None) -> bytes:
+    """
+    gzip.compress(data, compresslevel, mtime=0) computed like pigz: data is cut into blocks of block_size bytes that are
+    deflated in parallel on executor (zlib releases the GIL), each primed with the last 32 KiB of the block before it so the
+    ratio barely suffers, and joined into one standard gzip member that gzip.decompress() reads as usual.
+    Without an executor, or for data of one block, it runs on the calling thread.
+    Every block starts at a flushed deflate boundary; given a GzipIndex, access points are recorded there.
+    Given a _ContentHasher, the dropbox content_hash of the output is computed as the blocks come out, in the same pass.
+    """
+    view = memoryview(data).cast("B")
+    starts = range(0, max(view.nbytes, 1), block_size)
+    futures = None
+    if executor is not None and len(starts) > 1:
+        futures = [executor.submit(_deflate_block, view, start, start + block_size, compresslevel) for start in starts]
+    # The CRC is computed while the blocks compress
+    trailer = (zlib.crc32(view) & 0xFFFFFFFF).to_bytes(4, "little") + (view.nbytes & 0xFFFFFFFF).to_bytes(4, "little")
+    xfl = b"\x02" if compresslevel == 9 else b"\x04" if compresslevel == 1 else b"\x00"
+    header = b"\x1f\x8b\x08\x00\x00\x00\x00\x00" + xfl + b"\xff"
+    if futures is None:
+        deflated = (_deflate_block(view, start, start + block_size, compresslevel) for start in starts)
+    else:
+        deflated = (future.result() for future in futures)
+    if hasher is not None:
+        hasher.update(header)
+    blocks = []
+    for block in deflated:
+        blocks.append(block)
+        if hasher is not None:
+            hasher.update(block)
+    if hasher is not None:
+        hasher.update(trailer)
+    compressed = b"".join([header, *blocks, trailer])
+    if index is not None:
+        compressed_offset = len(header)
+        for start, block in zip(starts, blocks):
+            index.feed(view[index.uncompressed_size:start])
+            if index.until_next_point() <= 0:
+                index.add_point(compressed_offset)
+            compressed_offset += len(block)
+        index.feed(view[index.uncompressed_size:])
+        index.finish(len(compressed), trailer, hasher.hexdigest() if hasher is not None else dropbox_content_hash(compressed))
+    return compressed
+
+
+class GzipIndex(object):
+    """
+    Access points into a gzip file (zran-style), so that a range of the uncompressed data can be decompressed starting from
+    the nearest point before it instead of from the beginning, and only the compressed bytes up to the next point are fetched.
+    A point is a pair of offsets (uncompressed, compressed) at a deflate block boundary where the compressor was flushed,
+    with the 32 KiB of uncompressed data before it that primes the decompressor. Points are at least spacing bytes apart.
+
+    Python's zlib cannot resume inside an arbitrary deflate stream, so points are placed while compressing:
+    ManageOvercloud records them in the gzip files it writes (with gzip_index = True) and keeps the index in a sidecar file
+    rel_path + GZIP_INDEX_SUFFIX. compressed_size, the gzip trailer and the dropbox content_hash of the gzip file tell whether
+    a sidecar still matches its file.
+
+    index = GzipIndex(spacing=1024 * 1024)
+    gz = parallel_gzip_compress(data, index=index)
+    uncompressed_offset, compressed_offset, window, compressed_stop = index.locate(start, start + length)
+    """
+    MAGIC = b"OCGZIDX1"
+    HEADER = struct.Struct("<8sIQQ8s64s")   # magic, number of points, compressed size, uncompressed size, trailer, content_hash
+    POINT = struct.Struct("<QQI")           # uncompressed offset, compressed offset, length of the zlib-compressed window
+
+    def __init__(self, spacing = 1024 * 1024):
+        self.spacing = spacing
+        self.points = []                    # [(uncompressed offset, compressed offset, window)]
+        self.uncompressed_size = 0
+        self.compressed_size = 0
+        self.trailer = b""
+        self.content_hash = ""
+        self._window = b""
+
+    def feed(self, data):
+        """Account for uncompressed data given to the compressor"""
+        view = memoryview(data).cast("B")
+        if view.nbytes:
+            self.uncompressed_size += view.nbytes
+            self._window = (self._window + bytes(view[-GZIP_WINDOW_SIZE:]))[-GZIP_WINDOW_SIZE:]
+
+    def until_next_point(self):
+        """Uncompressed bytes to feed before the next access point is due"""
+        if not self.points:
+            return 0
+        return self.points[-1][0] + self.spacing - self.uncompressed_size
+
+    def add_point(self, compressed_offset):
+        """Record an access point at the data fed so far; the compressor must have just been flushed at compressed_offset"""
+        self.points.append((self.uncompressed_size, compressed_offset, self._window))
+
+    def finish(self, compressed_size, trailer: bytes, content_hash = ""):
+        """Close the index once the whole gzip file is out, with its size, gzip trailer (CRC32, ISIZE) and dropbox content_hash"""
+        self.compressed_size = compressed_size
+        self.trailer = bytes(trailer)
+        self.content_hash = content_hash
+        self._window = b""
+
+    def locate(self, start, stop):
+        """(uncompressed offset, compressed offset, window) of the last point at or before start, and the compressed offset to read up to"""
+        uncompressed_offsets = [point[0] for point in self.points]
+        point = self.points[max(0, bisect.bisect_right(uncompressed_offsets, start) - 1)]
+        following = bisect.bisect_left(uncompressed_offsets, stop)
+        compressed_stop = self.points[following][1] if following < len(self.points) else self.compressed_size
+        return point[0], point[1], point[2], compressed_stop
+
+    def to_bytes(self):
+        parts = [self.HEADER.pack(self.MAGIC, len(self.points), self.compressed_size, self.uncompressed_size,
+                                  self.trailer, self.content_hash.encode())]
+        for uncompressed_offset, compressed_offset, window in self.points:
+            window = zlib.compress(window, 6)
+            parts.append(self.POINT.pack(uncompressed_offset, compressed_offset, len(window)))
+            parts.append(window)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        magic, count, compressed_size, uncompressed_size, trailer, content_hash = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC:
+            raise ValueError("Not a gzip index")
+        index = cls()
+        index.compressed_size, index.uncompressed_size, index.trailer = compressed_size, uncompressed_size, trailer
+        index.content_hash = content_hash.rstrip(b"\x00").decode()
+        offset = cls.HEADER.size
+        for _ in range(count):
+            uncompressed_offset, compressed_offset, window_size = cls.POINT.unpack_from(data, offset)
+            offset += cls.POINT.size
+            index.points.append((uncompressed_offset, compressed_offset, zlib.decompress(data[offset:offset + window_size])))
+            offset += window_size
+        return index
+
+
+class StorageBackend(object):
+    """
+    Interface of the cloud side of ManageOvercloud. Every dropbox cloud operation goes through one of these methods.
+    Paths are cloud full paths such as "/text/edgar/a.txt.gz" ("" is the root folder).
+    Results are dropbox SDK objects (dropbox.files.FileMetadata, FolderMetadata, DeletedMetadata, ListFolderResult)
+    and failures are raised as dropbox.exceptions errors, so callers see the same semantics whatever the backend.
+
+    DropboxBackend talks to Dropbox; DropboxEmulatorBackend keeps the objects in a local folder for offline testing.
+    """
+
+    def get_metadata(self, path):
+        """FileMetadata or FolderMetadata of path"""
+        raise NotImplementedError
+
+    def download(self, path, byte_range = None):
+        """
+        (FileMetadata, response) of path; response has .content, .iter_content(chunk_size) and .close(), like requests.Response.
+        byte_range = (start, stop) downloads only the bytes [start, stop) of the file.
+        """
+        raise NotImplementedError
+
+    def upload(self, data: bytes, path):
+        """Write data to path (overwriting) in one request; returns FileMetadata"""
+        raise NotImplementedError
+
+    def upload_session_start(self, data: bytes = b"", close = False, concurrent = False):
+        """Start an upload session with the first data (may be empty); returns the session id"""
+        raise NotImplementedError
+
+    def upload_session_append(self, session_id, offset, data: bytes, close = False):
+        """Append data at offset; in a concurrent session chunks may arrive in any order"""
+        raise NotImplementedError
+
+    def upload_session_finish(self, session_id, offset, path, data: bytes = b""):
+        """Commit the session (offset = total size after data) to path, overwriting; returns FileMetadata"""
+        raise NotImplementedError
+
+    def upload_session_finish_batch(self, entries):
+        """
+        Commit many closed sessions at once; entries are (session_id, offset, path).
+        Returns a list with, for each entry, the FileMetadata or the dropbox.exceptions.ApiError of that entry.
+        """
+        raise NotImplementedError
+
+    def list_folder(self, path, recursive = False):
+        """First page (ListFolderResult) of the entries of folder path"""
+        raise NotImplementedError
+
+    def list_folder_continue(self, cursor):
+        """Next page of a listing; once the listing is complete, the changes made since then"""
+        raise NotImplementedError
+
+    def move(self, from_path, to_path):
+        """Move/rename a file or folder; returns the metadata at to_path"""
+        raise NotImplementedError
+
+    def delete(self, path):
+        """Delete a file or folder (recursively); returns its metadata"""
+        raise NotImplementedError
+
+    def create_folder(self, path):
+        """Create folder path (and its parents); returns FolderMetadata"""
+        raise NotImplementedError
+
+    def move_batch(self, entries):
+        """
+        Move many files or folders at once; entries are (from_path, to_path), at most 1000.
+        Returns a list with, for each entry, the metadata at to_path or the dropbox.exceptions.ApiError of that entry.
+        """
+        raise NotImplementedError
+
+    def delete_batch(self, paths):
+        """Delete many files or folders at once (at most 1000); returns a list with the metadata or the ApiError of each path"""
+        raise NotImplementedError
+
+    def create_folder_batch(self, paths):
+        """Create many folders (and their parents) at once; returns a list with the FolderMetadata or the ApiError of each path"""
+        raise NotImplementedError
+
+
+class DropboxBackend(StorageBackend):
+    """
+    StorageBackend on a dropbox.Dropbox client: either the client dbx, or one made by connect() (e.g. ManageOvercloud.connect_dropbox)
+    on the first call. Every process gets a client of its own: after a fork, the first call in the child makes a new one
+    (with connect(), or as a clone of dbx on a new requests session), so parent and children never share connections.
+    The lock guarding that is made again in the child right after the fork, as another thread may have held it at fork time.
+    """
+    _instances = weakref.WeakSet()
+
+    def __init__(self, dbx = None, connect = None):
+        if dbx is None and connect is None:
+            raise ValueError("DropboxBackend needs a dropbox client or a connect function")
+        self._connect = connect
+        self._dbx = dbx
+        self._pid = os.getpid() if dbx is not None else None
+        self._lock = threading.Lock()
+        self._instances.add(self)
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        """os.register_at_fork() hook: a fresh lock for every instance, whose client is then made again on first use"""
+        for backend in list(cls._instances):
+            backend._lock = threading.Lock()
+            backend._pid = None
+
+    @property
+    def dbx(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    if self._connect is not None:
+                        self._dbx = self._connect()
+                    else:
+                        self._dbx = self._dbx.clone(session=dropbox.create_session())
+                    self._pid = os.getpid()
+        return self._dbx
+
+    def get_metadata(self, path):
+        return self.dbx.files_get_metadata(path)
+
+    def download(self, path, byte_range = None):
+        extra_headers = {"Range": f"bytes={byte_range[0]}-{byte_range[1] - 1}"} if byte_range else None
+        return self.dbx.files_download(path, extra_headers=extra_headers)
+
+    def upload(self, data: bytes, path):
+        return self.dbx.files_upload(data, path, dropbox.files.WriteMode.overwrite)
+
+    def upload_session_start(self, data: bytes = b"", close = False, concurrent = False):
+        session_type = dropbox.files.UploadSessionType.concurrent if concurrent else None
+        return self.dbx.files_upload_session_start(data, close=close, session_type=session_type).session_id
+
+    def upload_session_append(self, session_id, offset, data: bytes, close = False):
+        cursor = dropbox.files.UploadSessionCursor(session_id=session_id, offset=offset)
+        self.dbx.files_upload_session_append_v2(data, cursor, close=close)
+
+    @staticmethod
+    def _finish_arg(session_id, offset, path):
+        return dropbox.files.UploadSessionFinishArg(
+            cursor=dropbox.files.UploadSessionCursor(session_id=session_id, offset=offset),
+            commit=dropbox.files.CommitInfo(path=path, mode=dropbox.files.WriteMode.overwrite))
+
+    def upload_session_finish(self, session_id, offset, path, data: bytes = b""):
+        arg = self._finish_arg(session_id, offset, path)
+        return self.dbx.files_upload_session_finish(data, arg.cursor, arg.commit)
+
+    def upload_session_finish_batch(self, entries):
+        result = self.dbx.files_upload_session_finish_batch_v2([self._finish_arg(*entry) for entry in entries])
+        return [entry.get_success() if entry.is_success() else dropbox.exceptions.ApiError(None, entry.get_failure(), None, None)
+                for entry in result.entries]
+
+    def list_folder(self, path, recursive = False):
+        return self.dbx.files_list_folder(path, recursive=recursive)
+
+    def list_folder_continue(self, cursor):
+        return self.dbx.files_list_folder_continue(cursor)
+
+    def move(self, from_path, to_path):
+        return self.dbx.files_move_v2(from_path, to_path).metadata
+
+    def delete(self, path):
+        return self.dbx.files_delete_v2(path).metadata
+
+    def create_folder(self, path):
+        return self.dbx.files_create_folder_v2(path).metadata
+
+    def _batch_job(self, launch, check, poll_interval = 0.1, max_poll_interval = 2.0):
+        """Result of a batch job: at once if launch is complete, else by polling check(async_job_id) until the job is done"""
+        if launch.is_complete():
+            return launch.get_complete()
+        if not launch.is_async_job_id():
+            raise dropbox.exceptions.ApiError(None, launch, None, None)
+        async_job_id = launch.get_async_job_id()
+        while True:
+            time.sleep(poll_interval)
+            poll_interval = min(max_poll_interval, poll_interval * 2)
+            try:
+                status = check(async_job_id)
+            except dropbox.exceptions.RateLimitError as e:
+                poll_interval = max(poll_interval, e.backoff or 1.0)
+                continue
+            if status.is_complete():
+                return status.get_complete()
+            if not status.is_in_progress():
+                failure = status.get_failed() if getattr(status, "is_failed", None) and status.is_failed() else status
+                raise dropbox.exceptions.ApiError(None, failure, None, None)
+
+    @staticmethod
+    def _batch_entries(result, metadata = lambda success: success.metadata):
+        return [metadata(entry.get_success()) if entry.is_success() else dropbox.exceptions.ApiError(None, entry.get_failure(), None, None)
+                for entry in result.entries]
+
+    def move_batch(self, entries):
+        relocations = [dropbox.files.RelocationPath(from_path, to_path) for from_path, to_path in entries]
+        result = self._batch_job(self.dbx.files_move_batch_v2(relocations), self.dbx.files_move_batch_check_v2)
+        return self._batch_entries(result, metadata=lambda success: success)
+
+    def delete_batch(self, paths):
+        result = self._batch_job(self.dbx.files_delete_batch([dropbox.files.DeleteArg(path) for path in paths]),
+                                 self.dbx.files_delete_batch_check)
+        return self._batch_entries(result)
+
+    def create_folder_batch(self, paths):
+        result = self._batch_job(self.dbx.files_create_folder_batch(list(paths)), self.dbx.files_create_folder_batch_check)
+        return self._batch_entries(result)
+
+
+if hasattr(os, "register_at_fork"):     # not on Windows, which has no fork either
+    os.register_at_fork(after_in_child=DropboxBackend._after_fork_in_child)
+
+
+class _EmulatorResponse(object):
+    """Body of an emulated download, read lazily from the object file at the emulated bandwidth"""
+
+    def __init__(self, backend, fs_path, start, stop):
+        self._backend = backend
+        self._file = open(fs_path, "rb")
+        self._file.seek(start)
+        self._remaining = stop - start
+        self.status_code = 206 if start else 200
+
+    def iter_content(self, chunk_size = 1):
+        while self._remaining > 0:
+            chunk = self._file.read(min(chunk_size, self._remaining))
+            if not chunk:
+                break
+            self._remaining -= len(chunk)
+            self._backend._transfer(len(chunk))
+            yield chunk
+
+    @property
+    def content(self):
+        return b"".join(self.iter_content(1024 * 1024))
+
+    def close(self):
+        self._file.close()
+
+
+class _EmulatorError(Exception):
+    """Carries a dropbox error union (e.g. dropbox.files.WriteError) inside DropboxEmulatorBackend until it is wrapped in an ApiError"""
+
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+class DropboxEmulatorBackend(StorageBackend):
+    """
+    StorageBackend that keeps objects in a local folder and reproduces Dropbox semantics offline:
+    case-insensitive but case-preserving paths, the same dropbox.exceptions errors, the single-upload size limit,
+    content_hash, upload sessions (sequential and concurrent), paginated listings, and list_folder cursors that
+    report later changes (kept in a journal file, so several processes can share one emulator folder).
+
+    To reproduce production scaling on an offline box, every request can be slowed down by latency seconds,
+    transfers share a link of bandwidth bytes per second, and requests beyond requests_per_second (or a random
+    rate_limit_probability share of them) fail with a 429 dropbox.exceptions.RateLimitError carrying a Retry-After backoff.
+
+    mylc = ManageOvercloud(use_localfs=False, use_dropbox=True, backend=DropboxEmulatorBackend("/tmp/dbx", latency=0.05))
+    """
+
+    def __init__(self, root, latency = 0.0, bandwidth = None, requests_per_second = None, rate_limit_probability = 0.0,
+                 page_size = 500, upload_limit = DBX_SINGLE_UPLOAD_LIMIT):
+        self.root = root
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests_per_second = requests_per_second
+        self.rate_limit_probability = rate_limit_probability
+        self.page_size = page_size
+        self.upload_limit = upload_limit
+        self.objects_dir = os.path.join(root, "objects")
+        self.sessions_dir = os.path.join(root, "sessions")
+        self.journal_path = os.path.join(root, "journal")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._link_free_at = 0.0
+        self._tokens = float(requests_per_second or 0)
+        self._tokens_at = time.monotonic()
+        self._hashes = {}     # fs path -> (size, mtime_ns, content_hash)
+
+    # --- simulated network ---
+
+    def _request(self, nbytes = 0):
+        """One API round trip: rate limiting, then latency, then the upload/download of nbytes"""
+        retry_after = None
+        if self.requests_per_second:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(float(self.requests_per_second), self._tokens + (now - self._tokens_at) * self.requests_per_second)
+                self._tokens_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                else:
+                    retry_after = (1 - self._tokens) / self.requests_per_second
+        if retry_after is None and self.rate_limit_probability and random.random() < self.rate_limit_probability:
+            retry_after = 1.0
+        if retry_after is not None:
+            error = dropbox.auth.RateLimitError(reason=dropbox.auth.RateLimitReason.too_many_requests, retry_after=max(1, int(retry_after + 0.999)))
+            raise dropbox.exceptions.RateLimitError(self._request_id(), error, retry_after)
+        if self.latency:
+            time.sleep(self.latency)
+        self._transfer(nbytes)
+
+    def _transfer(self, nbytes):
+        """Wait for nbytes to go over the shared link of self.bandwidth bytes per second"""
+        if not self.bandwidth or not nbytes:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._link_free_at = max(now, self._link_free_at) + nbytes / self.bandwidth
+            wait = self._link_free_at - now
+        time.sleep(wait)
+
+    @staticmethod
+    def _request_id():
+        return "emulator-%016x" % random.getrandbits(64)
+
+    def _api_error(self, error):
+        return dropbox.exceptions.ApiError(self._request_id(), error, None, None)
+
+    # --- objects on disk ---
+
+    def _resolve(self, path):
+        """Filesystem path of the object at the dropbox path, matched case-insensitively; None when it does not exist"""
+        parts = [part for part in path.split("/") if part]
+        direct = os.path.join(self.objects_dir, *parts)
+        if os.path.exists(direct):
+            return direct
+        current = self.objects_dir
+        for part in parts:
+            try:
+                names = os.listdir(current)
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+            match = next((name for name in names if name.lower() == part.lower()), None)
+            if match is None:
+                return None
+            current = os.path.join(current, match)
+        return current
+
+    def _below_file(self, path):
+        """Whether one of the parent folders of the dropbox path is a file"""
+        parts = [part for part in path.split("/") if part]
+        for end in range(len(parts) - 1, 0, -1):
+            fs_path = self._resolve("/" + "/".join(parts[:end]))
+            if fs_path is not None:
+                return os.path.isfile(fs_path)
+        return False
+
+    def _display_path(self, fs_path):
+        rel = os.path.relpath(fs_path, self.objects_dir).replace(os.sep, "/")
+        return "" if rel == "." else "/" + rel
+
+    def _content_hash(self, fs_path, stat):
+        cached = self._hashes.get(fs_path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        with open(fs_path, "rb") as f:
+            content_hash = dropbox_content_hash(f)
+        self._hashes[fs_path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+        return content_hash
+
+    def _metadata(self, fs_path):
+        path_display = self._display_path(fs_path)
+        name = path_display.rsplit("/", 1)[-1]
+        object_id = "id:" + hashlib.sha1(path_display.lower().encode()).hexdigest()[:22]
+        if os.path.isdir(fs_path):
+            return dropbox.files.FolderMetadata(name=name, id=object_id, path_lower=path_display.lower(), path_display=path_display)
+        stat = os.stat(fs_path)
+        modified = datetime.datetime.fromtimestamp(int(stat.st_mtime), datetime.timezone.utc).replace(tzinfo=None)
+        return dropbox.files.FileMetadata(name=name, id=object_id, client_modified=modified, server_modified=modified,
+                                          rev="%015x" % stat.st_mtime_ns, size=stat.st_size,
+                                          path_lower=path_display.lower(), path_display=path_display,
+                                          content_hash=self._content_hash(fs_path, stat))
+
+    def _target(self, path):
+        """
+        Filesystem path to create the object at the dropbox path: existing parent folders are matched case-insensitively,
+        missing ones keep the given case. Raises _EmulatorError(dropbox.files.WriteError) when the path cannot be written.
+        """
+        parts = [part for part in path.split("/") if part]
+        if not parts:
+            raise _EmulatorError(dropbox.files.WriteError.disallowed_name)
+        current = self.objects_dir
+        for i, part in enumerate(parts):
+            try:
+                match = next((name for name in os.listdir(current) if name.lower() == part.lower()), part)
+            except FileNotFoundError:
+                match = part
+            except NotADirectoryError:
+                raise _EmulatorError(dropbox.files.WriteError.conflict(dropbox.files.WriteConflictError.file_ancestor))
+            current = os.path.join(current, match)
+        return current
+
+    def _journal(self, *fs_paths):
+        with self._lock, open(self.journal_path, "a") as f:
+            f.write("".join(self._display_path(fs_path) + "\n" for fs_path in fs_paths))
+
+    def _journal_size(self):
+        return os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+
+    def _commit_file(self, tmp_path, path):
+        """Move the finished temp file tmp_path to the dropbox path (overwriting a file); returns FileMetadata"""
+        fs_path = self._target(path)
+        if os.path.isdir(fs_path):
+            raise _EmulatorError(dropbox.files.WriteError.conflict(dropbox.files.WriteConflictError.folder))
+        os.makedirs(os.path.dirname(fs_path), exist_ok=True)
+        os.replace(tmp_path, fs_path)
+        self._journal(fs_path)
+        return self._metadata(fs_path)
+
+    def _tmp_path(self):
+        return os.path.join(self.sessions_dir, "tmp-%d-%d-%016x" % (os.getpid(), threading.get_ident(), random.getrandbits(64)))
+
+    # --- StorageBackend ---
+
+    def get_metadata(self, path):
+        self._request()
+        if not path.strip("/"):
+            raise dropbox.exceptions.BadInputError(self._request_id(), "The root folder is unsupported.")
+        fs_path = self._resolve(path)
+        if fs_path is None:
+            lookup = dropbox.files.LookupError.not_folder if self._below_file(path) else dropbox.files.LookupError.not_found
+            raise self._api_error(dropbox.files.GetMetadataError.path(lookup))
+        return self._metadata(fs_path)
+
+    def download(self, path, byte_range = None):
+        self._request()
+        fs_path = self._resolve(path)
+        if fs_path is None:
+            raise self._api_error(dropbox.files.DownloadError.path(dropbox.files.LookupError.not_found))
+        if os.path.isdir(fs_path):
+            raise self._api_error(dropbox.files.DownloadError.path(dropbox.files.LookupError.not_file))
+        metadata = self._metadata(fs_path)
+        start, stop = byte_range if byte_range else (0, metadata.size)
+        return metadata, _EmulatorResponse(self, fs_path, min(start, metadata.size), min(stop, metadata.size))
+
+    def upload(self, data: bytes, path):
+        if len(data) >= self.upload_limit:
+            raise self._api_error(dropbox.files.UploadError.payload_too_large)
+        self._request(len(data))
+        tmp_path = self._tmp_path()
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        try:
+            return self._commit_file(tmp_path, path)
+        except _EmulatorError as e:
+            os.remove(tmp_path)
+            raise self._api_error(dropbox.files.UploadError.path(dropbox.files.UploadWriteFailed(reason=e.error, upload_session_id="")))
+
+    def _session_dir(self, session_id):
+        session_dir = os.path.join(self.sessions_dir, session_id)
+        return session_dir if os.path.isdir(session_dir) else None
+
+    @staticmethod
+    def _session_chunks(session_dir):
+        """[(offset, size, file path)] of the chunks appended so far, in offset order"""
+        chunks = []
+        for name in sorted(os.listdir(session_dir)):
+            if name.isdigit():
+                chunk_path = os.path.join(session_dir, name)
+                chunks.append((int(name), os.path.getsize(chunk_path), chunk_path))
+        return chunks
+
+    def _write_chunk(self, session_dir, offset, data):
+        with open(os.path.join(session_dir, "%020d" % offset), "wb") as f:
+            f.write(data)
+
+    def upload_session_start(self, data: bytes = b"", close = False, concurrent = False):
+        self._request(len(data))
+        session_id = "%032x" % random.getrandbits(128)
+        session_dir = os.path.join(self.sessions_dir, session_id)
+        os.makedirs(session_dir)
+        if data:
+            self._write_chunk(session_dir, 0, data)
+        if concurrent:
+            open(os.path.join(session_dir, "concurrent"), "w").close()
+        if close:
+            open(os.path.join(session_dir, "closed"), "w").close()
+        return session_id
+
+    def upload_session_append(self, session_id, offset, data: bytes, close = False):
+        self._request(len(data))
+        session_dir = self._session_dir(session_id)
+        if session_dir is None:
+            raise self._api_error(dropbox.files.UploadSessionAppendError.not_found)
+        if os.path.exists(os.path.join(session_dir, "closed")):
+            raise self._api_error(dropbox.files.UploadSessionAppendError.closed)
+        if os.path.exists(os.path.join(session_dir, "concurrent")):
+            if not close and len(data) % DBX_SESSION_CHUNK_ALIGNMENT:
+                raise self._api_error(dropbox.files.UploadSessionAppendError.concurrent_session_invalid_data_size)
+            if os.path.exists(os.path.join(session_dir, "%020d" % offset)):
+                raise self._api_error(dropbox.files.UploadSessionAppendError.concurrent_session_invalid_offset)
+        else:
+            size = sum(chunk[1] for chunk in self._session_chunks(session_dir))
+            if offset != size:
+                raise self._api_error(dropbox.files.UploadSessionAppendError.incorrect_offset(
+                    dropbox.files.UploadSessionOffsetError(correct_offset=size)))
+        self._write_chunk(session_dir, offset, data)
+        if close:
+            open(os.path.join(session_dir, "closed"), "w").close()
+
+    def _finish(self, session_id, offset, path, data = b""):
+        """Commit a session; raises _EmulatorError(dropbox.files.UploadSessionFinishError) on failure"""
+        session_dir = self._session_dir(session_id)
+        if session_dir is None:
+            raise _EmulatorError(dropbox.files.UploadSessionFinishError.lookup_failed(dropbox.files.UploadSessionLookupError.not_found))
+        concurrent = os.path.exists(os.path.join(session_dir, "concurrent"))
+        if concurrent and data:
+            raise _EmulatorError(dropbox.files.UploadSessionFinishError.concurrent_session_data_not_allowed)
+        if concurrent and not os.path.exists(os.path.join(session_dir, "closed")):
+            raise _EmulatorError(dropbox.files.UploadSessionFinishError.concurrent_session_not_closed)
+        if data:
+            self._write_chunk(session_dir, offset - len(data), data)
+        tmp_path = self._tmp_path()
+        expected = 0
+        with open(tmp_path, "wb") as out:
+            for chunk_offset, size, chunk_path in self._session_chunks(session_dir):
+                if chunk_offset != expected:
+                    break
+                with open(chunk_path, "rb") as chunk:
+                    out.write(chunk.read())
+                expected += size
+        if expected != offset:
+            os.remove(tmp_path)
+            raise _EmulatorError(dropbox.files.UploadSessionFinishError.lookup_failed(dropbox.files.UploadSessionLookupError.incorrect_offset(
+                dropbox.files.UploadSessionOffsetError(correct_offset=expected))))
+        try:
+            metadata = self._commit_file(tmp_path, path)
+        except _EmulatorError as e:
+            os.remove(tmp_path)
+            raise _EmulatorError(dropbox.files.UploadSessionFinishError.path(e.error))
+        for name in os.listdir(session_dir):
+            os.remove(os.path.join(session_dir, name))
+        os.rmdir(session_dir)
+        return metadata
+
+    def upload_session_finish(self, session_id, offset, path, data: bytes = b""):
+        self._request(len(data))
+        try:
+            return self._finish(session_id, offset, path, data)
+        except _EmulatorError as e:
+            raise self._api_error(e.error)
+
+    def upload_session_finish_batch(self, entries):
+        self._request()
+        results = []
+        for session_id, offset, path in entries:
+            session_dir = self._session_dir(session_id)
+            try:
+                if session_dir is not None and not os.path.exists(os.path.join(session_dir, "closed")):
+                    raise _EmulatorError(dropbox.files.UploadSessionFinishError.lookup_failed(dropbox.files.UploadSessionLookupError.not_closed))
+                results.append(self._finish(session_id, offset, path))
+            except _EmulatorError as e:
+                results.append(self._api_error(e.error))
+        return results
+
+    @staticmethod
+    def _encode_cursor(state):
+        return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+    def _decode_cursor(self, cursor):
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise dropbox.exceptions.BadInputError(self._request_id(), "Invalid cursor")
+
+    def _listing(self, fs_path, recursive):
+        """All entries of a folder as [(path_lower, fs path)], sorted, so that parents come before their children"""
+        entries = []
+        for name in os.listdir(fs_path):
+            child = os.path.join(fs_path, name)
+            entries.append((self._display_path(child).lower(), child))
+            if recursive and os.path.isdir(child):
+                entries.extend(self._listing(child, recursive))
+        return sorted(entries)
+
+    def _list_page(self, state):
+        fs_path = self._resolve(state["path"])
+        if fs_path is None or not os.path.isdir(fs_path):
+            return dropbox.files.ListFolderResult(entries=[], cursor=self._encode_cursor(dict(state, after=None)), has_more=False)
+        entries = [(path_lower, child) for path_lower, child in self._listing(fs_path, state["recursive"])
+                   if state["after"] is None or path_lower > state["after"]]
+        page = entries[:self.page_size]
+        has_more = len(entries) > self.page_size
+        after = page[-1][0] if has_more else None
+        return dropbox.files.ListFolderResult(entries=[self._metadata(child) for _, child in page],
+                                              cursor=self._encode_cursor(dict(state, after=after)), has_more=has_more)
+
+    def list_folder(self, path, recursive = False):
+        self._request()
+        fs_path = self._resolve(path)
+        if fs_path is None:
+            raise self._api_error(dropbox.files.ListFolderError.path(dropbox.files.LookupError.not_found))
+        if not os.path.isdir(fs_path):
+            raise self._api_error(dropbox.files.ListFolderError.path(dropbox.files.LookupError.not_folder))
+        state = {"path": self._display_path(fs_path).lower(), "recursive": recursive, "journal": self._journal_size(), "after": None, "listing": True}
+        return self._list_page(state)
+
+    def list_folder_continue(self, cursor):
+        self._request()
+        state = self._decode_cursor(cursor)
+        if state.get("listing") and state["after"] is not None:
+            return self._list_page(state)
+        # The listing is complete: report what changed under the folder since the journal position in the cursor
+        if state["journal"] > self._journal_size():
+            raise self._api_error(dropbox.files.ListFolderContinueError.reset)
+        changed = {}
+        lines = 0
+        position = state["journal"]
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r") as f:
+                f.seek(position)
+                while lines < self.page_size:
+                    line = f.readline()
+                    if not line.endswith("\n"):
+                        break
+                    position += len(line.encode())
+                    lines += 1
+                    path_display = line[:-1]
+                    parent = path_display.lower().rsplit("/", 1)[0]
+                    folder = state["path"]
+                    if parent == folder or (state["recursive"] and path_display.lower().startswith(folder + "/")):
+                        changed[path_display.lower()] = path_display
+        entries = []
+        for path_lower, path_display in changed.items():
+            fs_path = self._resolve(path_display)
+            if fs_path is None:
+                entries.append(dropbox.files.DeletedMetadata(name=path_display.rsplit("/", 1)[-1], path_lower=path_lower, path_display=path_display))
+            else:
+                entries.append(self._metadata(fs_path))
+        has_more = lines >= self.page_size and position < self._journal_size()
+        return dropbox.files.ListFolderResult(entries=entries, has_more=has_more,
+                                              cursor=self._encode_cursor(dict(state, journal=position, after=None, listing=False)))
+
+    def move(self, from_path, to_path):
+        self._request()
+        return self._move(from_path, to_path)
+
+    def _move(self, from_path, to_path):
+        fs_from = self._resolve(from_path)
+        if fs_from is None:
+            raise self._api_error(dropbox.files.RelocationError.from_lookup(dropbox.files.LookupError.not_found))
+        from_display = self._display_path(fs_from)
+        if to_path.lower() == from_display.lower() and to_path != from_display:
+            # A case-only rename (/a -> /A): the destination "exists" only because paths match case-insensitively
+            fs_to = os.path.join(os.path.dirname(fs_from), to_path.rsplit("/", 1)[-1])
+        else:
+            if (to_path.lower() + "/").startswith(from_display.lower() + "/"):
+                raise self._api_error(dropbox.files.RelocationError.cant_move_folder_into_itself)
+            fs_to = self._resolve(to_path)
+            if fs_to is not None:
+                conflict = dropbox.files.WriteConflictError.folder if os.path.isdir(fs_to) else dropbox.files.WriteConflictError.file
+                raise self._api_error(dropbox.files.RelocationError.to(dropbox.files.WriteError.conflict(conflict)))
+            try:
+                fs_to = self._target(to_path)
+            except _EmulatorError as e:
+                raise self._api_error(dropbox.files.RelocationError.to(e.error))
+        os.makedirs(os.path.dirname(fs_to), exist_ok=True)
+        os.rename(fs_from, fs_to)
+        moved = [fs_to] + [fs_path for _, fs_path in (self._listing(fs_to, True) if os.path.isdir(fs_to) else [])]
+        self._journal(fs_from, *moved)
+        return self._metadata(fs_to)
+
+    def delete(self, path):
+        self._request()
+        return self._delete(path)
+
+    def _delete(self, path):
+        fs_path = self._resolve(path)
+        if fs_path is None or fs_path == self.objects_dir:
+            raise self._api_error(dropbox.files.DeleteError.path_lookup(dropbox.files.LookupError.not_found))
+        metadata = self._metadata(fs_path)
+        if os.path.isdir(fs_path):
+            shutil.rmtree(fs_path)
+        else:
+            os.remove(fs_path)
+        self._journal(fs_path)
+        return metadata
+
+    def create_folder(self, path):
+        self._request()
+        return self._create_folder(path)
+
+    def _create_folder(self, path):
+        fs_path = self._resolve(path)
+        if fs_path is not None:
+            conflict = dropbox.files.WriteConflictError.folder if os.path.isdir(fs_path) else dropbox.files.WriteConflictError.file
+            raise self._api_error(dropbox.files.CreateFolderError.path(dropbox.files.WriteError.conflict(conflict)))
+        try:
+            fs_path = self._target(path)
+        except _EmulatorError as e:
+            raise self._api_error(dropbox.files.CreateFolderError.path(e.error))
+        os.makedirs(fs_path)
+        self._journal(fs_path)
+        return self._metadata(fs_path)
+
+    def _batch(self, operation, entries):
+        """One request running operation(*entry) for every entry; per-entry ApiErrors are returned in place of the result"""
+        self._request()
+        results = []
+        for entry in entries:
+            try:
+                results.append(operation(*entry))
+            except dropbox.exceptions.ApiError as e:
+                results.append(e)
+        return results
+
+    def move_batch(self, entries):
+        return self._batch(self._move, entries)
+
+    def delete_batch(self, paths):
+        return self._batch(self._delete, [(path,) for path in paths])
+
+    def create_folder_batch(self, paths):
+        return self._batch(self._create_folder, [(path,) for path in paths])
+
+
+def _is_too_many_write_operations(error):
+    """True if a dropbox error union (e.g. UploadError, DeleteError, or a WriteError nested in .path) is too_many_write_operations"""
+    while error is not None:
+        if getattr(error, "is_too_many_write_operations", None) and error.is_too_many_write_operations():
+            return True
+        error = error.get_path() if getattr(error, "is_path", None) and error.is_path() else None
+    return False
+
+
+def _lock_file(f, blocking = True):
+    """
+    Take an exclusive flock on the open file f, held until f is closed (or its process ends): True when taken, False when
+    another open file holds it (only with blocking = False), None where flock does not exist (Windows).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _path_within(rel_path, paths):
+    """Whether rel_path is one of paths or below one of them"""
+    return any(rel_path == path or rel_path.startswith(path.rstrip("/") + "/") for path in paths)
+
+
+def _pid_alive(pid):
+    """Whether a process with this pid is running (on this node)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class CloudRateController(object):
+    """
+    Limits and retries the cloud calls of one or more ManageOvercloud instances; every StorageBackend call goes through call().
+
+    Errors are classified as rate limits (429 too_many_requests, too_many_write_operations), transient (5xx, connection errors
+    and timeouts) or permanent. Permanent errors are raised at once; the others are retried up to max_retries times, after the
+    Retry-After sent by dropbox for rate limits or else an exponential backoff from backoff_base up to backoff_cap, both jittered.
+
+    The number of calls in flight is adapted AIMD-style between min_concurrency and max_concurrency: it grows by about one for every
+    limit successful calls, and is multiplied by decrease_factor on a rate limit, at most once per Retry-After or round trip time
+    (whichever is longer), so that a burst of 429s counts once. After a rate limit, no thread starts a new call until the Retry-After has passed.
+
+    One controller is shared by all threads of a ManageOvercloud, and can be passed to several instances.
+    With shared_state_path, all processes on a node that point to the same file share one budget (POSIX only): the limit and the
+    hold-off are kept in that file, rewritten only when they change, and every process keeps its number of calls in flight in
+    a file of its own in shared_state_path + ".procs", on which it holds an flock as long as it runs. A call is admitted under
+    an exclusive lock of shared_state_path; the files nobody holds any more (their process died, whatever its pid became since)
+    are dropped.
+
+    controller = CloudRateController(max_concurrency=64, shared_state_path="/tmp/overcloud_rate.json")
+    mylc = ManageOvercloud(use_localfs=False, use_dropbox=True, rate_controller=controller)
+    """
+
+    def __init__(self, initial_concurrency = 8, min_concurrency = 1, max_concurrency = 64, max_retries = 5,
+                 backoff_base = 0.5, backoff_cap = 60.0, decrease_factor = 0.5, shared_state_path = None):
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.decrease_factor = decrease_factor
+        self.shared_state_path = shared_state_path
+        self.limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.counters = collections.Counter()   # calls, retries, rate_limit, transient
+        self._paused_until = 0.0                # time.time(), so that it can be shared between processes
+        self._last_decrease = 0.0
+        self._round_trip = 0.1                  # moving average of the seconds per successful call
+        self._in_flight = 0
+        self._others_in_flight = 0              # calls in flight of other processes sharing shared_state_path
+        self._version = None                    # version of the shared limit and hold-off last loaded or saved
+        self._process_fd = None                 # file of this process in shared_state_path + ".procs", locked
+        self._process_name = None
+        self._process_pid = None
+        self._peers = {}                        # name -> fd of the files of the other processes
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def classify(e):
+        """Kind of the exception e of a cloud call: "rate_limit", "transient", or None when it is not worth retrying"""
+        if isinstance(e, dropbox.exceptions.RateLimitError):
+            return "rate_limit"
+        if isinstance(e, dropbox.exceptions.ApiError):
+            return "rate_limit" if _is_too_many_write_operations(e.error) else None
+        if isinstance(e, dropbox.exceptions.HttpError):
+            return "transient" if (e.status_code or 0) >= 500 else None
+        if isinstance(e, (ConnectionError, TimeoutError, requests.exceptions.ConnectionError,
+                          requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)):
+            return "transient"
+        return None
+
+    def retry_delay(self, e, kind, attempt):
+        """Seconds to wait before retry number attempt + 1: at least the Retry-After of a rate limit, else a jittered exponential backoff"""
+        exponential = min(self.backoff_cap, self.backoff_base * 2 ** attempt)
+        backoff = getattr(e, "backoff", None)
+        if kind == "rate_limit" and backoff:
+            return max(backoff, exponential) * random.uniform(1.0, 1.25)
+        return exponential * random.uniform(0.5, 1.5)
+
+    @contextlib.contextmanager
+    def _shared_state(self, purge = False):
+        """
+        With shared_state_path, hold its file lock with the limit and the hold-off loaded from it if another process changed
+        them, and the calls in flight of the other processes summed up from their files; on exit, write the calls in flight
+        of this process to its file, and the limit and the hold-off to shared_state_path if they changed.
+        purge = True also drops the files of processes that died.
+        """
+        if not self.shared_state_path:
+            yield
+            return
+        self._register_process()
+        with open(self.shared_state_path, "a+") as f:
+            _lock_file(f)
+            f.seek(0)
+            text = f.read()
+            state = json.loads(text) if text else {}
+            if state.get("version", 0) != self._version:
+                self.limit = state.get("limit", self.limit)
+                self._paused_until = state.get("paused_until", self._paused_until)
+                self._last_decrease = state.get("last_decrease", self._last_decrease)
+                self._version = state.get("version", 0)
+            # The limit grows by a fraction per call: only a new whole number of calls is worth telling the other processes
+            saved = (int(self.limit), self._paused_until, self._last_decrease)
+            self._others_in_flight = self._peers_in_flight(purge)
+            yield
+            os.pwrite(self._process_fd, b"%12d\n" % self._in_flight, 0)
+            if (int(self.limit), self._paused_until, self._last_decrease) != saved:
+                self._version += 1
+                f.seek(0)
+                f.truncate()
+                json.dump({"limit": self.limit, "paused_until": self._paused_until, "last_decrease": self._last_decrease,
+                           "version": self._version}, f)
+
+    def _register_process(self):
+        """Create (once per process, so again after a fork) the locked file with the calls in flight of this process"""
+        if self._process_pid == os.getpid():
+            return
+        # After a fork, the inherited descriptors are the parent's: closing them here leaves its locks alone
+        for fd in [self._process_fd, *self._peers.values()]:
+            if fd is not None:
+                os.close(fd)
+        self._process_fd, self._peers = None, {}
+        procs_dir = self.shared_state_path + ".procs"
+        os.makedirs(procs_dir, exist_ok=True)
+        name = "proc-%d-%08x" % (os.getpid(), random.getrandbits(32))
+        # Locked before it appears under its name, so that no other process takes it for the file of a dead one
+        fd = os.open(os.path.join(procs_dir, name + ".tmp"), os.O_RDWR | os.O_CREAT, 0o644)
+        _lock_file(fd)
+        os.pwrite(fd, b"%12d\n" % 0, 0)
+        os.rename(os.path.join(procs_dir, name + ".tmp"), os.path.join(procs_dir, name))
+        self._process_fd, self._process_name, self._process_pid = fd, name, os.getpid()
+        atexit.register(self._unregister_process, os.path.join(procs_dir, name), os.getpid())
+
+    def _unregister_process(self, path, pid):
+        if pid == os.getpid():
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    def _peers_in_flight(self, purge = False):
+        """Calls in flight of the other processes, from their files (called with the lock of shared_state_path held)"""
+        procs_dir = self.shared_state_path + ".procs"
+        names = {name for name in os.listdir(procs_dir) if name.startswith("proc-") and not name.endswith(".tmp")}
+        for name in set(self._peers) - names:
+            os.close(self._peers.pop(name))
+        total = 0
+        for name in names - {self._process_name}:
+            fd = self._peers.get(name)
+            if fd is None:
+                try:
+                    fd = self._peers[name] = os.open(os.path.join(procs_dir, name), os.O_RDWR)
+                except FileNotFoundError:
+                    continue
+            if purge and _lock_file(fd, blocking=False):
+                # Nobody holds it: its process is gone
+                logger.info(f"Dropping the calls in flight of a process that died: {name}")
+                os.remove(os.path.join(procs_dir, name))
+                os.close(self._peers.pop(name))
+                continue
+            total += int(os.pread(fd, 16, 0).strip() or 0)
+        return total
+
+    def _acquire(self):
+        if self._pid != os.getpid():
+            # Forked child: the calls in flight (and any thread holding the lock) belong to the parent
+            self._pid = os.getpid()
+            self._cond = threading.Condition()
+            self._in_flight = 0
+        with self._cond:
+            blocked = False
+            while True:
+                with self._shared_state(purge = blocked):
+                    wait = self._paused_until - time.time()
+                    if wait <= 0 and self._in_flight + self._others_in_flight < int(self.limit):
+                        self._in_flight += 1
+                        return
+                blocked = True
+                # Other processes cannot notify this one, so poll the shared state
+                self._cond.wait(wait if wait > 0 else 0.05 if self.shared_state_path else None)
+
+    def _release(self, outcome, pause = 0.0, retrying = False, seconds = None):
+        """Count the call and adapt the limit; outcome is "ok" (also for permanent errors, the call got through), "rate_limit" or "transient" """
+        with self._cond:
+            with self._shared_state():
+                self._in_flight -= 1
+                now = time.time()
+                if outcome == "rate_limit":
+                    self._paused_until = max(self._paused_until, now + pause)
+                    if now >= self._last_decrease + max(pause, self._round_trip):
+                        self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+                        self._last_decrease = now
+                        logger.info(f"Cloud rate limit hit; holding off {pause:.1f}s and lowering concurrency to {int(self.limit)}")
+                elif outcome == "ok":
+                    self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            if seconds is not None:
+                self._round_trip += 0.1 * (seconds - self._round_trip)
+            self.counters["calls"] += 1
+            self.counters["retries"] += retrying
+            if outcome != "ok":
+                self.counters[outcome] += 1
+            self._cond.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        return self.run(func, args, kwargs)
+
+    def run(self, func, args = (), kwargs = None, max_retries = None):
+        """func(*args, **kwargs) within the concurrency limit, retried up to max_retries (default self.max_retries) times"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            self._acquire()
+            start = time.perf_counter()
+            try:
+                result = func(*args, **(kwargs or {}))
+            except Exception as e:
+                kind = self.classify(e)
+                delay = self.retry_delay(e, kind, attempt) if kind else 0.0
+                retrying = kind is not None and attempt < max_retries
+                self._release(kind or "ok", getattr(e, "backoff", None) or delay, retrying)
+                if not retrying:
+                    raise
+                logger.warning(f"{getattr(func, '__name__', func)} failed ({kind}: {e!r}); retry {attempt + 1} of {max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self._release("ok", seconds = time.perf_counter() - start)
+            return result
+
+    def snapshot(self):
+        with self._cond:
+            return {"limit": int(self.limit), "in_flight": self._in_flight,
+                    "paused_for": max(0.0, self._paused_until - time.time()), **self.counters}
+
+
+class _RateLimitedBackend(object):
+    """Proxy of a StorageBackend that sends every method call through a CloudRateController"""
+
+    def __init__(self, wrapped, controller):
+        self.wrapped = wrapped
+        self.controller = controller
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        return functools.partial(self.controller.call, attr)
+
+
+class _OperationTimer(object):
+    """Context manager returned by OperationStats.timer(); set .bytes_in / .bytes_out inside the with-block"""
+    __slots__ = ("_stats", "_operation", "_tier", "_start", "bytes_in", "bytes_out")
+
+    def __init__(self, stats, operation, tier):
+        self._stats = stats
+        self._operation = operation
+        self._tier = tier
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stats.record(self._operation, self._tier, time.perf_counter() - self._start,
+                           self.bytes_in, self.bytes_out, error = exc_type is not None)
+        return False
+
+
+class OperationStats(object):
+    """
+    Thread-safe counters of ManageOvercloud operations, kept per (operation, tier), where tier is "local", "cloud",
+    "cache" (the local disk cache) or "cpu" (gzip): call count, error count, bytes in (read / downloaded) and
+    bytes out (written / uploaded), total seconds and a latency histogram with the buckets of STATS_LATENCY_BUCKETS.
+    Hits and misses of the metadata cache and of the local disk cache are counted too, and so are the files (and bytes)
+    whose write, upload or download was skipped because the destination already held the same content.
+    Recording costs one perf_counter() pair, a bisect and one lock round trip, so it can stay on in production.
+
+    When log_interval is set, a one-line summary is logged at INFO level at most every log_interval seconds,
+    from whichever thread records an operation after the interval has passed.
+
+    stats = OperationStats()
+    with stats.timer("read", "cloud") as timer:
+        data = ...
+        timer.bytes_in = len(data)
+    stats.snapshot()["operations"]["read"]["cloud"]["p99"]
+    """
+
+    def __init__(self, log_interval = None, enabled = True):
+        self.log_interval = log_interval
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}   # (operation, tier) -> [count, errors, bytes_in, bytes_out, seconds, bucket counts]
+            self._caches = {}       # cache name -> [hits, misses]
+            self._skipped = {}      # tier -> [files, bytes]
+            self._since = time.time()
+            self._last_log = time.monotonic()
+
+    def timer(self, operation, tier):
+        return _OperationTimer(self, operation, tier)
+
+    def record(self, operation, tier, seconds, bytes_in = 0, bytes_out = 0, error = False):
+        if not self.enabled:
+            return
+        bucket = bisect.bisect_left(STATS_LATENCY_BUCKETS, seconds)
+        log_due = False
+        with self._lock:
+            counters = self._operations.get((operation, tier))
+            if counters is None:
+                counters = self._operations[(operation, tier)] = [0, 0, 0, 0, 0.0, [0] * (len(STATS_LATENCY_BUCKETS) + 1)]
+            counters[0] += 1
+            counters[1] += error
+            counters[2] += bytes_in
+            counters[3] += bytes_out
+            counters[4] += seconds
+            counters[5][bucket] += 1
+            if self.log_interval:
+                now = time.monotonic()
+                if now - self._last_log >= self.log_interval:
+                    self._last_log = now
+                    log_due = True
+        if log_due:
+            logger.info(self.summary_line())
+
+    def cache_access(self, cache, hit):
+        """Count a hit (hit = True) or a miss of a cache, named "metadata" or "local_disk" by ManageOvercloud"""
+        if not self.enabled:
+            return
+        with self._lock:
+            counters = self._caches.get(cache)
+            if counters is None:
+                counters = self._caches[cache] = [0, 0]
+            counters[0 if hit else 1] += 1
+
+    def skipped(self, tier, nbytes):
+        """Count a file of nbytes that was not written to tier ("local" or "cloud") because it already held the same content"""
+        if not self.enabled:
+            return
+        with self._lock:
+            counters = self._skipped.get(tier)
+            if counters is None:
+                counters = self._skipped[tier] = [0, 0]
+            counters[0] += 1
+            counters[1] += nbytes
+
+    @staticmethod
+    def _percentile(buckets, count, q):
+        """Upper bound of the histogram bucket holding the q-quantile (inf when it is in the +Inf bucket)"""
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(STATS_LATENCY_BUCKETS + (float("inf"),), buckets):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        """
+        Copy of all counters as a dict:
+        {"since": unix time of the last reset,
+         "operations": {operation: {tier: {"count", "errors", "bytes_in", "bytes_out", "seconds", "mean", "p50", "p90", "p99",
+                                           "histogram": [[upper bound in seconds, count], ...]}}},
+         "caches": {cache: {"hits", "misses", "hit_ratio"}},
+         "skipped": {tier: {"files", "bytes"}}}
+        Percentiles are estimated as the upper bound of the histogram bucket they fall in.
+        """
+        with self._lock:
+            operations = [(key, counters[:5] + [list(counters[5])]) for key, counters in self._operations.items()]
+            caches = {cache: list(counters) for cache, counters in self._caches.items()}
+            skipped = {tier: list(counters) for tier, counters in self._skipped.items()}
+            since = self._since
+        result = {"since": since, "operations": {}, "caches": {}, "skipped": {}}
+        for (operation, tier), (count, errors, bytes_in, bytes_out, seconds, buckets) in sorted(operations):
+            result["operations"].setdefault(operation, {})[tier] = {
+                "count": count, "errors": errors, "bytes_in": bytes_in, "bytes_out": bytes_out,
+                "seconds": seconds, "mean": seconds / count if count else 0.0,
+                "p50": self._percentile(buckets, count, 0.50),
+                "p90": self._percentile(buckets, count, 0.90),
+                "p99": self._percentile(buckets, count, 0.99),
+                "histogram": [[bound, bucket_count] for bound, bucket_count in zip(STATS_LATENCY_BUCKETS + (float("inf"),), buckets)],
+            }
+        for cache, (hits, misses) in sorted(caches.items()):
+            result["caches"][cache] = {"hits": hits, "misses": misses,
+                                       "hit_ratio": hits / (hits + misses) if hits + misses else 0.0}
+        for tier, (files, nbytes) in sorted(skipped.items()):
+            result["skipped"][tier] = {"files": files, "bytes": nbytes}
+        return result
+
+    def summary_line(self):
+        """One line with count, errors, MB moved and p50 / p99 latency per operation and tier, and cache hit ratios"""
+        snapshot = self.snapshot()
+        parts = []
+        for operation, tiers in snapshot["operations"].items():
+            for tier, s in tiers.items():
+                parts.append(f"{operation}/{tier} n={s['count']} err={s['errors']} "
+                             f"MB={(s['bytes_in'] + s['bytes_out']) / 1e6:.1f} p50={s['p50']}s p99={s['p99']}s")
+        for cache, s in snapshot["caches"].items():
+            parts.append(f"{cache} cache hits={s['hits']} misses={s['misses']}")
+        for tier, s in snapshot["skipped"].items():
+            parts.append(f"unchanged/{tier} skipped={s['files']} MB saved={s['bytes'] / 1e6:.1f}")
+        return "Overcloud stats: " + ("; ".join(parts) or "no operations")
+
+    def prometheus_text(self, prefix = "overcloud"):
+        """All counters in the Prometheus text exposition format (version 0.0.4), e.g. to serve on a /metrics endpoint"""
+        snapshot = self.snapshot()
+        rows = [(operation, tier, s) for operation, tiers in snapshot["operations"].items() for tier, s in tiers.items()]
+        lines = []
+
+        def _family(name, kind, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        for name, field, help_text in (("operations_total", "count", "Number of calls"),
+                                       ("operation_errors_total", "errors", "Number of calls that raised"),
+                                       ("operation_bytes_in_total", "bytes_in", "Bytes read or downloaded"),
+                                       ("operation_bytes_out_total", "bytes_out", "Bytes written or uploaded")):
+            _family(name, "counter", help_text)
+            for operation, tier, s in rows:
+                lines.append(f'{prefix}_{name}{{operation="{operation}",tier="{tier}"}} {s[field]}')
+        _family("operation_duration_seconds", "histogram", "Latency of calls in seconds")
+        for operation, tier, s in rows:
+            labels = f'operation="{operation}",tier="{tier}"'
+            cumulative = 0
+            for bound, bucket_count in s["histogram"]:
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_operation_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{prefix}_operation_duration_seconds_sum{{{labels}}} {s['seconds']}")
+            lines.append(f"{prefix}_operation_duration_seconds_count{{{labels}}} {s['count']}")
+        for name, field, help_text in (("cache_hits_total", "hits", "Cache hits"), ("cache_misses_total", "misses", "Cache misses")):
+            _family(name, "counter", help_text)
+            for cache, s in snapshot["caches"].items():
+                lines.append(f'{prefix}_{name}{{cache="{cache}"}} {s[field]}')
+        for name, field, help_text in (("skipped_files_total", "files", "Writes skipped because the content was unchanged"),
+                                       ("skipped_bytes_total", "bytes", "Bytes not written because the content was unchanged")):
+            _family(name, "counter", help_text)
+            for tier, s in snapshot["skipped"].items():
+                lines.append(f'{prefix}_{name}{{tier="{tier}"}} {s[field]}')
+        return "\n".join(lines) + "\n"
+
+
+class MetadataCache(object):
+    """
+    In-process cache of Dropbox metadata, bounded in size with LRU eviction and a TTL per entry.
+    Keys are cloud full paths, lower-cased because Dropbox paths are case-insensitive.
+    Both hits (FileMetadata / FolderMetadata) and "not found" results (stored as None) are cached.
+
+    After a folder has been listed completely, it is remembered as "listed"; a lookup of a path directly
+    inside a listed folder that is not in the cache is then answered as "not found" without a network call.
+    Whenever an entry inside a listed folder is evicted or invalidated, the folder loses its "listed" mark; a listing
+    fed page by page (listing_token(), then put_listing(..., since=token)) only marks the folder if none of its
+    entries was dropped since the token was taken.
+
+    cache = MetadataCache(maxsize=100_000, ttl=300)
+    cache.put("/text/edgar/a.txt.gz", metadata)
+    found, metadata = cache.get("/text/edgar/a.txt.gz")
+    """
+
+    def __init__(self, maxsize = 100_000, ttl = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()   # key -> (expire_time, metadata or None)
+        self._listed = {}                           # folder key -> expire_time
+        self._unlisted = {}                         # folder key -> sequence number of the last entry dropped from it
+        self._sequence = 0
+        self._pruned_sequence = 0                   # _unlisted forgets everything up to this sequence number
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(cloud_full_path):
+        return cloud_full_path.lower()
+
+    @staticmethod
+    def _parent(key):
+        return key.rsplit("/", 1)[0]
+
+    def get(self, cloud_full_path):
+        """Return (found_in_cache, metadata); metadata is None when the path is cached as not existing"""
+        key = self._key(cloud_full_path)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return True, entry[1]
+                del self._entries[key]
+                self._unlist(self._parent(key))
+            parent = self._parent(key)
+            expire_time = self._listed.get(parent)
+            if expire_time is not None:
+                if expire_time > now:
+                    return True, None
+                del self._listed[parent]
+        return False, None
+
+    def put(self, cloud_full_path, metadata):
+        """Cache metadata for cloud_full_path; metadata = None caches a "not found" result"""
+        key = self._key(cloud_full_path)
+        with self._lock:
+            self._put(key, metadata, time.monotonic() + self.ttl)
+
+    def _put(self, key, metadata, expire_time):
+        self._entries[key] = (expire_time, metadata)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._unlist(self._parent(evicted_key))
+
+    def _unlist(self, folder_key):
+        """Forget that folder_key was listed completely, also for the listings of it in progress"""
+        self._listed.pop(folder_key, None)
+        self._sequence += 1
+        self._unlisted[folder_key] = self._sequence
+        if len(self._unlisted) > self.maxsize:
+            self._unlisted.clear()
+            self._pruned_sequence = self._sequence
+
+    def listing_token(self):
+        """Token to take before the first page of a listing and to give to put_listing(since=...) with every page"""
+        with self._lock:
+            return self._sequence
+
+    def put_listing(self, cloud_folder_path, entries, complete = True, since = None):
+        """
+        Fill the cache with every child returned by files_list_folder of cloud_folder_path.
+        When complete = True (the listing had no more pages), the folder is marked as listed, unless an entry of the folder
+        was dropped from the cache meanwhile: since this call, or since the listing_token() since when that is given.
+        """
+        folder_key = self._key(cloud_folder_path)
+        expire_time = time.monotonic() + self.ttl
+        with self._lock:
+            if since is None:
+                since = self._sequence
+            for entry in entries:
+                if isinstance(entry, dropbox.files.DeletedMetadata):
+                    continue
+                self._put(folder_key + "/" + entry.name.lower(), entry, expire_time)
+            if complete and self._unlisted.get(folder_key, self._pruned_sequence) <= since:
+                self._listed[folder_key] = expire_time
+
+    def invalidate(self, cloud_full_path, recursive = False):
+        """Drop cached knowledge about cloud_full_path (and, if recursive, everything below it)"""
+        key = self._key(cloud_full_path)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._unlist(key)
+            self._unlist(self._parent(key))
+            if recursive:
+                prefix = key + "/"
+                for child_key in [k for k in self._entries if k.startswith(prefix)]:
+                    del self._entries[child_key]
+                for child_key in [k for k in self._listed if k.startswith(prefix)]:
+                    self._unlist(child_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._listed.clear()
+            self._unlisted.clear()
+            self._sequence += 1
+            self._pruned_sequence = self._sequence
+
+
+class LocalDiskCache(object):
+    """
+    Size-capped read-through cache of dropbox files in a local folder, for nodes where dropbox cloud is the primary storage
+    and the scratch disk is small. Cached files live at cache_dir + rel_path, like local_prefix + rel_path in the local tier.
+
+    Recency is tracked in memory (LRU order) and persisted in an index file in cache_dir, saved at most every
+    index_save_interval seconds and at exit, so a restarted process keeps its cache. Files found in cache_dir
+    without an index are adopted as least recently used.
+    When the cached bytes exceed max_bytes, least recently used files are deleted, except files pinned by open readers.
+    A file larger than max_bytes is never cached: open() hands it out as a temporary file, deleted when it is closed.
+    The cache is meant to be owned by one process at a time.
+
+    cache = LocalDiskCache("/scratch/edgar", max_bytes=50 * 1024**3)
+    with cache.open("/text/a.txt.gz", lambda tmp_path: mylc.dbx_download(dbx_full_path, tmp_path)) as file:
+        data = file.read()
+    """
+    INDEX_NAME = ".overcloud_cache_index.json"
+
+    def __init__(self, cache_dir, max_bytes, index_save_interval = 10):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_save_interval = index_save_interval
+        self.index_path = os.path.join(cache_dir or ".", self.INDEX_NAME)
+        self._entries = collections.OrderedDict()   # rel_path -> [size, last access time], least recently used first
+        self._bytes = 0
+        self._pins = collections.Counter()
+        self._fetching = {}                         # rel_path -> threading.Event, so a file is downloaded only once
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._load_index()
+        atexit.register(self.save_index)
+
+    def local_path(self, rel_path):
+        return self.cache_dir + rel_path
+
+    def _load_index(self):
+        entries = []
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, "r") as f:
+                entries = json.load(f).get("entries", [])
+        else:
+            # Adopt what is already on disk, oldest access first
+            for dirpath, dirnames, filenames in os.walk(self.cache_dir or "."):
+                for filename in filenames:
+                    if filename == self.INDEX_NAME or filename.endswith(".part"):
+                        continue
+                    full_path = os.path.join(dirpath, filename)
+                    stat = os.stat(full_path)
+                    rel_path = "/" + os.path.relpath(full_path, self.cache_dir or ".").replace(os.sep, "/")
+                    entries.append([rel_path, stat.st_size, stat.st_atime])
+            entries.sort(key=lambda entry: entry[2])
+        for rel_path, size, atime in entries:
+            if os.path.isfile(self.local_path(rel_path)):
+                self._entries[rel_path] = [size, atime]
+                self._bytes += size
+        logger.info(f"Local disk cache {self.cache_dir}: {len(self._entries)} files, {self._bytes} of {self.max_bytes} bytes")
+        self._evict()
+
+    def save_index(self, force = True):
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._last_save < self.index_save_interval):
+                return
+            entries = [[rel_path, size, atime] for rel_path, (size, atime) in self._entries.items()]
+            self._dirty = False
+            self._last_save = time.monotonic()
+        tmp_path = f"{self.index_path}.{os.getpid()}.part"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": entries}, f)
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def used_bytes(self):
+        return self._bytes
+
+    def lookup(self, rel_path, pin = False):
+        """
+        Full local path of rel_path if it is cached (and mark it as just used), else None.
+        With pin = True a cached file is also pinned, in the same step, and the caller must unpin() it.
+        """
+        with self._lock:
+            entry = self._entries.get(rel_path)
+            if entry is None:
+                return None
+            entry[1] = time.time()
+            self._entries.move_to_end(rel_path)
+            self._dirty = True
+            if pin:
+                self._pins[rel_path] += 1
+        return self.local_path(rel_path)
+
+    def fetch(self, rel_path, download):
+        """
+        Full local path of rel_path, calling download(tmp_full_path) first to fill the cache on a miss.
+        Concurrent fetches of the same file wait for the first one instead of downloading again.
+        Returns None for a file larger than max_bytes, which is not kept.
+        """
+        local_full_path, cached = self._fetch(rel_path, download, pin=False)
+        if not cached:
+            os.remove(local_full_path)
+            return None
+        return local_full_path
+
+    def open(self, rel_path, download):
+        """
+        rel_path opened for reading (a _CachedFileReader), downloaded with download(tmp_full_path) on a miss.
+        The file is pinned before anything can evict it, until the reader is closed.
+        """
+        local_full_path, cached = self._fetch(rel_path, download, pin=True)
+        return _CachedFileReader(self, rel_path, local_full_path, pinned=cached, temporary=not cached)
+
+    def _fetch(self, rel_path, download, pin):
+        """(full local path, cached): cached is False for a file too large for the cache, left at a temporary path for the caller"""
+        while True:
+            local_full_path = self.lookup(rel_path, pin=pin)
+            if local_full_path is not None:
+                return local_full_path, True
+            with self._lock:
+                event = self._fetching.get(rel_path)
+                if event is None:
+                    self._fetching[rel_path] = threading.Event()
+            if event is not None:
+                event.wait()
+                continue
+            try:
+                local_full_path = self.local_path(rel_path)
+                local_dir = os.path.dirname(local_full_path)
+                if local_dir:
+                    os.makedirs(local_dir, exist_ok=True)
+                tmp_full_path = f"{local_full_path}.{os.getpid()}.{threading.get_ident()}.part"
+                try:
+                    download(tmp_full_path)
+                    size = os.path.getsize(tmp_full_path)
+                    if size > self.max_bytes:
+                        # Caching it would evict everything, then itself; the caller deletes it when done
+                        self.discard(rel_path)
+                        uncached_path = f"{tmp_full_path}.uncached"
+                        os.replace(tmp_full_path, uncached_path)
+                        return uncached_path, False
+                    os.replace(tmp_full_path, local_full_path)
+                finally:
+                    if os.path.exists(tmp_full_path):
+                        os.remove(tmp_full_path)
+                self._add(rel_path, size, pin=pin)
+                return local_full_path, True
+            finally:
+                with self._lock:
+                    self._fetching.pop(rel_path).set()
+
+    def store(self, rel_path, data: bytes):
+        """Put data into the cache as rel_path (write-through of a file just written to dropbox cloud)"""
+        if len(data) > self.max_bytes:
+            self.discard(rel_path)
+            return
+        local_full_path = self.local_path(rel_path)
+        local_dir = os.path.dirname(local_full_path)
+        if local_dir:
+            os.makedirs(local_dir, exist_ok=True)
+        tmp_full_path = f"{local_full_path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp_full_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_full_path, local_full_path)
+        self._add(rel_path, len(data))
+
+    def _add(self, rel_path, size, pin = False):
+        with self._lock:
+            previous = self._entries.pop(rel_path, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._entries[rel_path] = [size, time.time()]
+            self._bytes += size
+            self._dirty = True
+            if pin:
+                self._pins[rel_path] += 1
+        self._evict()
+        self.save_index(force=False)
+
+    def discard(self, rel_path, recursive = False):
+        """Remove rel_path (and, if recursive, everything below it) from the cache, e.g. after it was renamed or removed"""
+        with self._lock:
+            rel_paths = [rel_path] if rel_path in self._entries else []
+            if recursive:
+                rel_paths += [p for p in self._entries if p.startswith(rel_path + "/")]
+            for p in rel_paths:
+                self._bytes -= self._entries.pop(p)[0]
+                self._dirty = True
+        for p in rel_paths:
+            if os.path.exists(self.local_path(p)):
+                os.remove(self.local_path(p))
+
+    def pin(self, rel_path):
+        """Protect rel_path from eviction until unpin(); pins are counted"""
+        with self._lock:
+            self._pins[rel_path] += 1
+
+    def unpin(self, rel_path):
+        with self._lock:
+            self._pins[rel_path] -= 1
+            if self._pins[rel_path] <= 0:
+                del self._pins[rel_path]
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            if self._bytes <= self.max_bytes:
+                return
+            victims = []
+            for rel_path, (size, _) in self._entries.items():
+                if self._bytes <= self.max_bytes:
+                    break
+                if self._pins.get(rel_path):
+                    continue
+                victims.append(rel_path)
+                self._bytes -= size
+            for rel_path in victims:
+                del self._entries[rel_path]
+            self._dirty = True
+        for rel_path in victims:
+            try:
+                os.remove(self.local_path(rel_path))
+            except OSError as e:
+                logger.warning(f"Unable to evict {self.local_path(rel_path)} from local disk cache: {e}")
+        if victims:
+            logger.debug(f"Evicted {len(victims)} files from local disk cache {self.cache_dir}")
+
+
+class FileCatalog(object):
+    """
+    On-disk catalog (SQLite in WAL mode) of the dropbox files and folders under the trees registered with track(), shared safely
+    by all processes on a node that open the same db_path. Each row holds the path, size, content_hash, server mtime, and the tiers
+    (cloud / local) that hold the file.
+
+    A tree is kept current by the writes, renames and deletes of every ManageOvercloud using the catalog, and by polling
+    files_list_folder_continue from the tree's saved cursor whenever it is more than max_age seconds old; one process polls,
+    the others keep answering from the catalog meanwhile. Inside a fresh tree, lookup() and children() answer from the local
+    index without any network call; for paths outside the tracked trees they report that the catalog does not know.
+    The metadata they return only carries name, paths, size, content_hash and server_modified.
+
+    catalog = FileCatalog("/scratch/overcloud_catalog.db", backend, max_age=60)
+    catalog.track("/text/edgar")
+    known, metadata = catalog.lookup("/text/edgar/full-index/1998-QTR4.csv.gz")
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,           -- lower-cased dropbox path
+            path TEXT NOT NULL,             -- dropbox path as displayed
+            parent TEXT NOT NULL,           -- key of the parent folder
+            is_dir INTEGER NOT NULL,
+            size INTEGER,
+            content_hash TEXT,
+            mtime REAL,                     -- server_modified, unix time
+            in_cloud INTEGER NOT NULL DEFAULT 0,
+            in_local INTEGER NOT NULL DEFAULT 0);
+        CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+        CREATE TABLE IF NOT EXISTS roots (
+            key TEXT PRIMARY KEY,           -- lower-cased dropbox folder whose whole tree is catalogued
+            cursor TEXT NOT NULL,
+            polled_at REAL NOT NULL);
+    """
+    UPSERT = """
+        INSERT INTO entries (key, path, parent, is_dir, size, content_hash, mtime, in_cloud) VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT (key) DO UPDATE SET path = excluded.path, is_dir = excluded.is_dir, size = excluded.size,
+            content_hash = excluded.content_hash, mtime = excluded.mtime, in_cloud = 1
+    """
+
+    def __init__(self, db_path, backend: StorageBackend, max_age = 60):
+        self.db_path = db_path
+        self.backend = backend
+        self.max_age = max_age
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        """SQLite connection of this thread (and process); sqlite3 connections cannot be shared between threads"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _write(self):
+        """A write transaction; BEGIN IMMEDIATE takes the write lock up front, so concurrent writers wait instead of failing"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _key(cloud_full_path):
+        return cloud_full_path.lower()
+
+    @staticmethod
+    def _subtree(key):
+        """WHERE clause and arguments that select key and everything below it (a range on the primary key, not a LIKE)"""
+        return "(key = ? OR (key > ? AND key < ?))", (key, key + "/", key + "0")
+
+    def _root_of(self, key):
+        """(root key, polled_at) of the tracked tree that holds key, or None"""
+        for root, polled_at in self._conn().execute("SELECT key, polled_at FROM roots"):
+            if key == root or key.startswith(root + "/"):
+                return root, polled_at
+        return None
+
+    def _fresh_root(self, key):
+        """Root key of the tracked tree that holds key, polled first when it is stale; None when the catalog cannot answer"""
+        root = self._root_of(key)
+        if root is None:
+            return None
+        if time.time() - root[1] > self.max_age:
+            try:
+                self.refresh(root[0])
+            except Exception as e:
+                logger.warning(f"Catalog {self.db_path}: polling {root[0]} failed ({e!r}); asking dropbox directly")
+                return None
+        return root[0]
+
+    @staticmethod
+    def _row_metadata(path, is_dir, size, content_hash, mtime):
+        name = path.rsplit("/", 1)[-1]
+        if is_dir:
+            return dropbox.files.FolderMetadata(name=name, path_lower=path.lower(), path_display=path)
+        server_modified = datetime.datetime.fromtimestamp(mtime or 0, datetime.timezone.utc).replace(tzinfo=None)
+        return dropbox.files.FileMetadata(name=name, path_lower=path.lower(), path_display=path, size=size or 0,
+                                          content_hash=content_hash, server_modified=server_modified)
+
+    def lookup(self, cloud_full_path):
+        """(known, metadata): known is False when the path is outside the fresh tracked trees; metadata is None if it is not in dropbox"""
+        key = self._key(cloud_full_path)
+        if self._fresh_root(key) is None:
+            return False, None
+        row = self._conn().execute("SELECT path, is_dir, size, content_hash, mtime FROM entries WHERE key = ? AND in_cloud = 1", (key,)).fetchone()
+        return True, self._row_metadata(*row) if row else None
+
+    def children(self, cloud_full_path):
+        """(known, iterator over the metadata of the children in dropbox of the folder cloud_full_path), read lazily from the catalog"""
+        key = self._key(cloud_full_path)
+        if self._fresh_root(key) is None:
+            return False, iter(())
+        rows = self._conn().execute("SELECT path, is_dir, size, content_hash, mtime FROM entries WHERE parent = ? AND in_cloud = 1 ORDER BY key", (key,))
+        return True, (self._row_metadata(*row) for row in rows)
+
+    def entry(self, cloud_full_path):
+        """Catalog row of cloud_full_path as a dict (including the tiers in_cloud / in_local that hold it), or None"""
+        cursor = self._conn().execute("SELECT * FROM entries WHERE key = ?", (self._key(cloud_full_path),))
+        row = cursor.fetchone()
+        return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def _apply(self, conn, entries):
+        for entry in entries:
+            key = entry.path_lower or entry.path_display.lower()
+            if isinstance(entry, dropbox.files.DeletedMetadata):
+                where, args = self._subtree(key)
+                conn.execute(f"DELETE FROM entries WHERE {where} AND in_local = 0", args)
+                conn.execute(f"UPDATE entries SET in_cloud = 0 WHERE {where}", args)
+                continue
+            if isinstance(entry, dropbox.files.FileMetadata):
+                mtime = entry.server_modified.replace(tzinfo=datetime.timezone.utc).timestamp()
+                conn.execute(self.UPSERT, (key, entry.path_display, self._parent(key), 0, entry.size, entry.content_hash, mtime))
+            else:
+                conn.execute(self.UPSERT, (key, entry.path_display, self._parent(key), 1, None, None, None))
+
+    @staticmethod
+    def _parent(key):
+        return key.rsplit("/", 1)[0]
+
+    def track(self, cloud_full_dir):
+        """
+        Catalogue the whole tree cloud_full_dir (one recursive listing; its cursor is kept for later polls).
+        Lookups inside it are answered from the catalog once the listing is complete. Re-tracking rescans the tree.
+        """
+        key = self._key(cloud_full_dir)
+        result = self.backend.list_folder(cloud_full_dir, recursive=True)
+        where, args = self._subtree(key)
+        with self._write() as conn:
+            conn.execute("DELETE FROM roots WHERE key = ?", (key,))
+            conn.execute(f"UPDATE entries SET in_cloud = 0 WHERE {where}", args)
+            conn.execute(self.UPSERT, (key, cloud_full_dir, self._parent(key), 1, None, None, None))
+        count = 0
+        while True:
+            with self._write() as conn:
+                self._apply(conn, result.entries)
+            count += len(result.entries)
+            if not result.has_more:
+                break
+            result = self.backend.list_folder_continue(result.cursor)
+        with self._write() as conn:
+            conn.execute(f"DELETE FROM entries WHERE {where} AND in_cloud = 0 AND in_local = 0", args)
+            conn.execute("INSERT OR REPLACE INTO roots (key, cursor, polled_at) VALUES (?, ?, ?)", (key, result.cursor, time.time()))
+        logger.info(f"Catalog {self.db_path}: tracking {cloud_full_dir} with {count} entries")
+
+    def refresh(self, root_key, force = False):
+        """Apply the dropbox changes since the saved cursor of the tracked tree root_key, unless another process just did"""
+        with self._write() as conn:
+            row = conn.execute("SELECT cursor, polled_at FROM roots WHERE key = ?", (root_key,)).fetchone()
+            if row is None or (not force and time.time() - row[1] <= self.max_age):
+                return
+            cursor, polled_at = row
+            # Claim the poll, so that the other processes keep answering from the catalog in the meantime
+            conn.execute("UPDATE roots SET polled_at = ? WHERE key = ?", (time.time(), root_key))
+            root_path = conn.execute("SELECT path FROM entries WHERE key = ?", (root_key,)).fetchone()
+
+        def _unclaim():
+            # The tree is as stale as before: let the next caller poll it again
+            with self._write() as conn:
+                conn.execute("UPDATE roots SET polled_at = ? WHERE key = ? AND cursor = ?", (polled_at, root_key, cursor))
+
+        entries = []
+        try:
+            result = self.backend.list_folder_continue(cursor)
+            entries.extend(result.entries)
+            while result.has_more:
+                result = self.backend.list_folder_continue(result.cursor)
+                entries.extend(result.entries)
+        except BaseException as e:
+            if not (isinstance(e, dropbox.exceptions.ApiError) and isinstance(e.error, dropbox.files.ListFolderContinueError)
+                    and e.error.is_reset()):
+                _unclaim()
+                raise
+            logger.warning(f"Catalog {self.db_path}: cursor of {root_key} was reset by dropbox; rescanning the tree")
+            try:
+                return self.track(root_path[0] if root_path else root_key)
+            except BaseException:
+                _unclaim()
+                raise
+        with self._write() as conn:
+            if conn.execute("SELECT cursor FROM roots WHERE key = ?", (root_key,)).fetchone() != (cursor,):
+                return
+            self._apply(conn, entries)
+            conn.execute("UPDATE roots SET cursor = ?, polled_at = ? WHERE key = ?", (result.cursor, time.time(), root_key))
+        logger.debug(f"Catalog {self.db_path}: applied {len(entries)} changes under {root_key}")
+
+    def record(self, cloud_full_path, metadata = None, in_local = None):
+        """
+        Record a change made by this process: metadata (File/FolderMetadata) now in dropbox at cloud_full_path, and/or
+        in_local = True / False for the copy in the local filesystem. Paths outside the tracked trees are ignored.
+        """
+        key = self._key(cloud_full_path)
+        root = self._root_of(key)
+        if root is None:
+            return
+        with self._write() as conn:
+            if metadata is not None:
+                # Dropbox creates missing parent folders implicitly
+                parents = []
+                parent = self._parent(key)
+                while len(parent) > len(root[0]):
+                    parents.append(dropbox.files.FolderMetadata(name=parent.rsplit("/", 1)[-1], path_lower=parent,
+                                                                path_display=cloud_full_path[:len(parent)]))
+                    parent = self._parent(parent)
+                self._apply(conn, parents[::-1] + [metadata])
+            if in_local is not None:
+                conn.execute("INSERT INTO entries (key, path, parent, is_dir, in_local) VALUES (?, ?, ?, 0, ?) "
+                             "ON CONFLICT (key) DO UPDATE SET in_local = excluded.in_local",
+                             (key, cloud_full_path, self._parent(key), int(in_local)))
+                conn.execute("DELETE FROM entries WHERE key = ? AND in_cloud = 0 AND in_local = 0", (key,))
+
+    def forget(self, cloud_full_path):
+        """Record that cloud_full_path (and everything below it) was deleted from both tiers"""
+        where, args = self._subtree(self._key(cloud_full_path))
+        with self._write() as conn:
+            conn.execute(f"DELETE FROM entries WHERE {where}", args)
+
+    def move(self, from_path, to_path):
+        """Record that from_path (and everything below it) was moved to to_path"""
+        from_key, to_key = self._key(from_path), self._key(to_path)
+        from_where, from_args = self._subtree(from_key)
+        to_where, to_args = self._subtree(to_key)
+        with self._write() as conn:
+            rows = conn.execute(f"SELECT key, path, is_dir, size, content_hash, mtime, in_cloud, in_local FROM entries WHERE {from_where}", from_args).fetchall()
+            conn.execute(f"DELETE FROM entries WHERE {from_where}", from_args)
+            conn.execute(f"DELETE FROM entries WHERE {to_where}", to_args)
+            conn.executemany("INSERT INTO entries (key, path, parent, is_dir, size, content_hash, mtime, in_cloud, in_local) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(to_key + key[len(from_key):], to_path + path[len(from_path):], self._parent(to_key + key[len(from_key):]), *rest)
+                              for key, path, *rest in rows])
+
+
+class _CachedFileReader(io.FileIO):
+    """
+    File in a LocalDiskCache, opened for reading and pinned against eviction until it is closed.
+    pinned = True when the caller already holds the pin (see LocalDiskCache.lookup(pin=True)); temporary = True for a
+    file too large for the cache, which is not pinned but deleted on close.
+    """
+
+    def __init__(self, cache, rel_path, local_full_path, pinned = False, temporary = False):
+        if not (pinned or temporary):
+            cache.pin(rel_path)
+        self._cache, self._rel_path = cache, rel_path
+        self._temporary = local_full_path if temporary else None
+        try:
+            super().__init__(local_full_path, "rb")
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self):
+        if self._temporary is None:
+            self._cache.unpin(self._rel_path)
+            return
+        try:
+            os.remove(self._temporary)
+        except OSError as e:
+            logger.warning(f"Unable to remove temporary download {self._temporary}: {e}")
+
+    def close(self):
+        if not self.closed:
+            try:
+                super().close()
+            finally:
+                self._release()
+
+
+class _ResponseRawIO(io.RawIOBase):
+    """
+    Read-only raw stream over the body of a requests.Response, such as the one returned by dbx.files_download(),
+    pulled from the network chunk_size bytes at a time.
+    When tee_path is given, every chunk is also written to tee_path + ".part", which is renamed to tee_path
+    once the whole body has been read; a stream closed before the end leaves no local file behind.
+    """
+
+    def __init__(self, response, chunk_size = 1024 * 1024, tee_path = None):
+        self._response = response
+        self._chunks = response.iter_content(chunk_size)
+        self._pending = memoryview(b"")
+        self._tee_path = tee_path
+        self._tee_file = None
+        if tee_path:
+            tee_dir = os.path.dirname(tee_path)
+            if tee_dir:
+                os.makedirs(tee_dir, exist_ok=True)
+            self._tee_file = open(tee_path + ".part", "wb")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._finish_tee()
+                return 0
+            if self._tee_file is not None:
+                self._tee_file.write(chunk)
+            self._pending = memoryview(chunk)
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def _finish_tee(self):
+        if self._tee_file is not None:
+            self._tee_file.close()
+            self._tee_file = None
+            os.replace(self._tee_path + ".part", self._tee_path)
+            logger.info(f"Save to local file {self._tee_path}")
+
+    def close(self):
+        if not self.closed:
+            self._response.close()
+            if self._tee_file is not None:
+                self._tee_file.close()
+                self._tee_file = None
+                os.remove(self._tee_path + ".part")
+        super().close()
+
+
+class _GzipStreamReader(gzip.GzipFile):
+    """GzipFile that also closes the stream it decompresses from"""
+
+    def close(self):
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+class _DbxUploadSession(object):
+    """
+    One concurrent dropbox upload session (files_upload_session_start / append_v2 / finish).
+    Chunks passed to append() are sent in the background by up to manager.upload_concurrency threads, each with
+    its own retries; append() blocks while that many chunks are in flight, so memory stays at chunk size times concurrency.
+    Every chunk except the last must be a multiple of 4 MiB, and the last one must be appended with close = True;
+    it is only sent once all earlier chunks are in, since a closed session takes no more appends.
+    """
+
+    def __init__(self, manager):
+        self._manager = manager
+        self.session_id = manager.backend.upload_session_start(b"", concurrent=True)
+        self.offset = 0
+        self.chunks = 0
+        self._slots = threading.BoundedSemaphore(manager.upload_concurrency)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=manager.upload_concurrency, thread_name_prefix="overcloud-upload")
+        self._error = None
+        self._futures = []
+
+    def append(self, chunk: bytes, close = False):
+        if close:
+            concurrent.futures.wait(self._futures)
+        self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            raise self._error
+        future = self._pool.submit(self._manager._dbx_upload_session_append, self.session_id, chunk, self.offset, close)
+        future.add_done_callback(self._chunk_done)
+        self._futures = [f for f in self._futures if not f.done()] + [future]
+        self.offset += len(chunk)
+        self.chunks += 1
+
+    def _chunk_done(self, future):
+        if not future.cancelled() and future.exception() is not None and self._error is None:
+            self._error = future.exception()
+        self._slots.release()
+
+    def finish(self, dbx_full_path):
+        """Wait for all chunks, then commit the session to dbx_full_path and return its FileMetadata"""
+        self._pool.shutdown(wait=True)
+        if self._error is not None:
+            raise self._error
+        return self._manager.backend.upload_session_finish(self.session_id, self.offset, dbx_full_path)
+
+    def abort(self):
+        """Stop sending chunks; the uncommitted session is discarded by dropbox when it expires"""
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+class _OvercloudWriter(io.BufferedIOBase):
+    """
+    Write-only stream returned by ManageOvercloud.open(..., "wb").
+    Data is gzip-compressed on the fly when use_gzip = True, then written to local_full_path + ".part" and streamed
+    to a dropbox upload session at the same time, so nothing is ever held in memory as a whole.
+    close() commits both: the local file is fsync-ed and renamed into place, and the upload session is finished
+    (small files that never filled a chunk are sent with a single files_upload).
+    Leaving a with-block through an exception, or calling abort(), discards both instead.
+    Given a GzipIndex (and the rel_path it belongs to), the compressor is flushed every index.spacing bytes to place
+    access points, and the index is saved next to the file once it is committed.
+    With manager.skip_unchanged, a copy that already holds the same content is left alone on close(): the local .part file
+    is dropped, and the upload session (whose chunks have been sent already) is not finished, so no new revision is made.
+    """
+
+    def __init__(self, manager, local_full_path = None, dbx_full_path = None, use_gzip = False, compresslevel = 9,
+                 rel_path = None, gzip_index: GzipIndex = None):
+        self._manager = manager
+        self._local_full_path = local_full_path
+        self._dbx_full_path = dbx_full_path
+        self._compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if use_gzip else None
+        self._local_file = io.open(local_full_path + ".part", "wb") if local_full_path else None
+        self._pending = bytearray()
+        self._session = None
+        self._rel_path = rel_path
+        self._index = gzip_index if use_gzip else None
+        self._written = 0
+        self._hasher = _ContentHasher() if self._index is not None or manager.skip_unchanged else None
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError("write to closed file")
+        data = memoryview(b).cast("B")
+        size = data.nbytes
+        if self._index is not None:
+            self._write_indexed(data)
+            return size
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._emit(data)
+        return size
+
+    def _write_indexed(self, data):
+        if not self._index.points:
+            self._emit(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self._index.add_point(self._written)
+        while data.nbytes:
+            piece, data = data[:self._index.until_next_point()], data[self._index.until_next_point():]
+            self._emit(self._compressor.compress(piece))
+            self._index.feed(piece)
+            if self._index.until_next_point() <= 0:
+                self._emit(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+                self._index.add_point(self._written)
+
+    def _emit(self, data):
+        if not data:
+            return
+        self._written += len(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
+        if self._local_file is not None:
+            self._local_file.write(data)
+        if self._dbx_full_path is not None:
+            self._pending += data
+            chunk_size = self._manager.upload_chunk_size
+            # Always hold some bytes back, so that the last append (close = True) is never empty
+            while len(self._pending) > chunk_size:
+                if self._session is None:
+                    self._session = _DbxUploadSession(self._manager)
+                self._session.append(bytes(self._pending[:chunk_size]))
+                del self._pending[:chunk_size]
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._commit()
+        except BaseException:
+            self.abort()
+            raise
+        super().close()
+
+    def _commit(self):
+        if self._compressor is not None:
+            if self._index is not None and not self._index.points:
+                self._write_indexed(memoryview(b""))
+            tail = self._compressor.flush()
+            self._emit(tail)
+            self._compressor = None
+            if self._index is not None:
+                self._index.finish(self._written, tail[-8:], self._hasher.hexdigest())
+        content_hash = self._hasher.hexdigest() if self._manager.skip_unchanged else None
+        if self._local_file is not None:
+            self._local_file.flush()
+            os.fsync(self._local_file.fileno())
+            self._local_file.close()
+        if self._dbx_full_path is not None:
+            if self._session is None:
+                self._manager.dbx_upload(bytes(self._pending), self._dbx_full_path, content_hash)
+            elif content_hash is not None and self._manager._cloud_unchanged(None, self._written, self._dbx_full_path, content_hash) is not None:
+                self._session.abort()
+            else:
+                self._session.append(bytes(self._pending), close=True)
+                metadata = self._session.finish(self._dbx_full_path)
+                if self._manager.metadata_cache is not None:
+                    self._manager.metadata_cache.put(self._dbx_full_path, metadata)
+                if self._manager.catalog is not None:
+                    self._manager.catalog.record(self._dbx_full_path, metadata)
+                logger.info(f"Finished upload session of {self._session.offset} bytes in {self._session.chunks} chunks: {self._dbx_full_path}")
+            logger.debug(f"Written file to cloud FS: {self._dbx_full_path}")
+        if self._local_file is not None:
+            if content_hash is not None and self._manager._local_unchanged(self._local_full_path, self._written, content_hash):
+                os.remove(self._local_full_path + ".part")
+                self._manager._stats.skipped("local", self._written)
+                logger.debug(f"Local file is unchanged, not rewriting it: {self._local_full_path}")
+            else:
+                os.replace(self._local_full_path + ".part", self._local_full_path)
+                logger.debug(f"Written file to local FS: {self._local_full_path}")
+            if self._manager.catalog is not None and self._dbx_full_path is not None:
+                self._manager.catalog.record(self._dbx_full_path, in_local=True)
+        self._manager._save_gzip_index(self._rel_path, self._index)
+
+    def abort(self):
+        """Discard everything written so far, locally and in dropbox cloud"""
+        if self.closed:
+            return
+        self._pending = bytearray()
+        if self._session is not None:
+            self._session.abort()
+        if self._local_file is not None:
+            self._local_file.close()
+            if os.path.exists(self._local_full_path + ".part"):
+                os.remove(self._local_full_path + ".part")
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        self.close()
+
+
+class _OvercloudTextWriter(io.TextIOWrapper):
+    """TextIOWrapper over _OvercloudWriter that discards the file when its with-block raises"""
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.buffer.abort()
+        return super().__exit__(exc_type, exc, tb)
+
+
+class WriteBehindQueue(object):
+    """
+    Background uploads of ManageOvercloud(write_behind = True): write() returns as soon as the local copy is durable and
+    queues its rel_path here; worker threads then call upload(rel_path), which sends the local file to dropbox cloud.
+    A path queued again before its upload has started is uploaded once, with its latest content.
+
+    Every queued path is appended (and fsync-ed) to a journal file of this queue in journal_dir, and marked done once uploaded,
+    so uploads cut short by a crash or preemption are not lost. The queue holds an exclusive flock on its journal for as long
+    as it is open, so that on start, the journals nobody holds (their process ended, whatever its pid became since) are claimed,
+    and their paths queued again. Where flock does not exist, a journal counts as abandoned when the pid in its name is not running.
+    Failed uploads stay in the journal, to be retried on the next start.
+
+    submit() blocks while max_pending paths are queued or uploading (backpressure). wait() returns once all are uploaded,
+    or wait(paths) once those paths (and the paths below them) are; cancel(paths) drops their uploads that have not started.
+    flush() waits for everything and returns the failures since the last flush(). close() flushes and stops the workers,
+    and runs at interpreter exit.
+
+    In a child made with fork(), the queue starts over empty: the uploads queued in the parent are left to the parent,
+    and the child gets workers and a journal of its own on its first submit(), instead of the parent's journal (and flock).
+    """
+    _open_journals = set()    # journal paths of the queues of this process
+    _instances = weakref.WeakSet()
+
+    def __init__(self, upload, journal_dir, max_pending = 1000, workers = 4):
+        self._upload = upload
+        self.journal_dir = journal_dir
+        self.max_pending = max(1, max_pending)
+        self.workers = max(1, workers)
+        self._closed = False
+        self._reset()
+        os.makedirs(journal_dir, exist_ok=True)
+        self._start()
+        self._instances.add(self)
+        atexit.register(self.close)
+        self._recover()
+
+    def _reset(self):
+        """Empty state, without a journal or workers yet"""
+        self._cond = threading.Condition()
+        self._queued = collections.OrderedDict()    # rel_path -> None, oldest first; never a path being uploaded
+        self._running = set()
+        self._again = set()                         # being uploaded, and queued again meanwhile
+        self._failures = {}                         # rel_path -> exception, since the last flush()
+        self._failed = set()                        # failed uploads, kept in the journal for the next start
+        self.journal_path = None
+        self._journal = None
+        self._journal_lines = 0
+        self._threads = []
+
+    def _start(self):
+        """Open (and lock) the journal of this queue and start its workers"""
+        self.journal_path = os.path.join(self.journal_dir, "journal-%d-%08x" % (os.getpid(), random.getrandbits(32)))
+        self._open_journals.add(self.journal_path)
+        self._journal = open(self.journal_path, "ab", buffering=0)
+        _lock_file(self._journal)
+        self._threads = [threading.Thread(target=self._work, name=f"overcloud-write-behind-{i}", daemon=True) for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        """
+        os.register_at_fork() hook: the workers did not survive the fork and the lock may have been held by one of them,
+        so every queue starts over empty. Closing the inherited journal does not release the parent's flock on it.
+        """
+        for queue in list(cls._instances):
+            journal = queue._journal
+            queue._reset()
+            if journal is not None:
+                journal.close()
+
+    @property
+    def pending(self):
+        """Number of paths queued or being uploaded"""
+        with self._cond:
+            return len(self._queued) + len(self._running)
+
+    def submit(self, rel_path):
+        """Queue the upload of rel_path, once it is journaled; blocks while the queue is full"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise ValueError("write-behind queue is closed")
+                if rel_path in self._queued:
+                    return
+                if rel_path in self._running:
+                    self._again.add(rel_path)
+                    return
+                if len(self._queued) + len(self._running) < self.max_pending:
+                    break
+                self._cond.wait()
+            if self._journal is None:
+                self._start()       # first upload in a forked child
+            self._log("+", rel_path)
+            self._queued[rel_path] = None
+            self._cond.notify_all()
+
+    def wait(self, paths = None):
+        """Block until every queued upload has finished (or failed); with paths, only the uploads of those paths and below them"""
+        with self._cond:
+            if paths is None:
+                while self._queued or self._running:
+                    self._cond.wait()
+                return
+            while any(_path_within(rel_path, paths) for rel_path in itertools.chain(self._queued, self._running)):
+                self._cond.wait()
+
+    def cancel(self, paths):
+        """
+        Drop the queued uploads of paths and of the paths below them (e.g. before they are removed), and wait for those
+        that have started already. Cancelled paths are marked done in the journal.
+        """
+        with self._cond:
+            for rel_path in [rel_path for rel_path in itertools.chain(self._queued, self._again, self._failed)
+                             if _path_within(rel_path, paths)]:
+                self._queued.pop(rel_path, None)
+                self._again.discard(rel_path)
+                self._failed.discard(rel_path)
+                self._failures.pop(rel_path, None)
+                self._log("-", rel_path)
+            self._cond.notify_all()
+        self.wait(paths)
+
+    def flush(self):
+        """wait(), then return (and forget) {rel_path: exception} of the uploads that failed since the last flush()"""
+        self.wait()
+        with self._cond:
+            failures, self._failures = self._failures, {}
+        return failures
+
+    def close(self):
+        """flush() and stop the workers; the journal is kept only if it holds failed uploads"""
+        if self._closed:
+            return {}
+        failures = self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if self._journal is not None:
+            self._journal.close()
+            if not self._failed:
+                os.remove(self.journal_path)
+            self._open_journals.discard(self.journal_path)
+        return failures
+
+    def _log(self, sign, rel_path):
+        """Append to the journal (called with the lock held); "+" entries are made durable before the path is queued"""
+        self._journal.write((json.dumps([sign, rel_path]) + "\n").encode())
+        if sign == "+":
+            os.fsync(self._journal.fileno())
+        self._journal_lines += 1
+
+    def _compact(self):
+        """Rewrite the journal with just the failed uploads, once the queue is idle (called with the lock held)"""
+        if self._journal_lines <= len(self._failed):
+            return
+        tmp_path = self.journal_path + ".tmp"
+        journal = open(tmp_path, "wb", buffering=0)
+        # Locked before it takes the place of the old journal, so that no other process can claim it in between
+        _lock_file(journal)
+        journal.write("".join(json.dumps(["+", rel_path]) + "\n" for rel_path in self._failed).encode())
+        os.fsync(journal.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self._journal.close()
+        self._journal = journal
+        self._journal_lines = len(self._failed)
+
+    def _recover(self):
+        """Queue again the unfinished uploads of the journals that no open queue holds (their process ended, or closed the queue)"""
+        for name in sorted(os.listdir(self.journal_dir)):
+            path = os.path.join(self.journal_dir, name)
+            parts = name.split(".")[0].split("-")
+            if name.endswith(".tmp") or len(parts) != 3 or parts[0] != "journal" or not parts[1].isdigit() or path in self._open_journals:
+                continue
+            try:
+                f = open(path, "r")
+            except FileNotFoundError:
+                continue        # claimed by another process first
+            with f:
+                locked = _lock_file(f, blocking=False)
+                if locked is False:
+                    continue    # the journal of a queue that is still open
+                if locked is None and int(parts[1]) != os.getpid() and _pid_alive(int(parts[1])):
+                    continue    # no flock here: go by the pid
+                if os.fstat(f.fileno()).st_nlink == 0:
+                    continue    # claimed and finished by another process while this one waited for the lock
+                pending = collections.OrderedDict()
+                for line in f:
+                    try:
+                        sign, rel_path = json.loads(line)
+                    except ValueError:
+                        continue        # a line cut short by the crash
+                    if sign == "+":
+                        pending[rel_path] = None
+                    else:
+                        pending.pop(rel_path, None)
+                logger.info(f"Resuming {len(pending)} write-behind uploads from {path}")
+                for rel_path in pending:
+                    self.submit(rel_path)       # journaled again, in this queue's journal
+                os.remove(path)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queued and not self._closed:
+                    self._cond.wait()
+                if not self._queued:
+                    return
+                rel_path, _ = self._queued.popitem(last=False)
+                self._running.add(rel_path)
+            error = None
+            try:
+                self._upload(rel_path)
+            except Exception as e:
+                logger.error(f"Write-behind upload of {rel_path} failed: {e!r}")
+                error = e
+            with self._cond:
+                self._running.discard(rel_path)
+                if rel_path in self._again:
+                    self._again.discard(rel_path)
+                    self._queued[rel_path] = None
+                elif error is None:
+                    self._log("-", rel_path)
+                    self._failures.pop(rel_path, None)
+                    self._failed.discard(rel_path)
+                else:
+                    self._failures[rel_path] = error
+                    self._failed.add(rel_path)
+                if not self._queued and not self._running:
+                    self._compact()
+                self._cond.notify_all()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=WriteBehindQueue._after_fork_in_child)
+
+
+class OvercloudDirEntry(object):
+    """
+    Entry yielded by ManageOvercloud.scandir() and walk(), like os.DirEntry: name, path (the rel_path of the entry),
+    is_file(), is_dir(), size (None for folders), server_modified (naive UTC datetime: dropbox server time, or the local mtime),
+    content_hash (dropbox content_hash, None for local entries), and in_local / in_cloud telling where it was listed.
+    """
+    __slots__ = ("name", "path", "size", "server_modified", "content_hash", "in_local", "in_cloud", "_is_dir")
+
+    def __init__(self, name, path, is_dir, size = None, server_modified = None, content_hash = None, in_local = False, in_cloud = False):
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+        self.size = size
+        self.server_modified = server_modified
+        self.content_hash = content_hash
+        self.in_local = in_local
+        self.in_cloud = in_cloud
+
+    @classmethod
+    def from_metadata(cls, path, metadata, in_local = False):
+        if isinstance(metadata, dropbox.files.FileMetadata):
+            return cls(metadata.name, path, False, metadata.size, metadata.server_modified, metadata.content_hash, in_local, True)
+        return cls(metadata.name, path, True, in_local=in_local, in_cloud=True)
+
+    @classmethod
+    def from_os(cls, path, entry: os.DirEntry):
+        if entry.is_dir():
+            return cls(entry.name, path, True, in_local=True)
+        stat = entry.stat()
+        modified = datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc).replace(tzinfo=None)
+        return cls(entry.name, path, False, stat.st_size, modified, in_local=True)
+
+    def is_file(self):
+        return not self._is_dir
+
+    def is_dir(self):
+        return self._is_dir
+
+    def __repr__(self):
+        return f"<OvercloudDirEntry {self.path!r}>"
+
+
 class ManageOvercloud(object):
     """
     This class replaces local file IO functions such as os.path.isfile(), os.path.isdir(), open(...).read(), open(...).write() 
@@ -45,6 +2681,46 @@ class ManageOvercloud(object):
     When use_localfs, use_dropbox = True, Flase, it reduces to os. method
     When use_localfs, use_dropbox = True, True,  it will write to both, but read from local
     When sync_if_missing_file = True, when one file exists in one location but not the other, it will attempt to sync to the other location.
+    When metadata_cache_size > 0, Dropbox metadata lookups (including "not found" results) are kept in a MetadataCache
+        for metadata_cache_ttl seconds, and listdir() fills the cache with every child of the listed folder.
+    read_many() and prefetch() run reads / downloads on a shared pool of io_workers threads.
+    read_buffer() (or read(zero_copy=True)) returns a memoryview over an mmap of the local file instead of a copy, and
+        readinto() fills a buffer owned by the caller.
+    scandir() and walk() stream OvercloudDirEntry objects (with size, server_modified and content_hash), paging through
+        dropbox listings lazily.
+    makedirs_many(), rename_many() and remove_many() reorganise whole trees with the dropbox batch calls (create_folder_batch,
+        move_batch_v2, delete_batch, polled until done) and parallel local operations.
+    write(use_gzip=True) compresses at gzip_level in blocks of gzip_block_size bytes on gzip_threads threads (pigz-style,
+        see parallel_gzip_compress()); data that is already gzip is written as it is.
+    With gzip_index = True, the gzip files written by write() and open("wb") get a GzipIndex sidecar (rel_path + ".gzindex")
+        with an access point every gzip_index_spacing bytes, so that read_range() decompresses only the part it needs.
+        rename() and remove() (and their _many() versions) take the sidecar along, and listings leave it out.
+    With write_behind = True (local filesystem and dropbox cloud both in use), write() returns once the local copy is fsync-ed,
+        and a WriteBehindQueue uploads it in the background; pending uploads are journaled in write_behind_dir and resumed after
+        a crash. flush() waits for them, close() (or leaving a with-block) also stops the workers.
+    With skip_unchanged = True, write(), write_many() and open("wb") compute the dropbox content_hash of the payload (in the
+        same pass as gzip) and leave the local file and the dropbox file alone when they already hold it, as told by the catalog, the metadata cache or
+        files_get_metadata(). dbx_upload() (so also write-behind, path_isfile() and sync_file() uploads) skips unchanged uploads,
+        and sync_file() unchanged downloads. The skipped files and bytes are counted in stats()["skipped"].
+    Uploads at or above upload_session_threshold bytes go through a Dropbox upload session, sent in chunks of
+        upload_chunk_size bytes with upload_concurrency chunks in flight; a failed chunk is retried upload_chunk_retries times.
+    sync_tree() keeps its list_folder cursors and file snapshots in sync_state_path, so that a later run only
+        fetches the dropbox changes since the last one. The file is shared by every tree and process: it is updated
+        under a flock of sync_state_path + ".lock" and replaced atomically, so concurrent runs keep each other's trees.
+    When use_dropbox = True and local_cache_bytes is set, the local filesystem is not a storage tier but a LocalDiskCache:
+        files read from dropbox are kept under local_prefix up to local_cache_bytes, least recently used files are evicted.
+    All cloud operations go through self.backend, a StorageBackend: by default a DropboxBackend connected with the dropbox token,
+        or the backend given to the constructor, e.g. a DropboxEmulatorBackend for offline tests and benchmarks.
+    Nothing touches the network in the constructor: the dropbox SDK is imported, and the client of each process made, on the
+        first cloud call (again after a fork). Tokens come from dropbox_access_token / dropbox_refresh_token, DBX_TOKEN /
+        DBX_REFRESH_TOKEN, or ./.dropbox_access_token / ./.dropbox_refresh_token; with a refresh token and the app key,
+        expired access tokens are refreshed without a prompt.
+    Every operation is counted and timed per tier in an OperationStats (see stats(), reset_stats() and prometheus_metrics());
+        collect_stats = False turns this off, and stats_log_interval logs a summary line every so many seconds.
+    Cloud calls are limited and retried by a CloudRateController (rate_controller, or one of its own starting at io_workers
+        calls in flight), which backs off on 429 / too_many_write_operations and adapts the number of calls in flight.
+    With catalog_path, a FileCatalog shared by all processes on the node answers path_isfile(), path_isdir() and listdir()
+        inside the trees registered with catalog_track(), polling dropbox for changes every catalog_max_age seconds.
 
     Dropbox python API documentation:
     https://dropbox-sdk-python.readthedocs.io/en/latest/index.html
@@ -56,8 +2732,24 @@ class ManageOvercloud(object):
 
     def __init__(self, use_localfs = True, use_dropbox = False, 
                  local_prefix = "", cloud_prefix = "", 
-                 dropbox_app_key:str, dropbox_app_secret: str,
-                 sync_if_missing_file=False):
+                 dropbox_app_key: str = None, dropbox_app_secret: str = None,
+                 sync_if_missing_file=False,
+                 metadata_cache_size = 0, metadata_cache_ttl = 300,
+                 io_workers = 16,
+                 upload_session_threshold = DBX_SINGLE_UPLOAD_LIMIT, upload_chunk_size = 8 * 1024 * 1024,
+                 upload_concurrency = 4, upload_chunk_retries = 3,
+                 sync_state_path = "./.overcloud_sync_state.json",
+                 local_cache_bytes = None,
+                 backend: StorageBackend = None,
+                 collect_stats = True, stats_log_interval = None,
+                 rate_controller: CloudRateController = None,
+                 catalog_path = None, catalog_max_age = 60,
+                 gzip_level = 9, gzip_block_size = 1024 * 1024, gzip_threads = None,
+                 gzip_index = False, gzip_index_spacing = None,
+                 write_behind = False, write_behind_dir = "./.overcloud_write_behind",
+                 write_behind_max_pending = 1000, write_behind_workers = 4,
+                 dropbox_access_token: str = None, dropbox_refresh_token: str = None,
+                 skip_unchanged = False):
         logger.info(f"LocalCloud init... \n  Use Local HD: {use_localfs}, local_prefix = {local_prefix} ;\n  Dbx Cloud {use_dropbox}, mylc cloud_prefix = {cloud_prefix}.")    
         self.use_localfs  = use_localfs
         self.use_dropbox  = use_dropbox
@@ -66,17 +2758,134 @@ class ManageOvercloud(object):
         self.sync_if_missing_file = sync_if_missing_file
         self.dropbox_app_key = dropbox_app_key
         self.dropbox_app_secret = dropbox_app_secret
+        self.metadata_cache = MetadataCache(metadata_cache_size, metadata_cache_ttl) if metadata_cache_size > 0 else None
+        self.io_workers = io_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.gzip_level = gzip_level
+        self.gzip_block_size = gzip_block_size
+        self.gzip_threads = gzip_threads or os.cpu_count() or 1
+        self._gzip_executor = None
+        self.gzip_index = gzip_index
+        self.gzip_index_spacing = gzip_index_spacing or gzip_block_size
+        self._gzip_indexes = collections.OrderedDict()
+        self._gzip_indexes_lock = threading.Lock()
+        self.upload_session_threshold = min(upload_session_threshold, DBX_SINGLE_UPLOAD_LIMIT)
+        self.upload_chunk_size = max(DBX_SESSION_CHUNK_ALIGNMENT, upload_chunk_size // DBX_SESSION_CHUNK_ALIGNMENT * DBX_SESSION_CHUNK_ALIGNMENT)
+        self.upload_concurrency = upload_concurrency
+        self.upload_chunk_retries = upload_chunk_retries
+        self.sync_state_path = sync_state_path
+        self.skip_unchanged = skip_unchanged
+        self._sync_state_lock = threading.Lock()
+        self._stats = OperationStats(log_interval = stats_log_interval, enabled = collect_stats)
+        self.rate_controller = rate_controller or CloudRateController(initial_concurrency = io_workers)
 
-        if self.use_dropbox:
-            access_token = self.get_existing_dropbox_token()
-            dbx = self.connect_dropbox(access_token)
-            if dbx == None:
-                self.use_dropbox = False; 
+        self.backend = None
+        self.dropbox_access_token = None
+        self.dropbox_refresh_token = None
+        if self.use_dropbox and backend is not None:
+            self.backend = backend
+        elif self.use_dropbox:
+            # No network here: the client is made by the first cloud call of each process (see DropboxBackend)
+            self.dropbox_access_token = self.get_existing_dropbox_token(dropbox_access_token)
+            self.dropbox_refresh_token = self.get_existing_dropbox_refresh_token(dropbox_refresh_token)
+            if self.dropbox_access_token or self.dropbox_refresh_token or (dropbox_app_key and sys.stdin is not None and sys.stdin.isatty()):
+                self.backend = DropboxBackend(connect = self.connect_dropbox)
+            else:
+                logger.critical("No dropbox token found (nor a terminal to authorize the app in); dropbox cloud is turned off.")
+                self.use_dropbox = False
+        if self.backend is not None:
+            self.backend = _RateLimitedBackend(self.backend, self.rate_controller)
+
+        self.catalog = None
+        if catalog_path:
+            if self.use_dropbox:
+                self.catalog = FileCatalog(catalog_path, self.backend, max_age = catalog_max_age)
+            else:
+                logger.error("catalog_path is ignored because dropbox cloud is not available.")
+
+        self.local_cache = None
+        if local_cache_bytes:
+            if self.use_dropbox:
+                if self.sync_if_missing_file:
+                    logger.warning("With local_cache_bytes, the local filesystem is used as a cache only: sync_if_missing_file is turned off.")
+                self.use_localfs = False
+                self.sync_if_missing_file = False
+                self.local_cache = LocalDiskCache(self.local_prefix, local_cache_bytes)
+            else:
+                logger.error("local_cache_bytes is ignored because dropbox cloud is not available.")
+
+        self._write_behind = None
+        if write_behind:
+            if self.use_localfs and self.use_dropbox:
+                self._write_behind = WriteBehindQueue(self._upload_local_copy, write_behind_dir,
+                                                      max_pending = write_behind_max_pending, workers = write_behind_workers)
             else:
-                self.dbx = dbx
+                logger.error("write_behind is ignored because it needs both the local filesystem and dropbox cloud.")
                 
         logger.info(f"Finished init. Dbx Cloud status {self.use_dropbox}")
 
+    def flush(self):
+        """
+        Barrier for write_behind: wait until every queued upload is in dropbox cloud.
+        Returns {rel_path: exception} of the uploads that failed since the last flush() (they are retried on the next start).
+        """
+        if self._write_behind is None:
+            return {}
+        return self._write_behind.flush()
+
+    def close(self):
+        """flush() the write-behind uploads and stop the worker pools; returns the failed uploads like flush()"""
+        failures = {}
+        if self._write_behind is not None:
+            failures = self._write_behind.close()
+            self._write_behind = None
+        with self._executor_lock:
+            for executor in (self._executor, self._gzip_executor):
+                if executor is not None:
+                    executor.shutdown(wait=True)
+            self._executor, self._gzip_executor = None, None
+        return failures
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _upload_local_copy(self, rel_path):
+        """Upload the local file rel_path to dropbox cloud (the work of a write-behind upload)"""
+        local_full_path = self.local_prefix + rel_path
+        cloud_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+        try:
+            file = open(local_full_path, "rb")
+        except FileNotFoundError:
+            logger.warning(f"{local_full_path} was removed before its write-behind upload; skipping it")
+            return
+        with file, self._stats.timer("write_behind", "cloud") as timer:
+            timer.bytes_out = self._payload_size(file)
+            self.dbx_upload(file, cloud_full_path)
+        logger.debug(f"Written file to cloud FS: {cloud_full_path}")
+        if self.catalog is not None:
+            self.catalog.record(cloud_full_path, in_local=True)
+
+    def stats(self):
+        """
+        Counters of every operation since the last reset_stats(), per operation and tier, and cache hits / misses;
+        see OperationStats.snapshot() for the layout. "rate_controller" holds the current limit and retry counts of the cloud calls.
+        mylc.stats()["operations"]["read"]["cloud"]["p99"]
+        """
+        snapshot = self._stats.snapshot()
+        snapshot["rate_controller"] = self.rate_controller.snapshot()
+        return snapshot
+
+    def reset_stats(self):
+        self._stats.reset()
+
+    def prometheus_metrics(self, prefix = "overcloud"):
+        """stats() in the Prometheus text exposition format"""
+        return self._stats.prometheus_text(prefix)
+
     @staticmethod
     def _remove_doubleslash_endslash(rel_path):
         while '//' in rel_path:
@@ -84,6 +2893,71 @@ class ManageOvercloud(object):
         if rel_path.endswith("/"):
             rel_path = rel_path[:len(rel_path)-1]            
         return rel_path        
+
+    def _dbx_get_metadata(self, cloud_full_path, operation = "get_metadata"):
+        """
+        files_get_metadata() that goes through self.metadata_cache when it is enabled.
+        Returns the metadata, or None when there is nothing at the path in dropbox cloud (see _is_lookup_miss()).
+        Any other error is raised to the caller and not cached.
+        The network call is timed as operation on the cloud tier.
+        Inside the trees tracked by self.catalog, the catalog answers instead.
+        """
+        if self.catalog is not None:
+            known, metadata = self.catalog.lookup(cloud_full_path)
+            self._stats.cache_access("catalog", known)
+            if known:
+                return metadata
+        if self.metadata_cache is not None:
+            found, metadata = self.metadata_cache.get(cloud_full_path)
+            self._stats.cache_access("metadata", found)
+            if found:
+                return metadata
+        with self._stats.timer(operation, "cloud"):
+            try:
+                metadata = self.backend.get_metadata(cloud_full_path)
+            except dropbox.exceptions.ApiError as e:
+                if not self._is_lookup_miss(e.error):
+                    raise
+                metadata = None
+        if self.metadata_cache is not None:
+            self.metadata_cache.put(cloud_full_path, metadata)
+        return metadata
+
+    @staticmethod
+    def _is_lookup_miss(error):
+        """Whether a GetMetadataError means there is nothing at the path: not_found, not_folder (a file on the way) or restricted_content"""
+        if not (isinstance(error, dropbox.files.GetMetadataError) and error.is_path()):
+            return False
+        lookup = error.get_path()
+        return lookup.is_not_found() or lookup.is_not_folder() or lookup.is_restricted_content()
+
+    def catalog_track(self, rel_dir):
+        """
+        Catalogue the whole dropbox tree rel_dir in self.catalog (one recursive listing), so that existence checks and
+        listings inside it are answered locally by every process sharing the catalog. Needs catalog_path.
+        mylc.catalog_track("/text/edgar")
+        """
+        if self.catalog is None:
+            logger.error("catalog_track() needs catalog_path and dropbox cloud")
+            return
+        self.catalog.track(self._remove_doubleslash_endslash(self.cloud_prefix + rel_dir))
+
+    def prime_metadata_cache(self, rel_path):
+        """
+        List the dropbox folder rel_path (all pages) and fill the metadata cache with every child,
+        so that later path_isfile() / path_isdir() checks inside that folder need no network call.
+        Returns the list of entries.
+        """
+        cloud_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+        token = self.metadata_cache.listing_token() if self.metadata_cache is not None else None
+        result = self.backend.list_folder(cloud_full_path)
+        entries = list(result.entries)
+        while result.has_more:
+            result = self.backend.list_folder_continue(result.cursor)
+            entries.extend(result.entries)
+        if self.metadata_cache is not None:
+            self.metadata_cache.put_listing(cloud_full_path, entries, since = token)
+        return entries
     
     def makedirs(self, rel_path):
         """Tested on both: DONE
@@ -100,10 +2974,19 @@ class ManageOvercloud(object):
             cloud_full_path = self.cloud_prefix + rel_path    
             cloud_full_path = self._remove_doubleslash_endslash(cloud_full_path)
             try: 
-                self.dbx.files_create_folder_v2(cloud_full_path)
+                metadata = self.backend.create_folder(cloud_full_path)
                 logger.info(f"Make dir in dbx-cloud filesystem: {cloud_full_path}")
+                if self.metadata_cache is not None:
+                    self.metadata_cache.put(cloud_full_path, metadata)
+                if self.catalog is not None:
+                    self.catalog.record(cloud_full_path, metadata)
             except dropbox.exceptions.ApiError as e:
-                logger.error(f"Failed to create directory {cloud_full_path}, {str(e)}")
+                if self._is_folder_conflict(e):
+                    logger.debug(f"Directory exists already in dbx-cloud filesystem: {cloud_full_path}")
+                else:
+                    logger.error(f"Failed to create directory {cloud_full_path}, {str(e)}")
+                if self.metadata_cache is not None:
+                    self.metadata_cache.invalidate(cloud_full_path)
                     
     def rename(self, source, destination):
         """
@@ -111,11 +2994,18 @@ class ManageOvercloud(object):
         destination = "/tmp/d3"
         Tested with dropbox
         """
+        if self._write_behind is not None:
+            self._write_behind.wait([source, destination])  # let their queued uploads land before the cloud copy is moved
+        if self.local_cache is not None:
+            self.local_cache.discard(source, recursive=True)
+            self.local_cache.discard(destination, recursive=True)
+        local_moves, cloud_moves = [], []
         if self.use_localfs:
             if not os.path.exists(self.local_prefix + destination):
                 # Move the file
                 if os.path.exists(self.local_prefix + source):
                     os.rename(self.local_prefix + source, self.local_prefix + destination)
+                    local_moves.append((source, destination))
                     logger.debug("Local Move/Rename successful: {} -> {}".format(self.local_prefix + source, self.local_prefix + destination))
                 else: 
                     logger.warning("Source {} does not exist. Move aborted.".format(self.local_prefix + source))    
@@ -125,18 +3015,33 @@ class ManageOvercloud(object):
             try:
                 full_dest = self._remove_doubleslash_endslash(self.cloud_prefix + destination)                    
                 full_from = self._remove_doubleslash_endslash(self.cloud_prefix + source)
-                self.dbx.files_move(full_from, full_dest)
+                self.backend.move(full_from, full_dest)
+                cloud_moves.append((source, destination))
                 logger.debug("Dbx Cloud Move/Rename successful: {} -> {}".format(full_from, full_dest))
+                if self.metadata_cache is not None:
+                    self.metadata_cache.invalidate(full_from, recursive=True)
+                    self.metadata_cache.put(full_from, None)
+                    self.metadata_cache.invalidate(full_dest, recursive=True)
+                if self.catalog is not None:
+                    self.catalog.move(full_from, full_dest)
             except dropbox.exceptions.ApiError as e:
                 if isinstance(e.error, dropbox.files.RelocationError):
                     logger.warning("A conflict occurred. The destination already exists, or the source does not exist")
                 else:
                     logger.critical("While trying to rename in Dropbox cloud, Undefined Exception occurred " + str(e))       
+                if self.metadata_cache is not None:
+                    self.metadata_cache.invalidate(full_from, recursive=True)
+                    self.metadata_cache.invalidate(full_dest, recursive=True)
+        self._move_gzip_indexes(local_moves, cloud_moves)
 
     def remove(self, rel_path):
+        if self._write_behind is not None:
+            self._write_behind.cancel([rel_path])   # no point uploading what is deleted next
         return_value, local_return_value, dbx_return_value = None, None, None
         local_full_path = self.local_prefix + rel_path
         cloud_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+        if self.local_cache is not None:
+            self.local_cache.discard(rel_path, recursive=True)
         if self.use_localfs:
             try:
                 os.remove(local_full_path)
@@ -148,15 +3053,211 @@ class ManageOvercloud(object):
             local_return_value = True        
         if self.use_dropbox:
             try: 
-                dbx.files_delete_v2(cloud_full_path)
+                self.backend.delete(cloud_full_path)
                 dbx_return_value = True
+                if self.metadata_cache is not None:
+                    self.metadata_cache.invalidate(cloud_full_path, recursive=True)
+                    self.metadata_cache.put(cloud_full_path, None)
+                if self.catalog is not None:
+                    self.catalog.forget(cloud_full_path)
             except dropbox.exceptions.ApiError as e:
                 logger.info(f"Unable to delete file from dropbox filesystem {cloud_full_path} " + str(e))
+                if self.metadata_cache is not None:
+                    self.metadata_cache.invalidate(cloud_full_path, recursive=True)
         else:
             dbx_return_value = True        
+        self._remove_gzip_indexes([rel_path])
         return_value = local_return_value and dbx_return_value        
         return return_value
                                
+    def makedirs_many(self, rel_paths):
+        """
+        makedirs() for many folders at once, e.g. mylc.makedirs_many(["/text/edgar/by-year/2019", "/text/edgar/by-year/2020/Q1"])
+        Paths are deduplicated, and a folder that is the parent of another one in the list is created along with it.
+        Local folders are created in parallel on the worker pool, dropbox folders with files_create_folder_batch (1000 per call).
+        A folder that exists already counts as created.
+        Returns a dict {rel_path: True or the exception of that folder}.
+        """
+        rel_paths = {rel_path: self._remove_doubleslash_endslash(rel_path) for rel_path in rel_paths}
+        ancestors = {}
+        for path in sorted(set(rel_paths.values())):
+            parts = path.split("/")
+            for depth in range(1, len(parts)):
+                ancestors.setdefault("/".join(parts[:depth]), path)
+        leaves = [path for path in sorted(set(rel_paths.values())) if path and path not in ancestors]
+        results = {leaf: True for leaf in leaves}
+        if self.use_localfs:
+            def _makedirs(leaf):
+                os.makedirs(self.local_prefix + leaf, exist_ok=True)
+
+            with self._stats.timer("makedirs_many", "local"):
+                for leaf, outcome in self._map_on_pool(_makedirs, leaves):
+                    if isinstance(outcome, Exception):
+                        logger.error(f"Failed to create local directory {self.local_prefix + leaf}: {outcome!r}")
+                        results[leaf] = outcome
+        if self.use_dropbox:
+            cloud_full_paths = [self._remove_doubleslash_endslash(self.cloud_prefix + leaf) for leaf in leaves]
+            outcomes = self._cloud_batches("makedirs_many", self.backend.create_folder_batch, cloud_full_paths, 1000)
+            for leaf, cloud_full_path, outcome in zip(leaves, cloud_full_paths, outcomes):
+                if isinstance(outcome, Exception):
+                    if self.metadata_cache is not None:
+                        self.metadata_cache.invalidate(cloud_full_path)
+                    if self._is_folder_conflict(outcome):
+                        continue
+                    logger.error(f"Failed to create directory {cloud_full_path}, {outcome!r}")
+                    if results[leaf] is True:
+                        results[leaf] = outcome
+                    continue
+                if self.metadata_cache is not None:
+                    self.metadata_cache.put(cloud_full_path, outcome)
+                if self.catalog is not None:
+                    self.catalog.record(cloud_full_path, outcome)
+        logger.info(f"makedirs_many() created {sum(1 for status in results.values() if status is True)} of {len(leaves)} directories")
+        return {rel_path: results.get(path) if path in results else results.get(ancestors.get(path), True)
+                for rel_path, path in rel_paths.items()}
+
+    def rename_many(self, moves):
+        """
+        rename() for many files or folders at once; moves is a dict {source: destination} or an iterable of (source, destination):
+        mylc.rename_many({"/text/edgar/by-index/2019-QTR1/a.txt.gz": "/text/edgar/by-year/2019/a.txt.gz", ...})
+        The parent folders of all local destinations are created first (each once, parents first), then the local files are
+        renamed in parallel on the worker pool; in dropbox cloud, files_move_batch_v2 moves up to 1000 entries per call.
+        Sources should not be nested in one another (dropbox refuses duplicated or nested paths in a batch).
+        Returns a dict {source: True or the exception of that move}.
+        """
+        moves = list(dict(moves).items())
+        if self._write_behind is not None:
+            self._write_behind.wait([path for move in moves for path in move])
+        results = {source: True for source, _ in moves}
+        local_failed, cloud_failed = set(), set()
+        if self.local_cache is not None:
+            for source, destination in moves:
+                self.local_cache.discard(source, recursive=True)
+                self.local_cache.discard(destination, recursive=True)
+        if self.use_localfs:
+            def _rename(move):
+                source, destination = move
+                if os.path.exists(self.local_prefix + destination):
+                    raise FileExistsError(f"Destination {self.local_prefix + destination} already exists. Move aborted.")
+                if not os.path.exists(self.local_prefix + source):
+                    raise FileNotFoundError(f"Source {self.local_prefix + source} does not exist. Move aborted.")
+                os.rename(self.local_prefix + source, self.local_prefix + destination)
+
+            with self._stats.timer("rename_many", "local"):
+                for parent in sorted({os.path.dirname(self.local_prefix + destination) for _, destination in moves}):
+                    if parent and not os.path.isdir(parent):
+                        os.makedirs(parent, exist_ok=True)
+                for (source, _), outcome in self._map_on_pool(_rename, moves):
+                    if isinstance(outcome, Exception):
+                        logger.warning(f"Local Move/Rename failed: {outcome}")
+                        results[source] = outcome
+                        local_failed.add(source)
+        if self.use_dropbox:
+            cloud_moves = [(self._remove_doubleslash_endslash(self.cloud_prefix + source), self._remove_doubleslash_endslash(self.cloud_prefix + destination))
+                           for source, destination in moves]
+            outcomes = self._cloud_batches("rename_many", self.backend.move_batch, cloud_moves, 1000)
+            for (source, _), (full_from, full_dest), outcome in zip(moves, cloud_moves, outcomes):
+                if self.metadata_cache is not None:
+                    self.metadata_cache.invalidate(full_from, recursive=True)
+                    self.metadata_cache.invalidate(full_dest, recursive=True)
+                if isinstance(outcome, Exception):
+                    logger.warning(f"Dbx Cloud Move/Rename failed: {full_from} -> {full_dest}: {outcome!r}")
+                    cloud_failed.add(source)
+                    if results[source] is True:
+                        results[source] = outcome
+                    continue
+                if self.metadata_cache is not None:
+                    self.metadata_cache.put(full_from, None)
+                if self.catalog is not None:
+                    self.catalog.move(full_from, full_dest)
+        self._move_gzip_indexes([move for move in moves if self.use_localfs and move[0] not in local_failed],
+                                [move for move in moves if self.use_dropbox and move[0] not in cloud_failed])
+        logger.info(f"rename_many() moved {sum(1 for status in results.values() if status is True)} of {len(moves)}")
+        return results
+
+    def remove_many(self, rel_paths):
+        """
+        remove() for many files at once, e.g. mylc.remove_many(["/text/edgar/by-index/2019-QTR1/a.txt.gz", ...])
+        Local files are removed in parallel on the worker pool; in dropbox cloud, files_delete_batch deletes up to 1000
+        paths per call, and paths inside a folder that is deleted as well are left to go with it.
+        Returns a dict {rel_path: True or the exception of that path}.
+        """
+        rel_paths = list(dict.fromkeys(rel_paths))
+        if self._write_behind is not None:
+            self._write_behind.cancel(rel_paths)
+        results = {rel_path: True for rel_path in rel_paths}
+        if self.local_cache is not None:
+            for rel_path in rel_paths:
+                self.local_cache.discard(rel_path, recursive=True)
+        if self.use_localfs:
+            def _remove(rel_path):
+                os.remove(self.local_prefix + rel_path)
+
+            with self._stats.timer("remove_many", "local"):
+                for rel_path, outcome in self._map_on_pool(_remove, rel_paths):
+                    if isinstance(outcome, Exception):
+                        logger.info(f"Unable to delete file from local filesystem {self.local_prefix + rel_path} {outcome}")
+                        results[rel_path] = outcome
+        if self.use_dropbox:
+            cloud_full_paths = {rel_path: self._remove_doubleslash_endslash(self.cloud_prefix + rel_path) for rel_path in rel_paths}
+            deleted = set(cloud_full_paths.values())
+            nested = {rel_path for rel_path, path in cloud_full_paths.items()
+                      if any("/".join(path.split("/")[:depth]) in deleted for depth in range(1, path.count("/") + 1))}
+            todo = [rel_path for rel_path in rel_paths if rel_path not in nested]
+            outcomes = self._cloud_batches("remove_many", self.backend.delete_batch, [cloud_full_paths[rel_path] for rel_path in todo], 1000)
+            for rel_path, outcome in zip(todo, outcomes):
+                cloud_full_path = cloud_full_paths[rel_path]
+                if self.metadata_cache is not None:
+                    self.metadata_cache.invalidate(cloud_full_path, recursive=True)
+                if isinstance(outcome, Exception):
+                    logger.info(f"Unable to delete file from dropbox filesystem {cloud_full_path} {outcome!r}")
+                    if results[rel_path] is True:
+                        results[rel_path] = outcome
+                    continue
+                if self.metadata_cache is not None:
+                    self.metadata_cache.put(cloud_full_path, None)
+                if self.catalog is not None:
+                    self.catalog.forget(cloud_full_path)
+        self._remove_gzip_indexes(rel_paths)
+        logger.info(f"remove_many() removed {sum(1 for status in results.values() if status is True)} of {len(rel_paths)}")
+        return results
+
+    def _cloud_batches(self, operation, call, entries, batch_size):
+        """
+        call(batch) on consecutive batches of at most batch_size entries; returns one result (metadata or exception) per entry.
+        Entries refused with a rate limit (too_many_write_operations) are sent again in a batch of their own, after the
+        rate controller's backoff, up to its max_retries times. A batch call that fails as a whole fails all of its entries.
+        """
+        results = [None] * len(entries)
+        for begin in range(0, len(entries), batch_size):
+            todo = list(range(begin, min(begin + batch_size, len(entries))))
+            for attempt in range(self.rate_controller.max_retries + 1):
+                with self._stats.timer(operation, "cloud"):
+                    try:
+                        outcomes = call([entries[i] for i in todo])
+                    except Exception as e:
+                        logger.error(f"{operation}: batch of {len(todo)} failed: {e!r}")
+                        outcomes = [e] * len(todo)
+                retry = []
+                for i, outcome in zip(todo, outcomes):
+                    results[i] = outcome
+                    if isinstance(outcome, Exception) and self.rate_controller.classify(outcome) == "rate_limit":
+                        retry.append(i)
+                if not retry or attempt == self.rate_controller.max_retries:
+                    break
+                logger.info(f"{operation}: {len(retry)} of {len(todo)} entries were rate limited; retrying them")
+                time.sleep(self.rate_controller.retry_delay(results[retry[0]], "rate_limit", attempt))
+                todo = retry
+        return results
+
+    @staticmethod
+    def _is_folder_conflict(e):
+        """True if e is the ApiError of creating a folder that exists already"""
+        error = getattr(e, "error", None)
+        while error is not None and not (getattr(error, "is_conflict", None) and error.is_conflict()):
+            error = error.get_path() if getattr(error, "is_path", None) and error.is_path() else None
+        return error is not None and error.get_conflict().is_folder()
+
     def listdir(self, rel_path):
         """
         Syncing if missing file is not implemented for ManageOvercloud.listdir(); but the returned list is the subset of files that exist on both locations
@@ -165,14 +3266,14 @@ class ManageOvercloud(object):
         local_full_path = self.local_prefix + rel_path
         cloud_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
         if self.use_localfs:
-            local_return_value = os.listdir(local_full_path)
+            with self._stats.timer("listdir", "local"):
+                local_return_value = [name for name in os.listdir(local_full_path) if not name.endswith(GZIP_INDEX_SUFFIX)]
         if self.sync_if_missing_file or not local_return_value:  
             if self.use_dropbox:  
                 try:
-                    result = dbx.files_list_folder(cloud_full_path)
-                    dbx_return_value = [entry.name for entry in result.entries]                
+                    dbx_return_value = [entry.name for entry in self._iter_cloud_listing(cloud_full_path)]
                 except Exception as e:
-                    logging.critical("Error listing dropbox folder {cloud_full_path}")    
+                    logger.critical(f"Error listing dropbox folder {cloud_full_path}: {e!r}")
         if self.sync_if_missing_file:
             logger.debug("Syncing if missing file is not implemented for ManageOvercloud.listdir(); but the returned list is the subset of files that exist on both locations")
             return_value = [folder for folder in local_return_value if folder in dbx_return_value]
@@ -180,6 +3281,122 @@ class ManageOvercloud(object):
             return_value = local_return_value or dbx_return_value
         return return_value
                         
+    def scandir(self, rel_path):
+        """
+        Generator of an OvercloudDirEntry (name, path, is_file(), is_dir(), size, server_modified, content_hash) for every child
+        of the folder rel_path, like os.scandir(), so no metadata call per entry is needed:
+        for entry in mylc.scandir("/text/edgar/by-cik/320193"):
+            if entry.is_file() and entry.size > 0: ...
+        Dropbox folders are listed page by page (list_folder, then list_folder_continue while has_more), each page only when
+        the previous one has been consumed, so the first entries arrive at once and memory stays flat for huge folders.
+        Like listdir(): with both tiers the local folder is used when it has entries, else the dropbox one; with
+        sync_if_missing_file = True only the entries present in both are yielded (with the details from both).
+        Raises like os.scandir() for a missing local-only folder, and the dropbox ApiError for a missing cloud folder.
+        """
+        rel_path = self._remove_doubleslash_endslash(rel_path)
+        cloud_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+        if not self.use_dropbox:
+            yield from self._scan_local(rel_path)
+            return
+        local_entries = self._scan_local(rel_path, missing_ok=True) if self.use_localfs else iter(())
+        if self.sync_if_missing_file and self.use_localfs:
+            local = {entry.name: entry for entry in local_entries}
+            for metadata in self._iter_cloud_listing(cloud_full_path):
+                entry = local.get(metadata.name)
+                if entry is not None:
+                    yield OvercloudDirEntry.from_metadata(entry.path, metadata, in_local=True)
+            return
+        found_local = False
+        for entry in local_entries:
+            found_local = True
+            yield entry
+        if not found_local:
+            for metadata in self._iter_cloud_listing(cloud_full_path):
+                yield OvercloudDirEntry.from_metadata(rel_path + "/" + metadata.name, metadata)
+
+    def walk(self, rel_top):
+        """
+        Generator of an OvercloudDirEntry for everything below the folder rel_top, each folder before its content:
+        for entry in mylc.walk("/text/edgar/by-index"):
+            if entry.is_file(): print(entry.path, entry.size)
+        Folders are read with scandir(), so tiers are merged the same way. With dropbox alone (and no catalog), the whole
+        tree comes from one recursive list_folder, streamed page by page; as dropbox does not promise any order there,
+        an entry listed before its folder is held back until the folder has been yielded.
+        """
+        rel_top = self._remove_doubleslash_endslash(rel_top)
+        if self.use_dropbox and not self.use_localfs and self.catalog is None:
+            cloud_top = self._remove_doubleslash_endslash(self.cloud_prefix + rel_top)
+            yielded = {cloud_top.lower()}          # lower-cased paths of the folders yielded so far
+            waiting = collections.defaultdict(list)  # lower-cased folder path -> metadata of its entries listed before it
+            for metadata in self._iter_cloud_listing(cloud_top, recursive=True):
+                path_lower = metadata.path_display.lower()
+                if len(path_lower) <= len(cloud_top):
+                    continue
+                parent = path_lower.rsplit("/", 1)[0]
+                if parent not in yielded:
+                    waiting[parent].append(metadata)
+                    continue
+                ready = [metadata]
+                while ready:
+                    metadata = ready.pop()
+                    yield OvercloudDirEntry.from_metadata(rel_top + metadata.path_display[len(cloud_top):], metadata)
+                    if isinstance(metadata, dropbox.files.FolderMetadata):
+                        path_lower = metadata.path_display.lower()
+                        yielded.add(path_lower)
+                        ready.extend(reversed(waiting.pop(path_lower, [])))
+            for metadata in sorted(itertools.chain.from_iterable(waiting.values()), key=lambda metadata: metadata.path_display.count("/")):
+                logger.warning(f"walk() found {metadata.path_display} without its folder in the listing of {cloud_top}")
+                yield OvercloudDirEntry.from_metadata(rel_top + metadata.path_display[len(cloud_top):], metadata)
+            return
+        pending = [rel_top]
+        while pending:
+            subdirs = []
+            for entry in self.scandir(pending.pop()):
+                yield entry
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+            pending.extend(reversed(subdirs))
+
+    def _scan_local(self, rel_path, missing_ok = False):
+        """OvercloudDirEntry of the children of the local folder rel_path"""
+        try:
+            iterator = os.scandir(self.local_prefix + rel_path)
+        except FileNotFoundError:
+            if missing_ok:
+                return
+            raise
+        with iterator:
+            for entry in iterator:
+                if not entry.name.endswith(GZIP_INDEX_SUFFIX):
+                    yield OvercloudDirEntry.from_os(rel_path + "/" + entry.name, entry)
+
+    def _iter_cloud_listing(self, cloud_full_path, recursive = False):
+        """
+        Metadata of the children of the dropbox folder cloud_full_path (of everything below it if recursive), from the
+        catalog when it knows the folder, else fetched one page at a time as the caller consumes them.
+        The gzip index sidecars are left out (they are still cached, as they are looked up).
+        """
+        if self.catalog is not None and not recursive:
+            known, entries = self.catalog.children(cloud_full_path)
+            if known:
+                yield from (entry for entry in entries if not entry.name.endswith(GZIP_INDEX_SUFFIX))
+                return
+        token = self.metadata_cache.listing_token() if self.metadata_cache is not None else None
+        with self._stats.timer("listdir", "cloud"):
+            result = self.backend.list_folder(cloud_full_path, recursive=recursive)
+        while True:
+            if self.metadata_cache is not None and not recursive:
+                self.metadata_cache.put_listing(cloud_full_path, result.entries, complete = False, since = token)
+            for entry in result.entries:
+                if not isinstance(entry, dropbox.files.DeletedMetadata) and not entry.name.endswith(GZIP_INDEX_SUFFIX):
+                    yield entry
+            if not result.has_more:
+                break
+            with self._stats.timer("listdir", "cloud"):
+                result = self.backend.list_folder_continue(result.cursor)
+        if self.metadata_cache is not None and not recursive:
+            self.metadata_cache.put_listing(cloud_full_path, [], complete = True, since = token)
+
     def path_exists(self, rel_path ):
         """
         DEPRECIATED. 
@@ -200,7 +3417,7 @@ class ManageOvercloud(object):
             if self.use_dropbox:
                 cloud_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
                 try:
-                    dbx_return_value = self.dbx.files_get_metadata(cloud_full_path)
+                    dbx_return_value = self.backend.get_metadata(cloud_full_path)
                     logger.debug(f"Dbx Cloud path {cloud_full_path} exists.")
                     return_value = return_value or bool(dbx_return_value)
                 except dropbox.exceptions.ApiError as e:
@@ -221,27 +3438,41 @@ class ManageOvercloud(object):
         local_full_path=self.local_prefix + rel_path
         cloud_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
         if self.use_localfs:
-            local_return_value =  os.path.isfile(self.local_prefix + rel_path)
+            with self._stats.timer("path_isfile", "local"):
+                local_return_value =  os.path.isfile(self.local_prefix + rel_path)
             logger.debug(f"Local path_isfile {local_full_path} result: {local_return_value}")
         if self.sync_if_missing_file or not local_return_value:
             if self.use_dropbox:
+                lookup_failed = False
                 try:
-                    metadata = self.dbx.files_get_metadata(cloud_full_path, include_media_info=True)
+                    try:
+                        metadata = self._dbx_get_metadata(cloud_full_path, "path_isfile")
+                    except dropbox.exceptions.ApiError as e:
+                        # dropbox did answer (e.g. malformed_path): no file there, but nothing to sync it with either
+                        logger.error(f"Dbx Cloud path_isfile checking FAILED: {cloud_full_path} {e!r}")
+                        metadata, lookup_failed = None, True
                     if  isinstance(metadata, dropbox.files.FileMetadata):
                         dbx_return_value = True
                         logger.debug(f"Dbx Cloud path_isfile exists: {cloud_full_path}")
                         if self.sync_if_missing_file and not local_return_value:
                             # Need to download from Dropbox to local
                             logger.debug(f"""Local file {local_full_path} not existing, but found in dropbox {cloud_full_path}. With --sync-if-missing-file, Start Downloading.""")
-                            self.dbx_download(cloud_full_path, local_full_path)
+                            with self._stats.timer("sync", "cloud") as timer:
+                                timer.bytes_in = len(self.dbx_download(cloud_full_path, local_full_path))
+                            if self.catalog is not None:
+                                self.catalog.record(cloud_full_path, in_local=True)
                             logger.info(f"""Local file {local_full_path} not existing, but found in dropbox {cloud_full_path}. With --sync-if-missing-file, Finished Downloading.""")
+                    elif metadata is None:
+                        logger.debug(f"Dbx Cloud path_isfile not found: {cloud_full_path}")
                     elif isinstance(metadata, dropbox.files.FolderMetadata):
                         logger.info(f"Dbx Cloud path_isfile checking: {cloud_full_path} may exist but is a folder")    
                     else:
                         logger.info(f"Dbx Cloud path_isfile checking: {cloud_full_path} may exist but not a file")    
-                except:
-                    logger.debug(f"Dbx Cloud path_isfile checking FAILED: {cloud_full_path} ")    
-                if self.sync_if_missing_file and self.use_localfs and not dbx_return_value:
+                except Exception as e:
+                    # Not knowing (a transport error) is not "not found": syncing on it would re-upload files that are there
+                    logger.error(f"Dbx Cloud path_isfile checking FAILED: {cloud_full_path} {e!r}")    
+                    raise
+                if self.sync_if_missing_file and self.use_localfs and not dbx_return_value and not lookup_failed:
                     # Need to Upload from local to dropbox.
                     logger.debug(f"""Local file {local_full_path}  existing, but not found in dropbox {cloud_full_path}. With --sync-if-missing-file, Start Reading local file.""")
                     cloud_parent_folder = os.path.join(*rel_path.split("/")[:-1])
@@ -250,9 +3481,10 @@ class ManageOvercloud(object):
                     if local_return_value: 
                         # if local file exist but not in cloud, read local and upload to dropbox    
                         with open(local_full_path, "rb") as f:
-                            bytes_data = f.read()
                             logger.debug(f"""Local file {local_full_path}  existing, but not found in dropbox {cloud_full_path}. With --sync-if-missing-file, Start Uploading local file.""")
-                            self.dbx_upload(bytes_data, cloud_full_path)
+                            with self._stats.timer("sync", "cloud") as timer:
+                                timer.bytes_out = self._payload_size(f)
+                                self.dbx_upload(f, cloud_full_path)
                             logger.info(f"""Local file {local_full_path}  existing, but not found in dropbox {cloud_full_path}. With --sync-if-missing-file, Finished Uploading local file.""")
         if self.sync_if_missing_file:    
             return_value = local_return_value and dbx_return_value
@@ -266,7 +3498,8 @@ class ManageOvercloud(object):
         return_value, local_return_value, dbx_return_value = False, False, False
         if self.use_localfs:
             local_full_path= self.local_prefix + rel_path
-            local_return_value = os.path.isdir(local_full_path)
+            with self._stats.timer("path_isdir", "local"):
+                local_return_value = os.path.isdir(local_full_path)
             logger.debug(f"Local path_isdir {local_full_path} result: {local_return_value}")
         if check_both or self.sync_if_missing_file or not local_return_value:      
             if self.use_dropbox :
@@ -274,57 +3507,178 @@ class ManageOvercloud(object):
                 try:
                     #dbx_return_value = dbx.files_list_folder(cloud_full_path)
                     dbx_return_value = False
-                    metadata = self.dbx.files_get_metadata(cloud_full_path, include_media_info=True)
+                    metadata = self._dbx_get_metadata(cloud_full_path, "path_isdir")
                     if isinstance(metadata, dropbox.files.FolderMetadata):
                         logger.debug(f"Dbx Cloud path_isdir dbx-cloud result: {cloud_full_path}")
                         dbx_return_value = True
-                except:
-                    logger.debug(f"Dbx Cloud path_dir checking FAILED: {cloud_full_path} ")    
+                except dropbox.exceptions.ApiError as e:
+                    logger.error(f"Dbx Cloud path_isdir checking FAILED: {cloud_full_path} {e!r}")
+                except Exception as e:
+                    logger.error(f"Dbx Cloud path_isdir checking FAILED: {cloud_full_path} {e!r}")    
+                    raise
         if check_both or self.sync_if_missing_file:
             return_value = local_return_value and bool(dbx_return_value)
         else:    
             return_value = local_return_value or bool(dbx_return_value)
         return return_value
     
-    def dbx_upload(self, f: bytes, dbx_full_path):
+    def dbx_upload(self, f: Union[bytes, BinaryIO], dbx_full_path, content_hash = None):
+        """
+        Upload f (bytes, or a binary file object opened for reading) to dropbox cloud, overwriting dbx_full_path.
+        Files of upload_session_threshold bytes or more are sent in chunks through an upload session,
+        so a file object is never read into memory as a whole.
+        With skip_unchanged = True, nothing is uploaded when dbx_full_path already holds the same content;
+        content_hash is the dropbox content_hash of f if the caller knows it, otherwise it is computed when the sizes match.
+        Returns the FileMetadata of the uploaded (or unchanged) file.
+        """
         while '//' in dbx_full_path:
             dbx_full_path = dbx_full_path.replace('//', '/')
         dbx_full_path = self._remove_doubleslash_endslash(dbx_full_path)
-        use_dropbox = False
         if self.use_dropbox:
-            use_dropbox = True
-        elif "dbx" in globals():
-            use_dropbox = True
-        if use_dropbox:
-            if len(f)< 150_000_000:
-                self.dbx.files_upload(f, dbx_full_path, dropbox.files.WriteMode.overwrite)
-            else: 
-                logger.critical(f"Cannot upload to dropbox with size bigger than 150M: {dbx_full_path}") 
+            size = self._payload_size(f)
+            if self.skip_unchanged:
+                metadata = self._cloud_unchanged(f, size, dbx_full_path, content_hash)
+                if metadata is not None:
+                    return metadata
+            with self._stats.timer("dbx_upload", "cloud") as timer:
+                if size < self.upload_session_threshold:
+                    data = f if isinstance(f, bytes) else bytes(f) if isinstance(f, (bytearray, memoryview)) else f.read()
+                    metadata = self.backend.upload(data, dbx_full_path)
+                else: 
+                    logger.info(f"Uploading {size} bytes to dropbox through an upload session: {dbx_full_path}")
+                    metadata = self._dbx_upload_session(f, size, dbx_full_path)
+                timer.bytes_out = size
+            if self.metadata_cache is not None:
+                self.metadata_cache.put(dbx_full_path, metadata)
+            if self.catalog is not None:
+                self.catalog.record(dbx_full_path, metadata)
+            return metadata
         else:
             logger.critical(f"use_dropbox = False but called dbx_upload() for file {dbx_full_path}")    
 
+    def _cloud_unchanged(self, f, size, dbx_full_path, content_hash = None):
+        """
+        FileMetadata of dbx_full_path if it already holds the size bytes of f with the same dropbox content_hash, otherwise None.
+        The metadata comes from the catalog or the metadata cache when they know the path; f is only hashed (and then
+        rewound) when content_hash is not given and the sizes match. Not knowing counts as changed.
+        """
+        try:
+            metadata = self._dbx_get_metadata(dbx_full_path, "skip_unchanged")
+        except Exception as e:
+            logger.warning(f"Could not check whether {dbx_full_path} is unchanged, uploading it: {e!r}")
+            return None
+        if not isinstance(metadata, dropbox.files.FileMetadata) or metadata.size != size:
+            return None
+        if content_hash is None:
+            if isinstance(f, (bytes, bytearray, memoryview)):
+                content_hash = dropbox_content_hash(f)
+            else:
+                try:
+                    position = f.tell()
+                    content_hash = dropbox_content_hash(f)
+                    f.seek(position)
+                except (AttributeError, OSError, ValueError):
+                    return None
+        if metadata.content_hash != content_hash:
+            return None
+        self._stats.skipped("cloud", size)
+        logger.debug(f"Dropbox file is unchanged, not uploading it: {dbx_full_path}")
+        return metadata
+
+    @staticmethod
+    def _local_unchanged(local_full_path, size, content_hash):
+        """Whether the local file local_full_path holds size bytes with this dropbox content_hash (read only when the size matches)"""
+        try:
+            if os.path.getsize(local_full_path) != size:
+                return False
+            with open(local_full_path, "rb") as file:
+                return dropbox_content_hash(file) == content_hash
+        except OSError:
+            return False
+
+    @staticmethod
+    def _payload_size(f):
+        """Number of bytes left to upload in f, which is either bytes-like or a binary file object"""
+        if isinstance(f, (bytes, bytearray, memoryview)):
+            return memoryview(f).nbytes
+        position = f.tell()
+        try:
+            return os.fstat(f.fileno()).st_size - position
+        except (AttributeError, OSError, ValueError):
+            size = f.seek(0, os.SEEK_END) - position
+            f.seek(position)
+            return size
+
+    def _dbx_upload_session(self, f, size, dbx_full_path):
+        """
+        Upload size bytes from f to dbx_full_path through a concurrent upload session (see _DbxUploadSession).
+        Only upload_chunk_size * upload_concurrency bytes are held in memory when f is a file object.
+        Returns the FileMetadata of the committed file.
+        """
+        chunk_size = self.upload_chunk_size
+        view = memoryview(f).cast("B") if isinstance(f, (bytes, bytearray, memoryview)) else None
+        session = _DbxUploadSession(self)
+        try:
+            offset = 0
+            while offset < size:
+                chunk = bytes(view[offset:offset + chunk_size]) if view is not None else f.read(min(chunk_size, size - offset))
+                if not chunk:
+                    raise IOError(f"Source of {dbx_full_path} ended at {offset} of {size} bytes")
+                session.append(chunk, close = offset + len(chunk) >= size)
+                offset += len(chunk)
+            metadata = session.finish(dbx_full_path)
+        except BaseException:
+            session.abort()
+            raise
+        logger.info(f"Finished upload session of {size} bytes in {session.chunks} chunks: {dbx_full_path}")
+        return metadata
+
+    def _dbx_upload_session_append(self, session_id, chunk: bytes, offset, close = False):
+        """
+        Append one chunk to an upload session, retrying it up to upload_chunk_retries times on the errors that
+        the rate controller deems retryable, with its backoff. Only this chunk is resent on failure, never the whole file.
+        """
+        for attempt in range(self.upload_chunk_retries + 1):
+            try:
+                self.rate_controller.run(self.backend.wrapped.upload_session_append, (session_id, offset, chunk), {"close": close}, max_retries=0)
+                return
+            except Exception as e:
+                if attempt > 0 and isinstance(e, dropbox.exceptions.ApiError) and isinstance(e.error, dropbox.files.UploadSessionAppendError) and (
+                        e.error.is_incorrect_offset() or e.error.is_concurrent_session_invalid_offset()):
+                    # An earlier attempt reached dropbox even though its response got lost
+                    logger.debug(f"Upload session chunk at offset {offset} was already appended")
+                    return
+                kind = self.rate_controller.classify(e)
+                if attempt >= self.upload_chunk_retries or kind is None:
+                    raise
+                delay = self.rate_controller.retry_delay(e, kind, attempt)
+            logger.warning(f"Upload session chunk at offset {offset} failed; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
     def dbx_download(self, dbx_full_path, local_full_path = None):
         """
         read a file from dropbox cloud, and return it as bytes value, 
         if provided local_full_path, then saved as local file
         """
         dbx_full_path = self._remove_doubleslash_endslash(dbx_full_path)    
-        use_dropbox = False
+        data = bytes()
         if self.use_dropbox:
-            use_dropbox = True
-        elif "dbx" in globals():
-            use_dropbox = True
-        if use_dropbox:
             try:
-                md, res = self.dbx.files_download(dbx_full_path)
-                data = res.content
+                with self._stats.timer("dbx_download", "cloud") as timer:
+                    md, res = self.backend.download(dbx_full_path)
+                    try:
+                        data = res.content
+                    finally:
+                        res.close()
+                    timer.bytes_in = len(data)
                 logger.info(f"Read from dropbox cloud file {dbx_full_path}")
                 if local_full_path:
                     with open(local_full_path, "wb") as file:
                         file.write(data)
                         logger.info(f"Save to local file {local_full_path}")
             except dropbox.exceptions.HttpError as err:
-                logger.critical('***  dbx_download HTTP error', err)
+                logger.critical(f'***  dbx_download HTTP error {err}')
+                raise
         else:
             logger.critical("use_dropbox = False but called dbx_download()")    
         return data
@@ -332,55 +3686,213 @@ class ManageOvercloud(object):
     def write(self, data: Union[bytes, str], rel_path, use_gzip=False):
         """
         write(...) allows writing to both local storage and dropbox cloud;
-        but writing to dropbox cloud only when file size less than 150M
+        files of upload_session_threshold bytes or more are uploaded to dropbox cloud in chunks through an upload session
+        With skip_unchanged = True, a copy that already holds the same content is not written again.
         If not written to local nor dropbox cloud, raise an exception
         """
         upload_success = False
-        if isinstance(data, str):
-            data=data.encode(encoding="utf-8")
-        if use_gzip:
-            data_gzipped = gzip.compress(data) 
-            if not rel_path.endswith("gz"):
-                rel_path = "%s.gz" % rel_path
-        else: 
-            data_gzipped = data
+        hasher = _ContentHasher() if self.skip_unchanged else None
+        data_gzipped, rel_path, index = self._prepare_payload(data, rel_path, use_gzip, hasher)
+        content_hash = hasher.hexdigest() if hasher is not None else None
         if self.use_localfs:
             local_full_path = self.local_prefix + rel_path
-            with open(local_full_path, 'wb') as file:
-                file.write(data_gzipped)
-                logger.debug(f"Written file to local FS: {local_full_path}")
+            if content_hash is not None and self._local_unchanged(local_full_path, len(data_gzipped), content_hash):
+                self._stats.skipped("local", len(data_gzipped))
+                logger.debug(f"Local file is unchanged, not rewriting it: {local_full_path}")
+            else:
+                with self._stats.timer("write", "local") as timer:
+                    if self._write_behind is None:
+                        with open(local_full_path, 'wb') as file:
+                            file.write(data_gzipped)
+                    else:
+                        # The local copy is the source of the upload, so it must survive a crash
+                        with open(local_full_path + ".part", 'wb') as file:
+                            file.write(data_gzipped)
+                            file.flush()
+                            os.fsync(file.fileno())
+                        os.replace(local_full_path + ".part", local_full_path)
+                    timer.bytes_out = len(data_gzipped)
+                    logger.debug(f"Written file to local FS: {local_full_path}")
             upload_success = True    
-        if self.use_dropbox:
-            if len(data_gzipped) < 150_000_000:
-                cloud_full_path = self._remove_doubleslash_endslash (self.cloud_prefix + rel_path)
-                self.dbx_upload(data_gzipped, cloud_full_path) # will add self.cloud_prefix +  at dbx_upload
-                logger.debug(f"Written file to cloud FS: {cloud_full_path}")
-                upload_success = True
-            if len(data_gzipped) >= 150_000_000:    
-                logger.critical("File size over 150M, cannot write to Dropbox {self.cloud_prefix}{rel_path}")
+        if self._write_behind is not None:
+            self._write_behind.submit(rel_path)
+        elif self.use_dropbox:
+            cloud_full_path = self._remove_doubleslash_endslash (self.cloud_prefix + rel_path)
+            with self._stats.timer("write", "cloud") as timer:
+                self.dbx_upload(data_gzipped, cloud_full_path, content_hash) # will add self.cloud_prefix +  at dbx_upload
+                timer.bytes_out = len(data_gzipped)
+            logger.debug(f"Written file to cloud FS: {cloud_full_path}")
+            upload_success = True
+            if self.local_cache is not None:
+                self.local_cache.store(rel_path, data_gzipped)
+            if self.catalog is not None and self.use_localfs:
+                self.catalog.record(cloud_full_path, in_local=True)
         if not upload_success:
             logger.critical(f"use_localfs = False; Neither can write to dropbox {rel_path}")
+        else:
+            self._save_gzip_index(rel_path, index)
+
+    def _prepare_payload(self, data: Union[bytes, str], rel_path, use_gzip=False, hasher = None):
+        """
+        Encode str data as utf-8 and gzip it if asked (unless it is gzip already);
+        returns (payload, rel_path with ".gz" appended when gzipped, GzipIndex of the payload or None).
+        Given a _ContentHasher, it is fed the payload (while it is compressed, for gzip).
+        """
+        index = None
+        if isinstance(data, str):
+            data=data.encode(encoding="utf-8")
+        if use_gzip and is_gzip(data):
+            logger.debug(f"Data for {rel_path} is gzip already; not compressing it again")
+            if not rel_path.endswith("gz"):
+                rel_path = "%s.gz" % rel_path
+        elif use_gzip:
+            index = GzipIndex(self.gzip_index_spacing) if self.gzip_index else None
+            with self._stats.timer("gzip_compress", "cpu") as timer:
+                timer.bytes_in = len(data)
+                data = parallel_gzip_compress(data, self.gzip_level, self.gzip_block_size, self._get_gzip_executor(), index, hasher)
+                timer.bytes_out = len(data)
+            if not rel_path.endswith("gz"):
+                rel_path = "%s.gz" % rel_path
+            return data, rel_path, index
+        if hasher is not None:
+            hasher.update(data)
+        return data, rel_path, index
+
+    def write_many(self, items, use_gzip=False, batch_size=1000):
+        """
+        Write many (small) files at once, with the same semantics as write().
+        items is a dict {rel_path: data} or an iterable of (rel_path, data) pairs.
+
+        Payloads are prepared (and gzipped) and written to the local filesystem in parallel on the worker pool.
+        For dropbox cloud, each payload is staged in its own upload session, and up to batch_size (at most 1000)
+        staged files are committed together with one files_upload_session_finish_batch_v2 call, which returns
+        the per-file results directly. Files of upload_session_threshold bytes or more are uploaded on their own.
+        With skip_unchanged = True, files whose copies already hold the same content are not written again.
+        Returns a dict {rel_path: True or the exception of that file}.
+        """
+        if isinstance(items, dict):
+            items = items.items()
+        batch_size = max(1, min(batch_size, 1000))
+        results = {}
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                results.update(self._write_batch(batch, use_gzip))
+                batch = []
+        if batch:
+            results.update(self._write_batch(batch, use_gzip))
+        failures = sum(1 for status in results.values() if status is not True)
+        logger.info(f"write_many() wrote {len(results) - failures} files, {failures} failed")
+        return results
+
+    def _write_batch(self, batch, use_gzip):
+        indexes = {}        # rel_path given -> (rel_path written, GzipIndex or None)
 
-    def read(self, rel_path, read_mode = "rb", use_gzip=False):
+        def _stage(item):
+            rel_path, data = item
+            hasher = _ContentHasher() if self.skip_unchanged else None
+            payload, gz_path, index = self._prepare_payload(data, rel_path, use_gzip, hasher)
+            content_hash = hasher.hexdigest() if hasher is not None else None
+            indexes[rel_path] = (gz_path, index)
+            rel_path = gz_path
+            if self.local_cache is not None:
+                self.local_cache.discard(rel_path)
+            if self.use_localfs:
+                local_full_path = self.local_prefix + rel_path
+                if content_hash is not None and self._local_unchanged(local_full_path, len(payload), content_hash):
+                    self._stats.skipped("local", len(payload))
+                    logger.debug(f"Local file is unchanged, not rewriting it: {local_full_path}")
+                else:
+                    with self._stats.timer("write", "local") as timer, open(local_full_path, 'wb') as file:
+                        file.write(payload)
+                        timer.bytes_out = len(payload)
+            if not self.use_dropbox:
+                return None
+            cloud_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+            if len(payload) >= self.upload_session_threshold:
+                with self._stats.timer("write", "cloud") as timer:
+                    self.dbx_upload(payload, cloud_full_path, content_hash)     # skips an unchanged file itself
+                    timer.bytes_out = len(payload)
+                return None
+            if content_hash is not None and self._cloud_unchanged(payload, len(payload), cloud_full_path, content_hash) is not None:
+                return None
+            with self._stats.timer("write", "cloud") as timer:
+                timer.bytes_out = len(payload)
+                session_id = self.backend.upload_session_start(payload, close=True)
+            return (session_id, len(payload), cloud_full_path)
+
+        results, staged = {}, []
+        for (rel_path, _), outcome in self._map_on_pool(_stage, batch, ordered=True):
+            if isinstance(outcome, Exception):
+                results[rel_path] = outcome
+            elif outcome is None:
+                results[rel_path] = True
+            else:
+                staged.append((rel_path, outcome))
+        if not (self.use_localfs or self.use_dropbox):
+            logger.critical("use_localfs and use_dropbox are both False; write_many() wrote nothing")
+        if staged:
+            try:
+                with self._stats.timer("write_commit_batch", "cloud"):
+                    finished = self.backend.upload_session_finish_batch([entry for _, entry in staged])
+            except Exception as e:
+                logger.error(f"Batch commit of {len(staged)} upload sessions failed: {e!r}")
+                finished = [e] * len(staged)
+            for (rel_path, (_, _, cloud_full_path)), result in zip(staged, finished):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to commit {cloud_full_path} to dropbox: {result!r}")
+                    results[rel_path] = result
+                else:
+                    results[rel_path] = True
+                    if self.metadata_cache is not None:
+                        self.metadata_cache.put(cloud_full_path, result)
+                    if self.catalog is not None:
+                        self.catalog.record(cloud_full_path, result, in_local=self.use_localfs or None)
+        self._save_gzip_indexes(dict(entry for rel_path, entry in indexes.items() if results.get(rel_path) is True))
+        return results
+
+    def read(self, rel_path, read_mode = "rb", use_gzip=False, zero_copy=False):
         """
         write(...)  allows writing to both local storage and dropbox cloud
         but  read() will try reading from local first if allowed; otherwise if allowed read from dropbox
+        With zero_copy = True, "rb" returns a read-only memoryview from read_buffer() instead of bytes; gzip data is
+        decompressed, and text decoded, straight from that buffer.
         self = mylc
         rel_path = "/tmp/var1.txt.gz"
         """
+        if zero_copy:
+            buffer = self.read_buffer(rel_path)
+            if use_gzip:
+                with self._stats.timer("gzip_decompress", "cpu") as timer:
+                    timer.bytes_in = buffer.nbytes
+                    buffer = gzip.decompress(buffer)
+                    timer.bytes_out = len(buffer)
+            return buffer if read_mode == "rb" else str(buffer, "utf-8")
         return_value = bytes()
         bytes_data, txt = bytes(), str()
         if self.use_localfs:
             if os.path.isfile(self.local_prefix + rel_path):
-                with open(self.local_prefix + rel_path, 'rb') as file:
+                with self._stats.timer("read", "local") as timer, open(self.local_prefix + rel_path, 'rb') as file:
                     bytes_data = file.read()  
-        if note bytes_data and self.use_dropbox :
+                    timer.bytes_in = len(bytes_data)
+        if not bytes_data and self.use_dropbox and self.local_cache is not None:
+            with self._stats.timer("read", "cache") as timer:
+                with self._open_cached(rel_path) as file:
+                    bytes_data = file.read()
+                timer.bytes_in = len(bytes_data)
+        elif not bytes_data and self.use_dropbox :
             dbx_full_path = self._remove_doubleslash_endslash (self.cloud_prefix + rel_path)
-            bytes_data = self.dbx_download(dbx_full_path = dbx_full_path)
-        else:
+            with self._stats.timer("read", "cloud") as timer:
+                bytes_data = self.dbx_download(dbx_full_path = dbx_full_path)
+                timer.bytes_in = len(bytes_data)
+        elif not self.use_localfs and not self.use_dropbox:
             logger.critical("use_localfs and use_dropbox are both False")    
         if use_gzip:
-            decompressed_bytes = gzip.decompress(bytes_data)  
+            with self._stats.timer("gzip_decompress", "cpu") as timer:
+                timer.bytes_in = len(bytes_data)
+                decompressed_bytes = gzip.decompress(bytes_data)  
+                timer.bytes_out = len(decompressed_bytes)
         else: 
             decompressed_bytes = bytes_data
         return_value =  decompressed_bytes
@@ -388,36 +3900,793 @@ class ManageOvercloud(object):
             return_value = decompressed_bytes.decode()
         return return_value
 
+    def _fetch_into_cache(self, rel_path):
+        """Full path of rel_path in the local disk cache, downloading it from dropbox on a miss (None if it is too large to cache)"""
+        return self._cached(rel_path, self.local_cache.fetch)
+
+    def _open_cached(self, rel_path):
+        """rel_path from the local disk cache, downloaded from dropbox on a miss, as a pinned _CachedFileReader"""
+        return self._cached(rel_path, self.local_cache.open)
+
+    def _cached(self, rel_path, get):
+        dbx_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+        missed = []
+
+        def _download(tmp_full_path):
+            missed.append(True)
+            self.dbx_download(dbx_full_path, tmp_full_path)
+        result = get(rel_path, _download)
+        self._stats.cache_access("local_disk", not missed)
+        return result
+
+    def read_buffer(self, rel_path):
+        """
+        Content of rel_path as a read-only memoryview, without copying it: a local file (or a file of the local disk cache)
+        is mapped into memory with mmap, and pages are only read when they are touched. Handy for regex / split passes:
+        buffer = mylc.read_buffer("/text/edgar/filing.txt")
+        for match in re.finditer(rb"<SEC-DOCUMENT>", buffer): ...
+        The mapping lives as long as the memoryview (or anything sliced from it); buffer.release() unmaps it sooner.
+        A file that is only in dropbox cloud is downloaded into one bytes object, viewed as it is.
+        Like read(), a file found nowhere gives an empty buffer.
+        """
+        local_full_path = self.local_prefix + rel_path
+        if self.use_localfs and os.path.isfile(local_full_path):
+            with self._stats.timer("read_buffer", "local") as timer, open(local_full_path, "rb") as file:
+                buffer = self._mmap_file(file)
+                timer.bytes_in = buffer.nbytes
+        elif self.use_dropbox and self.local_cache is not None:
+            with self._stats.timer("read_buffer", "cache") as timer:
+                # The mapping stays valid even if the cache evicts (unlinks) the file afterwards
+                with self._open_cached(rel_path) as file:
+                    buffer = self._mmap_file(file)
+                timer.bytes_in = buffer.nbytes
+        elif self.use_dropbox:
+            dbx_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+            with self._stats.timer("read_buffer", "cloud") as timer:
+                buffer = memoryview(self.dbx_download(dbx_full_path = dbx_full_path))
+                timer.bytes_in = buffer.nbytes
+        else:
+            if not self.use_localfs:
+                logger.critical("use_localfs and use_dropbox are both False")
+            buffer = memoryview(b"")
+        return buffer
+
+    @staticmethod
+    def _mmap_file(file):
+        if os.fstat(file.fileno()).st_size == 0:
+            return memoryview(b"")      # mmap cannot map an empty file
+        return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def readinto(self, rel_path, buffer):
+        """
+        Read the stored bytes of rel_path (not decompressed) into the caller's writable buffer, e.g. one bytearray reused
+        for every file of a scan, and return the number of bytes read:
+        buffer = bytearray(64 * 1024 * 1024)
+        n = mylc.readinto("/text/edgar/filing.txt", buffer); data = memoryview(buffer)[:n]
+        The local file is read with file.readinto(); a download is copied chunk by chunk into buffer as it arrives.
+        Raises ValueError, before reading anything, if the file does not fit in buffer.
+        """
+        view = memoryview(buffer).cast("B")
+        local_full_path = self.local_prefix + rel_path
+        if self.use_localfs and os.path.isfile(local_full_path):
+            tier, file = "local", open(local_full_path, "rb")
+        elif self.use_dropbox and self.local_cache is not None and self.local_cache.lookup(rel_path, pin=True) is not None:
+            tier, file = "cache", _CachedFileReader(self.local_cache, rel_path, self.local_cache.local_path(rel_path), pinned=True)
+        else:
+            tier, file = "cloud", None
+        if file is not None:
+            with self._stats.timer("readinto", tier) as timer, file:
+                size = os.fstat(file.fileno()).st_size
+                if size > view.nbytes:
+                    raise ValueError(f"{rel_path} has {size} bytes, more than the {view.nbytes} of the buffer")
+                count = 0
+                while count < size:
+                    read = file.readinto(view[count:size])
+                    if not read:
+                        break
+                    count += read
+                timer.bytes_in = count
+            return count
+        if not self.use_dropbox:
+            if not self.use_localfs:
+                logger.critical("use_localfs and use_dropbox are both False")
+            return 0
+        dbx_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+        with self._stats.timer("readinto", "cloud") as timer:
+            metadata, res = self.backend.download(dbx_full_path)
+            try:
+                if metadata.size > view.nbytes:
+                    raise ValueError(f"{rel_path} has {metadata.size} bytes, more than the {view.nbytes} of the buffer")
+                count = 0
+                for chunk in res.iter_content(chunk_size=1024 * 1024):
+                    view[count:count + len(chunk)] = chunk
+                    count += len(chunk)
+            finally:
+                res.close()
+            timer.bytes_in = count
+        return count
+
+    def read_range(self, rel_path, start, length):
+        """
+        Bytes [start, start + length) of the decompressed content of the gzip file rel_path, e.g.
+        mylc.read_range("/text/edgar/filing.txt.gz", 10 * 1024 * 1024, 4096)
+        With a GzipIndex sidecar (see gzip_index), decompression starts at the access point before start, and only the
+        compressed bytes up to the point after start + length are read: a seek in the local file, or a ranged download.
+        Files without an index, or whose index no longer matches them, are decompressed as a stream from the beginning.
+        """
+        if start < 0 or length < 0:
+            raise ValueError(f"read_range() needs start >= 0 and length >= 0, got {start}, {length}")
+        if length == 0:
+            return b""
+        index = self._load_gzip_index(rel_path)
+        compressed = None
+        if index is not None:
+            uncompressed_offset, compressed_offset, window, compressed_stop = index.locate(start, start + length)
+            compressed = self._read_gzip_range(rel_path, index, compressed_offset, compressed_stop)
+            if compressed is None:
+                logger.warning(f"Gzip index of {rel_path} does not match the file any more; decompressing it from the start")
+                self._remember_gzip_index(rel_path, None)
+        if compressed is None:
+            with self._stats.timer("read_range", "cpu"), self.open(rel_path, "rb", use_gzip=True) as file:
+                file.seek(start)
+                return file.read(length)
+        with self._stats.timer("gzip_decompress", "cpu") as timer:
+            if window:
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=window)
+            else:
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            skip = start - uncompressed_offset
+            data = decompressor.decompress(compressed, skip + length)[skip:]
+            timer.bytes_in, timer.bytes_out = len(compressed), len(data)
+        return data
+
+    def _read_gzip_range(self, rel_path, index, start, stop):
+        """Compressed bytes [start, stop) of rel_path, or None when the file does not match its index"""
+        local_full_path = self.local_prefix + rel_path
+        if self.use_localfs and os.path.isfile(local_full_path):
+            file = open(local_full_path, "rb")
+        elif self.use_dropbox and self.local_cache is not None and self.local_cache.lookup(rel_path, pin=True) is not None:
+            try:
+                file = _CachedFileReader(self.local_cache, rel_path, self.local_cache.local_path(rel_path), pinned=True)
+            except OSError:
+                file = None
+        else:
+            file = None
+        if file is not None:
+            with self._stats.timer("read_range", "local") as timer, file:
+                if os.fstat(file.fileno()).st_size != index.compressed_size:
+                    return None
+                file.seek(index.compressed_size - 8)
+                if file.read(8) != index.trailer:
+                    return None
+                file.seek(start)
+                data = file.read(stop - start)
+                timer.bytes_in = len(data)
+            return data
+        if not self.use_dropbox:
+            raise FileNotFoundError(f"No such file in local filesystem: {local_full_path}")
+        dbx_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+        with self._stats.timer("read_range", "cloud") as timer:
+            md, res = self.backend.download(dbx_full_path, byte_range=(start, stop))
+            try:
+                if md.size != index.compressed_size or (index.content_hash and md.content_hash != index.content_hash):
+                    return None
+                data = res.content
+            finally:
+                res.close()
+            timer.bytes_in = len(data)
+        logger.debug(f"Downloaded bytes {start}-{stop} of {md.size} of {dbx_full_path}")
+        return data
+
+    def _save_gzip_index(self, rel_path, index: GzipIndex):
+        """
+        Store index next to the gzip file rel_path, in the same places; an index without any point to skip to is not worth it.
+        Without one (index = None), the sidecar of the earlier content of rel_path is deleted.
+        """
+        if index is None or len(index.points) < 2:
+            self._drop_stale_gzip_index(rel_path)
+            return
+        try:
+            self.write(index.to_bytes(), rel_path + GZIP_INDEX_SUFFIX)
+        except Exception as e:
+            logger.error(f"Failed to save the gzip index of {rel_path}; read_range() will decompress it from the start: {e!r}")
+            return
+        self._remember_gzip_index(rel_path, index)
+
+    def _save_gzip_indexes(self, indexes):
+        """_save_gzip_index() for the files of a write_many() batch, {rel_path: GzipIndex or None}: the sidecars are written as one batch too"""
+        for rel_path, index in indexes.items():
+            if index is None or len(index.points) < 2:
+                self._drop_stale_gzip_index(rel_path)
+        indexes = {rel_path: index for rel_path, index in indexes.items() if index is not None and len(index.points) >= 2}
+        if not indexes:
+            return
+        results = self._write_batch([(rel_path + GZIP_INDEX_SUFFIX, index.to_bytes()) for rel_path, index in indexes.items()], False)
+        for rel_path, index in indexes.items():
+            outcome = results.get(rel_path + GZIP_INDEX_SUFFIX)
+            if outcome is True:
+                self._remember_gzip_index(rel_path, index)
+            else:
+                logger.error(f"Failed to save the gzip index of {rel_path}; read_range() will decompress it from the start: {outcome!r}")
+
+    def _load_gzip_index(self, rel_path):
+        """GzipIndex of rel_path from memory or its sidecar file, None if there is none (remembered too, so not looked up again)"""
+        with self._gzip_indexes_lock:
+            if rel_path in self._gzip_indexes:
+                self._gzip_indexes.move_to_end(rel_path)
+                return self._gzip_indexes[rel_path]
+        try:
+            data = self.read(rel_path + GZIP_INDEX_SUFFIX)
+        except (OSError, dropbox.exceptions.ApiError) as e:
+            logger.debug(f"No gzip index for {rel_path}: {e!r}")
+            data = None
+        index = None
+        if data:
+            try:
+                index = GzipIndex.from_bytes(data)
+            except (ValueError, struct.error, zlib.error) as e:
+                logger.error(f"Ignoring unreadable gzip index of {rel_path}: {e!r}")
+        self._remember_gzip_index(rel_path, index)
+        return index
+
+    def _remember_gzip_index(self, rel_path, index):
+        """Keep the GzipIndex of rel_path in memory, or None for a file known to have no (usable) index"""
+        with self._gzip_indexes_lock:
+            self._gzip_indexes[rel_path] = index
+            self._gzip_indexes.move_to_end(rel_path)
+            while len(self._gzip_indexes) > 64:
+                self._gzip_indexes.popitem(last=False)
+
+    def _drop_stale_gzip_index(self, rel_path):
+        """
+        rel_path was just written without an index: delete the sidecar of its earlier content. In dropbox only when it is known
+        to be there (the local one existed, its index was in memory, or the caches list it), so writes cost no extra call;
+        one missed there is harmless, as read_range() checks an index against the size and content_hash of the file.
+        """
+        if not rel_path.endswith("gz"):
+            return
+        with self._gzip_indexes_lock:
+            known = self._gzip_indexes.pop(rel_path, None) is not None
+        if self.use_localfs and os.path.exists(self.local_prefix + rel_path + GZIP_INDEX_SUFFIX):
+            known = True
+        if not known and self.use_dropbox:
+            known = self._cloud_presence(self._remove_doubleslash_endslash(self.cloud_prefix + rel_path + GZIP_INDEX_SUFFIX)) is True
+        if known:
+            logger.debug(f"Deleting the gzip index of the earlier content of {rel_path}")
+            self._remove_gzip_indexes([rel_path])
+
+    def _remove_gzip_indexes(self, rel_paths):
+        """
+        Delete the sidecars of the gzip files rel_paths, locally and in dropbox (unless the caches know there is none there);
+        a file without a sidecar is no error.
+        """
+        rel_paths = [rel_path for rel_path in rel_paths if rel_path.endswith("gz")]
+        if not rel_paths:
+            return
+        sidecars = [rel_path + GZIP_INDEX_SUFFIX for rel_path in rel_paths]
+        with self._gzip_indexes_lock:
+            for rel_path in rel_paths:
+                self._gzip_indexes.pop(rel_path, None)
+        if self._write_behind is not None:
+            self._write_behind.cancel(sidecars)
+        for sidecar in sidecars:
+            if self.local_cache is not None:
+                self.local_cache.discard(sidecar)
+            if self.use_localfs:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.local_prefix + sidecar)
+        if not self.use_dropbox:
+            return
+        cloud_full_paths = [self._remove_doubleslash_endslash(self.cloud_prefix + sidecar) for sidecar in sidecars]
+        cloud_full_paths = [path for path in cloud_full_paths if self._cloud_presence(path) is not False]
+        outcomes = self._cloud_each("remove_gzip_index", self.backend.delete, self.backend.delete_batch, cloud_full_paths)
+        for cloud_full_path, outcome in zip(cloud_full_paths, outcomes):
+            if self.metadata_cache is not None:
+                self.metadata_cache.invalidate(cloud_full_path)
+            if isinstance(outcome, Exception):
+                logger.debug(f"No gzip index to delete at {cloud_full_path}: {outcome!r}")
+                continue
+            if self.metadata_cache is not None:
+                self.metadata_cache.put(cloud_full_path, None)
+            if self.catalog is not None:
+                self.catalog.forget(cloud_full_path)
+
+    def _move_gzip_indexes(self, local_moves, cloud_moves):
+        """
+        Move the sidecars of the gzip files moved, [(source, destination)], locally for local_moves and in dropbox
+        for cloud_moves, so each keeps following its file. A file without a sidecar is no error.
+        """
+        local_moves = [(source, destination) for source, destination in local_moves if source.endswith("gz")]
+        cloud_moves = [(source, destination) for source, destination in cloud_moves if source.endswith("gz")]
+        moves = list(dict.fromkeys(local_moves + cloud_moves))
+        if not moves:
+            return
+        with self._gzip_indexes_lock:
+            for source, destination in moves:
+                index = self._gzip_indexes.pop(source, None)
+                self._gzip_indexes.pop(destination, None)
+                if index is not None:
+                    self._gzip_indexes[destination] = index
+        if self._write_behind is not None:
+            self._write_behind.wait([path + GZIP_INDEX_SUFFIX for move in moves for path in move])
+        for source, destination in moves:
+            if self.local_cache is not None:
+                self.local_cache.discard(source + GZIP_INDEX_SUFFIX)
+                self.local_cache.discard(destination + GZIP_INDEX_SUFFIX)
+        for source, destination in local_moves:
+            if self.use_localfs and os.path.exists(self.local_prefix + source + GZIP_INDEX_SUFFIX):
+                try:
+                    os.replace(self.local_prefix + source + GZIP_INDEX_SUFFIX, self.local_prefix + destination + GZIP_INDEX_SUFFIX)
+                except OSError as e:
+                    logger.warning(f"Failed to move the gzip index of {self.local_prefix + source}: {e!r}")
+        if not self.use_dropbox:
+            return
+        cloud_moves = [(self._remove_doubleslash_endslash(self.cloud_prefix + source + GZIP_INDEX_SUFFIX),
+                        self._remove_doubleslash_endslash(self.cloud_prefix + destination + GZIP_INDEX_SUFFIX))
+                       for source, destination in cloud_moves]
+        cloud_moves = [move for move in cloud_moves if self._cloud_presence(move[0]) is not False]
+        outcomes = self._cloud_each("rename_gzip_index", lambda move: self.backend.move(*move), self.backend.move_batch, cloud_moves)
+        for (full_from, full_dest), outcome in zip(cloud_moves, outcomes):
+            if self.metadata_cache is not None:
+                self.metadata_cache.invalidate(full_from)
+                self.metadata_cache.invalidate(full_dest)
+            if isinstance(outcome, Exception):
+                logger.debug(f"No gzip index to move at {full_from}: {outcome!r}")
+                continue
+            if self.metadata_cache is not None:
+                self.metadata_cache.put(full_from, None)
+            if self.catalog is not None:
+                self.catalog.move(full_from, full_dest)
+
+    def _cloud_presence(self, cloud_full_path):
+        """True or False when the metadata cache or the catalog knows whether cloud_full_path is in dropbox, else None"""
+        if self.metadata_cache is not None:
+            found, metadata = self.metadata_cache.get(cloud_full_path)
+            if found:
+                return metadata is not None
+        if self.catalog is not None:
+            known, metadata = self.catalog.lookup(cloud_full_path)
+            if known:
+                return metadata is not None
+        return None
+
+    def _cloud_each(self, operation, call, batch_call, entries):
+        """Result (metadata or exception) per entry: a lone entry with call(entry), which has no batch job to poll, else _cloud_batches()"""
+        if len(entries) != 1:
+            return self._cloud_batches(operation, batch_call, entries, 1000)
+        with self._stats.timer(operation, "cloud"):
+            try:
+                return [call(entries[0])]
+            except dropbox.exceptions.ApiError as e:
+                return [e]
+
+    def _get_executor(self):
+        """The shared worker pool behind read_many(), prefetch() and the other bulk methods; created on first use"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="overcloud-io")
+        return self._executor
+
+    def _get_gzip_executor(self):
+        """
+        Pool of gzip_threads threads for the blocks of parallel_gzip_compress(); kept apart from the io pool,
+        whose workers may themselves be waiting for compressed blocks (write_many()). None with one thread.
+        """
+        if self._gzip_executor is None and self.gzip_threads > 1:
+            with self._executor_lock:
+                if self._gzip_executor is None:
+                    self._gzip_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.gzip_threads, thread_name_prefix="overcloud-gzip")
+        return self._gzip_executor
+
+    def _map_on_pool(self, func, items, ordered = False):
+        """
+        Run func(item) for every item on the worker pool and yield (item, result) as they complete,
+        or in the order of items when ordered = True.
+        If func raises, (item, exception) is yielded instead, so one failure does not abort the batch.
+        At most 2 * io_workers items are in flight, so results do not pile up when items is very long.
+        """
+        executor = self._get_executor()
+        max_in_flight = 2 * self.io_workers
+        pending = collections.deque() if ordered else {}
+        items = iter(items)
+
+        def _result(item, future):
+            try:
+                return item, future.result()
+            except Exception as e:
+                logger.error(f"{getattr(func, '__name__', func)}({item!r}) failed: {e!r}")
+                return item, e
+
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = executor.submit(func, item)
+                if ordered:
+                    pending.append((item, future))
+                else:
+                    pending[future] = item
+            if not pending:
+                return
+            if ordered:
+                item, future = pending.popleft()
+                yield _result(item, future)
+            else:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield _result(pending.pop(future), future)
+
+    def read_many(self, rel_paths, read_mode = "rb", use_gzip=False, ordered=False):
+        """
+        Read many files in parallel on the worker pool, with the same semantics as read().
+        Yields (rel_path, data) as the reads complete; with ordered = True, in the order of rel_paths.
+        gzip decompression also runs on the workers (zlib releases the GIL).
+        When one file fails, (rel_path, exception) is yielded for it and the rest of the batch carries on.
+
+        for rel_path, data in mylc.read_many(rel_paths, use_gzip=True):
+            if isinstance(data, Exception): ...
+        """
+        def _read(rel_path):
+            return self.read(rel_path, read_mode=read_mode, use_gzip=use_gzip)
+        yield from self._map_on_pool(_read, rel_paths, ordered=ordered)
+
+    def _prefetch_one(self, rel_path):
+        """Download rel_path from dropbox to the local filesystem unless it is there already. Returns True if downloaded"""
+        local_full_path = self.local_prefix + rel_path
+        if os.path.isfile(local_full_path):
+            return False
+        dbx_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+        self._download_to_local(dbx_full_path, local_full_path)
+        logger.info(f"Prefetched dropbox file {dbx_full_path} to local file {local_full_path}")
+        return True
+
+    def _download_to_local(self, dbx_full_path, local_full_path):
+        """Download to a temp file next to local_full_path (creating its folder) and rename it into place when complete"""
+        local_dir = os.path.dirname(local_full_path)
+        if local_dir:
+            os.makedirs(local_dir, exist_ok=True)
+        tmp_full_path = f"{local_full_path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            self.dbx_download(dbx_full_path, tmp_full_path)
+            os.replace(tmp_full_path, local_full_path)
+            if self.catalog is not None and self.use_localfs:
+                self.catalog.record(dbx_full_path, in_local=True)
+        finally:
+            if os.path.exists(tmp_full_path):
+                os.remove(tmp_full_path)
+
+    def prefetch(self, rel_paths):
+        """
+        Start downloading files from dropbox into the local filesystem (or the local disk cache) in the background,
+        like path_isfile() does with sync_if_missing_file, and return immediately.
+        Returns a dict {rel_path: concurrent.futures.Future}; each future resolves to True if the file was downloaded,
+        False if it already existed locally, or holds the exception of a failed download.
+
+        futures = mylc.prefetch(rel_paths)
+        concurrent.futures.wait(futures.values())
+        """
+        futures = {}
+        if self.local_cache is not None:
+            prefetch_one = lambda rel_path: self.local_cache.lookup(rel_path) is None and self._fetch_into_cache(rel_path) is not None
+        elif self.use_localfs and self.use_dropbox:
+            prefetch_one = self._prefetch_one
+        else:
+            logger.error("Cannot prefetch unless both local and cloud are turned on.")
+            return futures
+        executor = self._get_executor()
+        for rel_path in rel_paths:
+            if rel_path in futures:
+                continue
+            future = executor.submit(prefetch_one, rel_path)
+            future.add_done_callback(lambda f, rel_path=rel_path: f.exception() and logger.error(f"Prefetch of {rel_path} failed: {f.exception()!r}"))
+            futures[rel_path] = future
+        return futures
+
+    def open(self, rel_path, mode = "rb", use_gzip=False, encoding="utf-8", chunk_size=1024 * 1024, compresslevel=9):
+        """
+        Open rel_path as a stream and return a file-like object, so that big files never have to be held in memory.
+
+        Reading ("rb" returns bytes, "rt" returns str decoded with encoding, line endings left as they are):
+        with mylc.open("/text/edgar/filing.txt.gz", "rt", use_gzip=True) as f:
+            for line in f: ...
+        Like read(), the local file is used if allowed and present; otherwise the file is streamed from dropbox cloud
+        chunk_size bytes at a time. With use_gzip = True the stream is decompressed as it is read.
+        When sync_if_missing_file = True and the file is missing locally, the downloaded bytes are also written to the
+        local file, which appears once the stream has been read to the end.
+
+        Writing ("wb" takes bytes, "wt" takes str):
+        with mylc.open("/text/edgar/derived.csv", "wt", use_gzip=True) as f:
+            for row in rows: f.write(row)
+        Like write(), the file goes to the local filesystem and/or dropbox cloud, with ".gz" appended when use_gzip = True.
+        Data is compressed incrementally and streamed to a local temp file and a dropbox upload session at the same time;
+        both are committed on close(), or discarded if the with-block raises.
+        """
+        if mode in ("wb", "wt", "w"):
+            if use_gzip and not rel_path.endswith("gz"):
+                rel_path = "%s.gz" % rel_path
+            if not self.use_localfs and not self.use_dropbox:
+                raise ValueError(f"use_localfs and use_dropbox are both False; cannot write {rel_path}")
+            local_full_path = self.local_prefix + rel_path if self.use_localfs else None
+            dbx_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path) if self.use_dropbox else None
+            if self.local_cache is not None:
+                self.local_cache.discard(rel_path)
+            index = GzipIndex(self.gzip_index_spacing) if use_gzip and self.gzip_index else None
+            writer = _OvercloudWriter(self, local_full_path, dbx_full_path, use_gzip=use_gzip, compresslevel=compresslevel,
+                                      rel_path=rel_path, gzip_index=index)
+            if mode == "wb":
+                return writer
+            return _OvercloudTextWriter(writer, encoding=encoding, newline="")
+        if mode not in ("rb", "rt", "r"):
+            raise ValueError(f"ManageOvercloud.open() does not support mode {mode!r}")
+        local_full_path = self.local_prefix + rel_path
+        if self.use_localfs and os.path.isfile(local_full_path):
+            stream = io.open(local_full_path, "rb")
+        elif self.use_dropbox and self.local_cache is not None:
+            stream = io.BufferedReader(self._open_cached(rel_path), buffer_size=chunk_size)
+        elif self.use_dropbox:
+            dbx_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + rel_path)
+            md, res = self.backend.download(dbx_full_path)
+            tee_path = local_full_path if self.sync_if_missing_file and self.use_localfs else None
+            stream = io.BufferedReader(_ResponseRawIO(res, chunk_size=chunk_size, tee_path=tee_path), buffer_size=chunk_size)
+            logger.info(f"Streaming from dropbox cloud file {dbx_full_path}")
+        elif self.use_localfs:
+            raise FileNotFoundError(f"No such file in local filesystem: {local_full_path}")
+        else:
+            raise FileNotFoundError(f"use_localfs and use_dropbox are both False; cannot open {rel_path}")
+        if use_gzip:
+            stream = _GzipStreamReader(fileobj=stream, mode="rb")
+        if mode != "rb":
+            stream = io.TextIOWrapper(stream, encoding=encoding, newline="")
+        return stream
+
+    def _load_sync_state(self, cloud_full_dir):
+        if self.sync_state_path and os.path.isfile(self.sync_state_path):
+            with open(self.sync_state_path, "r") as f:
+                return json.load(f).get(cloud_full_dir.lower(), {})
+        return {}
+
+    def _save_sync_state(self, cloud_full_dir, tree_state):
+        if not self.sync_state_path:
+            return
+        # Read, update and replace the file under the lock, so that other threads and processes syncing other trees
+        # in between are not overwritten with the state read before they saved theirs
+        with self._sync_state_lock, open(self.sync_state_path + ".lock", "a") as lock_file:
+            _lock_file(lock_file)
+            all_state = {}
+            if os.path.isfile(self.sync_state_path):
+                with open(self.sync_state_path, "r") as f:
+                    all_state = json.load(f)
+            all_state[cloud_full_dir.lower()] = tree_state
+            tmp_path = f"{self.sync_state_path}.{os.getpid()}-{random.getrandbits(32):08x}.part"
+            with open(tmp_path, "w") as f:
+                json.dump(all_state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.sync_state_path)
+
+    def _list_remote_tree(self, cloud_full_dir, previous_remote, cursor):
+        """
+        Index {lower-cased sub path: [sub path, size, content_hash, server_modified timestamp]} of all files under
+        cloud_full_dir, and the cursor to continue from next time.
+        With a saved cursor, only the changes since then are fetched and applied to previous_remote.
+        A cloud_full_dir that does not exist yet (e.g. before the first upload) is an empty tree without a cursor.
+        """
+        def _sub_path(entry):
+            return entry.path_display[len(cloud_full_dir) + 1:]
+
+        remote = None
+        if cursor:
+            try:
+                remote = {key: entry for key, entry in previous_remote.items() if not key.endswith(GZIP_INDEX_SUFFIX)}
+                result = self.backend.list_folder_continue(cursor)
+            except dropbox.exceptions.ApiError as e:
+                if not (isinstance(e.error, dropbox.files.ListFolderContinueError) and e.error.is_reset()):
+                    raise
+                logger.warning(f"Saved list_folder cursor of {cloud_full_dir} was reset by dropbox; rescanning the whole tree")
+                remote = None
+        if remote is None:
+            remote = {}
+            try:
+                result = self.backend.list_folder(cloud_full_dir, recursive=True)
+            except dropbox.exceptions.ApiError as e:
+                if not (isinstance(e.error, dropbox.files.ListFolderError) and e.error.is_path() and e.error.get_path().is_not_found()):
+                    raise
+                logger.info(f"{cloud_full_dir} does not exist in dropbox cloud yet")
+                return remote, None
+        while True:
+            for entry in result.entries:
+                sub_path = _sub_path(entry)
+                if isinstance(entry, dropbox.files.FileMetadata) and not entry.name.endswith(GZIP_INDEX_SUFFIX):
+                    server_modified = entry.server_modified.replace(tzinfo=datetime.timezone.utc).timestamp()
+                    remote[sub_path.lower()] = [sub_path, entry.size, entry.content_hash, server_modified]
+                elif isinstance(entry, dropbox.files.DeletedMetadata):
+                    key = sub_path.lower()
+                    remote.pop(key, None)
+                    for child_key in [k for k in remote if k.startswith(key + "/")]:
+                        del remote[child_key]
+            if not result.has_more:
+                return remote, result.cursor
+            result = self.backend.list_folder_continue(result.cursor)
+
+    def sync_tree(self, rel_dir, direction = "both"):
+        """
+        Synchronise the whole tree rel_dir between the local filesystem and dropbox cloud, transferring only differences.
+        direction = "down" copies cloud -> local, "up" copies local -> cloud, "both" does either per file.
+
+        The remote tree is listed with files_list_folder(recursive=True) / files_list_folder_continue, the local tree is walked,
+        and files are compared by size and dropbox content_hash; the differing files are transferred in parallel on the worker pool.
+        The list_folder cursor and both snapshots are saved in sync_state_path, so the next run fetches only the remote changes
+        since this one and hashes only local files whose size or mtime changed.
+        With direction = "both", a file that changed on one side only since the last run is copied to the other side;
+        if it changed on both (or there is no earlier run), the more recently modified copy wins.
+        Files are never deleted, and gzip index sidecars are not synced (each side keeps its own). Returns a summary dict with the counts and bytes transferred, and the per-file errors.
+
+        mylc.sync_tree("/text/edgar/by-index", direction="down")
+        """
+        if direction not in ("both", "up", "down"):
+            raise ValueError(f"sync_tree() direction must be 'both', 'up' or 'down', not {direction!r}")
+        summary = {"uploaded": 0, "downloaded": 0, "bytes_up": 0, "bytes_down": 0, "unchanged": 0, "errors": {}}
+        if not (self.use_localfs and self.use_dropbox):
+            logger.error("Cannot sync unless both local and cloud are turned on.")
+            return summary
+        rel_dir = self._remove_doubleslash_endslash(rel_dir)
+        local_full_dir = self.local_prefix + rel_dir
+        cloud_full_dir = self._remove_doubleslash_endslash(self.cloud_prefix + rel_dir)
+        state = self._load_sync_state(cloud_full_dir)
+        previous_remote, previous_local = state.get("remote", {}), state.get("local", {})
+
+        remote, cursor = self._list_remote_tree(cloud_full_dir, previous_remote, state.get("cursor"))
+
+        # Walk the local tree; reuse the saved content_hash of files whose size and mtime did not change
+        local = {}
+        for dirpath, dirnames, filenames in os.walk(local_full_dir):
+            for filename in filenames:
+                if filename.endswith((".part", GZIP_INDEX_SUFFIX)):
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                sub_path = os.path.relpath(full_path, local_full_dir).replace(os.sep, "/")
+                stat = os.stat(full_path)
+                previous = previous_local.get(sub_path)
+                content_hash = previous[2] if previous and previous[:2] == [stat.st_size, stat.st_mtime_ns] else None
+                local[sub_path] = [stat.st_size, stat.st_mtime_ns, content_hash]
+        local_by_key = {sub_path.lower(): sub_path for sub_path in local}
+
+        to_hash = [sub_path for sub_path, (size, _, content_hash) in local.items()
+                   if content_hash is None and sub_path.lower() in remote and remote[sub_path.lower()][1] == size]
+
+        def _hash(sub_path):
+            with open(local_full_dir + "/" + sub_path, "rb") as f:
+                return dropbox_content_hash(f)
+        for sub_path, content_hash in self._map_on_pool(_hash, to_hash):
+            if not isinstance(content_hash, Exception):
+                local[sub_path][2] = content_hash
+
+        uploads, downloads = [], []
+        for key in set(remote) | set(local_by_key):
+            remote_entry = remote.get(key)
+            local_sub_path = local_by_key.get(key)
+            local_entry = local.get(local_sub_path)
+            if local_entry is None:
+                if direction != "up":
+                    downloads.append(remote_entry[0])
+                continue
+            if remote_entry is None:
+                if direction != "down":
+                    uploads.append(local_sub_path)
+                continue
+            if local_entry[0] == remote_entry[1] and local_entry[2] == remote_entry[2]:
+                summary["unchanged"] += 1
+                continue
+            if direction == "up":
+                uploads.append(local_sub_path)
+            elif direction == "down":
+                downloads.append(remote_entry[0])
+            else:
+                local_changed = previous_local.get(local_sub_path, [None, None])[:2] != local_entry[:2]
+                remote_changed = previous_remote.get(key, [None, None, None])[2] != remote_entry[2]
+                if local_changed and remote_changed:
+                    local_is_newer = local_entry[1] / 1e9 > remote_entry[3]
+                    logger.warning(f"sync_tree(): {rel_dir}/{local_sub_path} changed both locally and in dropbox; "
+                                   f"keeping the {'local' if local_is_newer else 'dropbox'} copy")
+                    remote_changed = not local_is_newer
+                if remote_changed:
+                    downloads.append(remote_entry[0])
+                else:
+                    uploads.append(local_sub_path)
+
+        def _transfer(job):
+            direction, sub_path = job
+            local_full_path = local_full_dir + "/" + sub_path
+            dbx_full_path = cloud_full_dir + "/" + sub_path
+            with self._stats.timer("sync", "cloud") as timer:
+                if direction == "up":
+                    with open(local_full_path, "rb") as f:
+                        metadata = self.dbx_upload(f, dbx_full_path)
+                    timer.bytes_out = metadata.size
+                    return metadata.size, metadata.content_hash
+                self._download_to_local(dbx_full_path, local_full_path)
+                timer.bytes_in = os.path.getsize(local_full_path)
+                return timer.bytes_in, remote[sub_path.lower()][2]
+
+        jobs = [("up", sub_path) for sub_path in uploads] + [("down", sub_path) for sub_path in downloads]
+        logger.info(f"sync_tree({rel_dir}): {len(uploads)} files to upload, {len(downloads)} to download, {summary['unchanged']} unchanged")
+        for (job_direction, sub_path), outcome in self._map_on_pool(_transfer, jobs):
+            if isinstance(outcome, Exception):
+                summary["errors"][f"{rel_dir}/{sub_path}"] = outcome
+                continue
+            size, content_hash = outcome
+            summary["uploaded" if job_direction == "up" else "downloaded"] += 1
+            summary["bytes_up" if job_direction == "up" else "bytes_down"] += size
+            stat = os.stat(local_full_dir + "/" + sub_path)
+            local[sub_path] = [stat.st_size, stat.st_mtime_ns, content_hash]
+
+        # Uploads show up as changes at the saved cursor, so they are re-listed (and found unchanged) next time
+        self._save_sync_state(cloud_full_dir, {"cursor": cursor, "remote": remote, "local": local})
+        logger.info(f"sync_tree({rel_dir}) finished: {summary['uploaded']} uploaded, {summary['downloaded']} downloaded, "
+                    f"{len(summary['errors'])} errors")
+        return summary
+
     def sync_file(self, local_rel_path, cloud_rel_path, from_cloud_to_local = False):
-        """This method has not been called anywhere?"""
+        """This method has not been called anywhere?
+        With skip_unchanged = True, a copy that already holds the content of the other one is left alone."""
         if self.use_localfs and self.use_dropbox:
             dbx_full_path = self._remove_doubleslash_endslash(self.cloud_prefix + cloud_rel_path)
-            if from_cloud_to_local:
-                self.dbx_download(dbx_full_path = dbx_full_path, local_full_path = self.local_prefix + local_rel_path )
-            else: #from_local_to_cloud
-                with open(self.local_prefix + local_rel_path, 'rb') as file:
-                    bytes_data = file.read()  
-                    self.dbx_upload(bytes_data,  dbx_full_path = dbx_full_path)
+            if from_cloud_to_local and self.skip_unchanged:
+                local_full_path = self.local_prefix + local_rel_path
+                metadata = self._dbx_get_metadata(dbx_full_path, "skip_unchanged")
+                if isinstance(metadata, dropbox.files.FileMetadata) and self._local_unchanged(local_full_path, metadata.size, metadata.content_hash):
+                    self._stats.skipped("local", metadata.size)
+                    logger.debug(f"Local file is unchanged, not downloading it: {local_full_path}")
+                    return
+            with self._stats.timer("sync", "cloud") as timer:
+                if from_cloud_to_local:
+                    timer.bytes_in = len(self.dbx_download(dbx_full_path = dbx_full_path, local_full_path = self.local_prefix + local_rel_path ))
+                else: #from_local_to_cloud
+                    with open(self.local_prefix + local_rel_path, 'rb') as file:
+                        timer.bytes_out = self._payload_size(file)
+                        self.dbx_upload(file,  dbx_full_path = dbx_full_path)
         else:
             logger.error("Cannot sync unless both local and cloud are turned on.")
 
+    @property
+    def dbx(self):
+        """The dropbox.Dropbox client of this process (made on first use), or None when the backend has none"""
+        backend = getattr(self.backend, "wrapped", self.backend)
+        return getattr(backend, "dbx", None)
+
     @staticmethod
-    def get_existing_dropbox_token():
+    def get_existing_dropbox_token(access_token = None):
         """Attempt to obtain dropbox_token from 
-            1. args
-            2. stored file
+            1. the access_token given (e.g. --dropbox-access-token)
+            2. the DBX_TOKEN environment variable
+            3. stored file
         If neither is provided, return None
         """
-        access_token = None
-
-        if args.dropbox_access_token:
-            access_token = args.dropbox_access_token  
+        if not access_token:
+            access_token = os.environ.get("DBX_TOKEN")
 
-        elif os.path.isfile("./.dropbox_access_token"):
+        if not access_token and os.path.isfile("./.dropbox_access_token"):
             with open("./.dropbox_access_token", "r") as f:
-                access_token = f.read()
+                access_token = f.read().strip()
 
-        return access_token
+        return access_token or None
+
+    @staticmethod
+    def get_existing_dropbox_refresh_token(refresh_token = None):
+        """Like get_existing_dropbox_token(), for the long-lived refresh token: given, DBX_REFRESH_TOKEN, or ./.dropbox_refresh_token"""
+        if not refresh_token:
+            refresh_token = os.environ.get("DBX_REFRESH_TOKEN")
+
+        if not refresh_token and os.path.isfile("./.dropbox_refresh_token"):
+            with open("./.dropbox_refresh_token", "r") as f:
+                refresh_token = f.read().strip()
+
+        return refresh_token or None
 
     @staticmethod
     def authorize_dropbox_over_web(app_key: str, app_secret: str):
@@ -436,12 +4705,16 @@ class ManageOvercloud(object):
         access_token = oauth_result.access_token
         with open("./.dropbox_access_token", "wt") as f:
             f.write(access_token)
+        if oauth_result.refresh_token:
+            # Lets later runs (and every worker process) refresh the short-lived access token without a browser
+            with open("./.dropbox_refresh_token", "wt") as f:
+                f.write(oauth_result.refresh_token)
         print(f"Dropbox Account Authorization of App with app-key {app_key} completed!")    
         return access_token
 
-    def connect_dropbox(self, access_token = None, retrying_already = False):
+    def connect_dropbox(self, access_token = None):
         """
-        Setup Dropbox Connection
+        Setup Dropbox Connection; called by the DropboxBackend on the first cloud call of each process.
         You need to apply for a Dropbox APP, then get an API token from Dropbox app console
         Dropbox app console: https://www.dropbox.com/developers/apps?_tk=pilot_lp&_ad=topbar4&_camp=myapps
 
@@ -449,26 +4722,403 @@ class ManageOvercloud(object):
         * Either run in console: export DBX_TOKEN = ${your_token}
             Shortened example: export DBX_TOKEN=sl.BeoSWaH2atxxxxtm-4 
         Or include it in the parameter --
+        With a refresh token (export DBX_REFRESH_TOKEN=..., or ./.dropbox_refresh_token saved by authorize_dropbox_over_web())
+        and the app key, the SDK refreshes expired access tokens by itself, without any prompt.
+        Only when there is no token at all, and stdin is a terminal, is the app authorized over the web.
+        No request is made here: a bad token shows up as a dropbox.exceptions.AuthError on the first call.
+        The SDK's own retries are turned off: rate limits and 5xx errors reach the CloudRateController, which retries them.
 
         See Dropbox Python API Documentation: https://dropbox-sdk-python.readthedocs.io/en/latest/
         """
-        if access_token==None: 
+        access_token = access_token or self.dropbox_access_token
+        refresh_token = self.dropbox_refresh_token
+        if refresh_token and not self.dropbox_app_key:
+            logger.error("A dropbox refresh token needs dropbox_app_key; ignoring the refresh token.")
+            refresh_token = None
+        if not access_token and not refresh_token:
+            if not (sys.stdin is not None and sys.stdin.isatty()):
+                raise RuntimeError("No dropbox token found, and no terminal to authorize the app in")
             access_token = self.authorize_dropbox_over_web(self.dropbox_app_key, self.dropbox_app_secret)
-        dbx = dropbox.Dropbox(access_token)
-        try:
-            account = dbx.users_get_current_account()
-            logger.info("Connected to Dropbox successfully! ")
-            #logger.info(f"Account information: {account}")
-        except dropbox.exceptions.AuthError as e:
-            if retrying_already:
-                logger.critical("CANNOT ACCESS DROPBOX")
-                dbx = None
-            else:    
-                dbx = self.connect_dropbox(access_token = None, retrying_already=True)
+            self.dropbox_access_token = access_token
+            refresh_token = self.dropbox_refresh_token = self.get_existing_dropbox_refresh_token()
+        session = dropbox.create_session(max_connections=max(8, self.io_workers))
+        if refresh_token:
+            dbx = dropbox.Dropbox(oauth2_access_token=access_token, oauth2_refresh_token=refresh_token,
+                                  app_key=self.dropbox_app_key, app_secret=self.dropbox_app_secret, session=session,
+                                  max_retries_on_error=0, max_retries_on_rate_limit=0)
+        else:
+            dbx = dropbox.Dropbox(access_token, session=session, max_retries_on_error=0, max_retries_on_rate_limit=0)
+        logger.info(f"Dropbox client ready in process {os.getpid()}")
         return dbx
 
     
-    
+
+class AsyncManageOvercloud(object):
+    """
+    asyncio facade over a ManageOvercloud instance, with the same local / cloud / sync semantics.
+    Every method is a coroutine that runs the blocking call on a thread pool, so one event loop can keep
+    thousands of transfers in flight. Calls that may reach dropbox cloud also hold a slot of an
+    asyncio.Semaphore(max_cloud_concurrency); calls answered by the local filesystem do not.
+    The *_many helpers are built on asyncio.gather(..., return_exceptions=True).
+
+    amo = AsyncManageOvercloud(ManageOvercloud(use_localfs=True, use_dropbox=True, ...), max_cloud_concurrency=64)
+    data = await amo.read("/tmp/var1.txt.gz", use_gzip=True)
+    datas = await amo.read_many(rel_paths, use_gzip=True)
+    """
+
+    def __init__(self, manager: ManageOvercloud, max_cloud_concurrency = 32, local_workers = 8):
+        self.manager = manager
+        self.max_cloud_concurrency = max_cloud_concurrency
+        self._semaphore = asyncio.Semaphore(max_cloud_concurrency)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_cloud_concurrency + local_workers,
+                                                               thread_name_prefix="overcloud-async")
+
+    async def _run(self, func, *args, cloud = True, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        if cloud and self.manager.use_dropbox:
+            async with self._semaphore:
+                return await loop.run_in_executor(self._executor, call)
+        return await loop.run_in_executor(self._executor, call)
+
+    async def _local_hit(self, rel_path, check = os.path.isfile):
+        """Whether the call can be answered by the local filesystem alone"""
+        if not self.manager.use_localfs or self.manager.sync_if_missing_file:
+            return False
+        return await self._run(check, self.manager.local_prefix + rel_path, cloud=False)
+
+    async def read(self, rel_path, read_mode = "rb", use_gzip=False):
+        local = await self._run(os.path.isfile, self.manager.local_prefix + rel_path, cloud=False) if self.manager.use_localfs else False
+        return await self._run(self.manager.read, rel_path, read_mode=read_mode, use_gzip=use_gzip, cloud=not local)
+
+    async def write(self, data: Union[bytes, str], rel_path, use_gzip=False):
+        return await self._run(self.manager.write, data, rel_path, use_gzip=use_gzip)
+
+    async def path_isfile(self, rel_path, check_onlyone_overrule = False):
+        local = await self._local_hit(rel_path)
+        return await self._run(self.manager.path_isfile, rel_path, check_onlyone_overrule=check_onlyone_overrule, cloud=not local)
+
+    async def path_isdir(self, rel_path, check_both=False):
+        local = not check_both and await self._local_hit(rel_path, check=os.path.isdir)
+        return await self._run(self.manager.path_isdir, rel_path, check_both=check_both, cloud=not local)
+
+    async def listdir(self, rel_path):
+        return await self._run(self.manager.listdir, rel_path)
+
+    async def makedirs(self, rel_path):
+        return await self._run(self.manager.makedirs, rel_path)
+
+    async def rename(self, source, destination):
+        return await self._run(self.manager.rename, source, destination)
+
+    async def remove(self, rel_path):
+        return await self._run(self.manager.remove, rel_path)
+
+    async def read_many(self, rel_paths, read_mode = "rb", use_gzip=False):
+        """List of the data of every file in rel_paths (in order); a failed read gives its exception instead"""
+        return await asyncio.gather(*(self.read(rel_path, read_mode=read_mode, use_gzip=use_gzip) for rel_path in rel_paths),
+                                    return_exceptions=True)
+
+    async def write_many(self, items, use_gzip=False):
+        """Write a dict {rel_path: data} or (rel_path, data) pairs; returns a list with None or the exception of each file"""
+        if isinstance(items, dict):
+            items = items.items()
+        return await asyncio.gather(*(self.write(data, rel_path, use_gzip=use_gzip) for rel_path, data in items),
+                                    return_exceptions=True)
+
+    async def path_isfile_many(self, rel_paths, check_onlyone_overrule = False):
+        """List of path_isfile() results for rel_paths (in order); a failed check gives its exception instead"""
+        return await asyncio.gather(*(self.path_isfile(rel_path, check_onlyone_overrule=check_onlyone_overrule) for rel_path in rel_paths),
+                                    return_exceptions=True)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+BENCH_MODES = ("local", "cloud", "dual")
+BENCH_WORKLOADS = ("write", "write_gzip", "path_isfile", "listdir", "read", "read_gzip", "sync")
+BENCH_SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+_BENCH_WORDS = ("the", "company", "shares", "common", "stock", "fiscal", "year", "ended", "december", "net", "income", "revenue",
+                "total", "assets", "liabilities", "cash", "flows", "operating", "activities", "million", "per", "share", "quarter",
+                "report", "form", "annual", "securities", "exchange", "commission", "registrant", "financial", "statements",
+                "item", "risk", "factors", "management", "discussion", "analysis", "results", "operations", "tax", "interest")
+
+
+def synthetic_edgar_corpus(n_files = 200, size_distribution = "lognormal", mean_size = 64 * 1024, compressibility = 0.7, seed = 0):
+    """
+    A reproducible list of (rel_path, bytes) that looks like an EDGAR full-text download:
+    files /edgar/data/<cik>/<accession>.txt spread over about sqrt(n_files) company folders, each one an SGML-ish header
+    followed by filing text. File sizes are "fixed" at mean_size, "uniform" in [0, 2 * mean_size] or "lognormal" around mean_size.
+    compressibility (0 to 1) is the share of the text that is made of words; the rest is random bytes, which gzip cannot shrink.
+    The same arguments always give the same corpus.
+
+    corpus = synthetic_edgar_corpus(1000, mean_size=256 * 1024, compressibility=0.8, seed=1)
+    """
+    if size_distribution not in BENCH_SIZE_DISTRIBUTIONS:
+        raise ValueError(f"size_distribution must be one of {BENCH_SIZE_DISTRIBUTIONS}, not {size_distribution!r}")
+    compressibility = min(max(compressibility, 0.0), 1.0)
+    rng = random.Random(seed)
+    chunk = 4096
+    words = [rng.choice(_BENCH_WORDS) if rng.random() < 0.9 else str(rng.randrange(10 ** 6)) for _ in range(160 * 1024)]
+    text_pool = " ".join(words).encode()
+    noise_pool = rng.randbytes(1024 * 1024)
+    ciks = [str(rng.randrange(1000, 2000000)) for _ in range(max(1, int(n_files ** 0.5)))]
+    sigma = 1.0
+    corpus = []
+    for i in range(n_files):
+        if size_distribution == "fixed":
+            size = mean_size
+        elif size_distribution == "uniform":
+            size = rng.randint(0, 2 * mean_size)
+        else:
+            size = int(rng.lognormvariate(math.log(max(mean_size, 1)) - sigma * sigma / 2, sigma))
+        cik = ciks[i % len(ciks)]
+        accession = f"{int(cik):010d}-{rng.randrange(90, 124) % 100:02d}-{i:06d}"
+        header = (f"<SEC-DOCUMENT>{accession}.txt : {2000 + rng.randrange(24)}0331\n<SEC-HEADER>\n"
+                  f"CENTRAL INDEX KEY:\t{cik}\nFORM TYPE:\t{rng.choice(('10-K', '10-Q', '8-K', 'DEF 14A'))}\n</SEC-HEADER>\n").encode()
+        parts = [header[:size]]
+        remaining = size - len(parts[0])
+        while remaining > 0:
+            n = min(chunk, remaining)
+            pool = text_pool if rng.random() < compressibility else noise_pool
+            start = rng.randrange(len(pool) - n)
+            parts.append(pool[start:start + n])
+            remaining -= n
+        corpus.append((f"/edgar/data/{cik}/{accession}.txt", b"".join(parts)))
+    return corpus
+
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+
+def _peak_rss_bytes():
+    """High-water mark of the resident set size of this process, or None where neither /proc nor the resource module exist (Windows)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024     # bytes on macOS, KiB on Linux
+
+
+def _reset_peak_rss():
+    """
+    Baseline to measure the peak RSS of what comes next against: on Linux, the high-water mark is reset to the current RSS
+    (through /proc/self/clear_refs) and that RSS is returned; elsewhere, the high-water mark so far, so that only growth past it counts.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return _peak_rss_bytes()
+
+
+def _bench_workload(benchmark, mode, concurrency, run_dir, workload, prepare = None):
+    """
+    One workload of an OvercloudBenchmark, run in a process of its own: the write it needs first (prepare, not measured), then
+    the workload, whose result gets the peak RSS it added over the corpus and the instance (peak_rss_delta_bytes).
+    """
+    corpus = benchmark.corpus()
+    folders = sorted({rel_path.rsplit("/", 1)[0] for rel_path, _ in corpus})
+    mo = benchmark._manager(mode, concurrency, run_dir)
+    try:
+        if prepare is not None:
+            benchmark._measure(mo, prepare, concurrency, corpus, folders)
+        if mode != "local":
+            dropbox.files       # the lazy SDK import is a cost of the process, not of the workload that happens to be first
+        gc.collect()
+        baseline = _reset_peak_rss()
+        result = benchmark._measure(mo, workload, concurrency, corpus, folders)
+        peak = _peak_rss_bytes()
+    finally:
+        mo.close()
+    result["peak_rss_delta_bytes"] = None if peak is None or baseline is None else max(0, peak - baseline)
+    return result
+
+
+class OvercloudBenchmark(object):
+    """
+    Reproducible benchmark of the ManageOvercloud storage paths, to compare runs across versions.
+    A synthetic_edgar_corpus() is pushed through each workload in BENCH_WORKLOADS
+        write / write_gzip: write() of every file, plain or with use_gzip=True (to rel_path + ".gz")
+        path_isfile / read / read_gzip: path_isfile() and read() of every file written
+        listdir: listdir() of every company folder
+        sync: one sync_tree(direction="down") of the whole corpus into an empty local tree (dual mode only)
+    at every level of concurrency (that many threads calling the instance, which also gets io_workers = concurrency),
+    in the modes "local" (local filesystem only), "cloud" (dropbox only) and "dual" (both).
+    The cloud is a DropboxEmulatorBackend in workdir, slowed down by latency seconds per request and a link of
+    bandwidth bytes per second, so that runs need no network and no token.
+    run() returns a dict ready for json.dump(): the configuration, the corpus, and for every (mode, concurrency, workload)
+    the operations, bytes, seconds, ops_per_s, mb_per_s, p50_ms, p99_ms, errors and peak_rss_delta_bytes.
+    Every workload runs in a fresh (spawned) process, which generates the corpus again from the seed and works on the files the
+    earlier workloads left in workdir, so that peak_rss_delta_bytes is what that workload added to the resident set size,
+    not the high-water mark of the benchmark so far.
+
+    report = OvercloudBenchmark(n_files=500, concurrency=(1, 16), latency=0.05).run()
+    python manageovercloud.py bench --files 500 --concurrency 1 16 --latency 0.05 --output bench.json
+    """
+
+    def __init__(self, n_files = 200, size_distribution = "lognormal", mean_size = 64 * 1024, compressibility = 0.7, seed = 0,
+                 concurrency = (1, 8, 32), modes = BENCH_MODES, workloads = BENCH_WORKLOADS,
+                 latency = 0.02, bandwidth = None, workdir = None, label = None):
+        for mode in modes:
+            if mode not in BENCH_MODES:
+                raise ValueError(f"Benchmark mode must be one of {BENCH_MODES}, not {mode!r}")
+        for workload in workloads:
+            if workload not in BENCH_WORKLOADS:
+                raise ValueError(f"Benchmark workload must be one of {BENCH_WORKLOADS}, not {workload!r}")
+        self.n_files = n_files
+        self.size_distribution = size_distribution
+        self.mean_size = mean_size
+        self.compressibility = compressibility
+        self.seed = seed
+        self.concurrency = tuple(concurrency)
+        self.modes = tuple(mode for mode in BENCH_MODES if mode in modes)
+        self.workloads = tuple(workload for workload in BENCH_WORKLOADS if workload in workloads)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.workdir = workdir
+        self.label = label
+
+    def config(self):
+        return {"files": self.n_files, "size_distribution": self.size_distribution, "mean_size": self.mean_size,
+                "compressibility": self.compressibility, "seed": self.seed, "concurrency": list(self.concurrency),
+                "modes": list(self.modes), "workloads": list(self.workloads), "latency": self.latency, "bandwidth": self.bandwidth}
+
+    def corpus(self):
+        return synthetic_edgar_corpus(self.n_files, self.size_distribution, self.mean_size, self.compressibility, self.seed)
+
+    def run(self):
+        corpus = self.corpus()
+        total_bytes = sum(len(data) for _, data in corpus)
+        report = {"label": self.label, "started": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                  "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                  "config": self.config(),
+                  "corpus": {"files": len(corpus), "bytes": total_bytes,
+                             "gzip_ratio": round(sum(len(zlib.compress(data, 6)) for _, data in corpus) / max(total_bytes, 1), 4)},
+                  "results": []}
+        with contextlib.ExitStack() as stack:
+            workdir = self.workdir or stack.enter_context(tempfile.TemporaryDirectory(prefix="overcloud-bench-"))
+            for mode in self.modes:
+                for concurrency in self.concurrency:
+                    run_dir = os.path.join(workdir, f"{mode}-{concurrency}")
+                    shutil.rmtree(run_dir, ignore_errors=True)
+                    try:
+                        report["results"].extend(self._run_mode(mode, concurrency, corpus, run_dir))
+                    finally:
+                        shutil.rmtree(run_dir, ignore_errors=True)
+        return report
+
+    def _manager(self, mode, concurrency, run_dir):
+        os.makedirs(run_dir + "/local", exist_ok=True)
+        backend = None
+        if mode != "local":
+            backend = DropboxEmulatorBackend(run_dir + "/cloud", latency=self.latency, bandwidth=self.bandwidth)
+        return ManageOvercloud(use_localfs = mode != "cloud", use_dropbox = mode != "local",
+                               local_prefix = run_dir + "/local", cloud_prefix = "/bench",
+                               io_workers = concurrency, backend = backend,
+                               sync_state_path = run_dir + "/sync_state.json")
+
+    def _run_mode(self, mode, concurrency, corpus, run_dir):
+        mo = self._manager(mode, concurrency, run_dir)
+        try:
+            for folder in sorted({rel_path.rsplit("/", 1)[0] for rel_path, _ in corpus}):
+                mo.makedirs(folder)     # write() expects the folders to exist, as in a real run
+        finally:
+            mo.close()
+        context = multiprocessing.get_context("spawn")
+        written = set()
+        results = []
+        for workload in self.workloads:
+            if workload == "sync" and mode != "dual":
+                continue
+            # reads need the files of the matching write, even when that write is not itself measured
+            needs = "write_gzip" if workload == "read_gzip" else "write"
+            prepare = needs if workload not in ("write", "write_gzip") and needs not in written else None
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(_bench_workload, self, mode, concurrency, run_dir, workload, prepare).result()
+            written.update(name for name in (prepare, workload) if name in ("write", "write_gzip"))
+            result.update(mode=mode, concurrency=concurrency, workload=workload)
+            results.append(result)
+            logger.info(f"bench {mode} x{concurrency} {workload}: {result['ops_per_s']} ops/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms")
+        return results
+
+    def _measure(self, mo, workload, concurrency, corpus, folders):
+        """Run one workload on concurrency threads; the latency of every call, and the throughput over the wall time"""
+        if workload == "sync":
+            shutil.rmtree(mo.local_prefix + "/edgar", ignore_errors=True)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(mo.sync_state_path)
+            start = time.perf_counter()
+            try:
+                summary = mo.sync_tree("/edgar", direction="down")
+            except Exception as e:
+                logger.error(f"bench sync: sync_tree() failed: {e!r}")
+                summary = {"downloaded": 0, "bytes_down": 0, "errors": {"/edgar": e}}
+            seconds = time.perf_counter() - start
+            return self._result([seconds], seconds, summary["downloaded"], summary["bytes_down"], len(summary["errors"]))
+
+        if workload == "write":
+            calls = [(functools.partial(mo.write, data, rel_path), len(data)) for rel_path, data in corpus]
+        elif workload == "write_gzip":
+            calls = [(functools.partial(mo.write, data, rel_path + ".gz", use_gzip=True), len(data)) for rel_path, data in corpus]
+        elif workload == "read":
+            calls = [(functools.partial(mo.read, rel_path), len(data)) for rel_path, data in corpus]
+        elif workload == "read_gzip":
+            calls = [(functools.partial(mo.read, rel_path + ".gz", use_gzip=True), len(data)) for rel_path, data in corpus]
+        elif workload == "path_isfile":
+            calls = [(functools.partial(mo.path_isfile, rel_path), 0) for rel_path, _ in corpus]
+        else:   # listdir
+            calls = [(functools.partial(mo.listdir, folder), 0) for folder in folders]
+
+        def _timed(call):
+            start = time.perf_counter()
+            try:
+                call()
+                return time.perf_counter() - start, None
+            except Exception as e:
+                return time.perf_counter() - start, e
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="overcloud-bench") as pool:
+            start = time.perf_counter()
+            outcomes = list(pool.map(_timed, [call for call, _ in calls]))
+            seconds = time.perf_counter() - start
+        errors = [e for _, e in outcomes if e is not None]
+        if errors:
+            logger.error(f"bench {workload}: {len(errors)} of {len(calls)} calls failed, first: {errors[0]!r}")
+        return self._result([latency for latency, _ in outcomes], seconds, len(calls), sum(nbytes for _, nbytes in calls), len(errors))
+
+    @staticmethod
+    def _result(latencies, seconds, ops, nbytes, errors):
+        latencies = sorted(latencies)
+        seconds = max(seconds, 1e-9)
+        p50, p99 = _percentile(latencies, 0.50), _percentile(latencies, 0.99)
+        return {"ops": ops, "bytes": nbytes, "seconds": round(seconds, 6),
+                "ops_per_s": round(ops / seconds, 2), "mb_per_s": round(nbytes / seconds / 1e6, 3),
+                "p50_ms": None if p50 is None else round(p50 * 1000, 3), "p99_ms": None if p99 is None else round(p99 * 1000, 3),
+                "errors": errors}
+
+
 def create_parser():
     """Argument Parser
     This function automatically creats a HELP message if run this python code in commandline with -h or --help
@@ -502,6 +5152,8 @@ def create_parser():
     
     parser.add_argument("-dbxtkn", "--dropbox-access-token", type=str, required = False, help="""Dropbox Access Token. For your own Dropbox APP (applied in Dropbox Developer), generate it from Dropbox Developer App Console https://www.dropbox.com/developers/apps?_tk=pilot_lp&_ad=topbar4&_camp=myapps Otherwise need 2-Step Authorization with your Browser. Once generated, would be stored at ./.dropbox_access_token in the current directory where you invoke this python code""")
     
+    parser.add_argument("-dbxrtkn", "--dropbox-refresh-token", type=str, required = False, help="""Dropbox Refresh Token, used with --dropbox-app-key to refresh short-lived access tokens without a browser. Once the app is authorized over the web, it is stored at ./.dropbox_refresh_token in the current directory""")
+    
     parser.add_argument("-dbxkey", "--dropbox-app-key", type=str,  required = False, help="""Dropbox App Key. For your own Dropbox APP (applied in Dropbox Developer), obtain it from Dropbox Developer App Console https://www.dropbox.com/developers/apps?_tk=pilot_lp&_ad=topbar4&_camp=myapps""")
     
     parser.add_argument("-dbxsct", "--dropbox-app-secret", type=str,  required = False, help="""Dropbox App Secret. For your own Dropbox APP (applied in Dropbox Developer), obtain it from Dropbox Developer App Console https://www.dropbox.com/developers/apps?_tk=pilot_lp&_ad=topbar4&_camp=myapps""")
@@ -512,6 +5164,24 @@ def create_parser():
         help="""SEC EDGAR requires that bots declare your user agent in request headers:
         Sample Company Name AdminContact@<sample_company_domain>.com
         See https://www.sec.gov/os/accessing-edgar-data for more info""")
+    
+    # python manageovercloud.py bench ...: run an OvercloudBenchmark instead of building an instance
+    subparsers = parser.add_subparsers(dest="command")
+    bench = subparsers.add_parser("bench", formatter_class=CustomFormatter,
+        help="Run the storage benchmark on a synthetic EDGAR-like corpus (offline dropbox emulator) and print JSON results")
+    bench.add_argument("--files", type=int, default=200, help="Number of files in the synthetic corpus")
+    bench.add_argument("--size-distribution", choices=BENCH_SIZE_DISTRIBUTIONS, default="lognormal", help="Distribution of the file sizes")
+    bench.add_argument("--mean-size", type=int, default=64 * 1024, help="Mean file size in bytes")
+    bench.add_argument("--compressibility", type=float, default=0.7, help="Share (0 to 1) of the file contents that is text rather than random bytes")
+    bench.add_argument("--seed", type=int, default=0, help="Seed of the corpus generator; the same seed gives the same corpus")
+    bench.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Numbers of threads to run every workload with")
+    bench.add_argument("--modes", choices=BENCH_MODES, nargs="+", default=list(BENCH_MODES), help="Storage modes to benchmark")
+    bench.add_argument("--workloads", choices=BENCH_WORKLOADS, nargs="+", default=list(BENCH_WORKLOADS), help="Workloads to run")
+    bench.add_argument("--latency", type=float, default=0.02, help="Seconds added to every request of the emulated dropbox cloud")
+    bench.add_argument("--bandwidth", type=float, default=None, help="Bytes per second of the emulated link to dropbox cloud (default: unlimited)")
+    bench.add_argument("--workdir", type=str, default=None, help="Folder for the benchmark files (default: a temporary folder)")
+    bench.add_argument("--label", type=str, default=None, help="Free text saved in the results, e.g. the version or commit under test")
+    bench.add_argument("--output", type=str, default=None, help="Write the JSON results to this file instead of stdout")
     return parser    
 
 
@@ -525,6 +5195,19 @@ if __name__=="__main__":
     for arg in vars(args):
         logger.debug(f"{arg}: {getattr(args, arg)}")    
 
+    if args.command == "bench":
+        report = OvercloudBenchmark(n_files = args.files, size_distribution = args.size_distribution, mean_size = args.mean_size,
+                                    compressibility = args.compressibility, seed = args.seed, concurrency = args.concurrency,
+                                    modes = args.modes, workloads = args.workloads, latency = args.latency,
+                                    bandwidth = args.bandwidth, workdir = args.workdir, label = args.label).run()
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        sys.exit(0)
+
     _use_localfs = False
     if args.use_localfs:
         _use_localfs = True
@@ -555,4 +5238,5 @@ if __name__=="__main__":
     mo = ManageOvercloud(use_localfs = _use_localfs, use_dropbox = _use_dropbox, 
                       local_prefix = args.localfs_rootfolder, cloud_prefix = args.cloudfs_rootfolder,
                       dropbox_app_key = args.dropbox_app_key, dropbox_app_secret = args.dropbox_app_secret,
+                      dropbox_access_token = args.dropbox_access_token, dropbox_refresh_token = args.dropbox_refresh_token,
                       sync_if_missing_file=_sync_if_missing_file)
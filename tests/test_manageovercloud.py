@@ -0,0 +1,1014 @@
+"""
+Tests of ManageOvercloud against the offline DropboxEmulatorBackend; run with  python -m pytest tests
+"""
+import asyncio
+import collections
+import concurrent.futures
+import gzip
+import json
+import mmap
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+dropbox = pytest.importorskip("dropbox")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import manageovercloud   # noqa: E402
+
+
+def make_overcloud(tmp_path, use_localfs = True, **kwargs):
+    """ManageOvercloud on tmp_path / "local" and an emulated dropbox in tmp_path / "dropbox"; returns (mylc, emulator)"""
+    emulator = kwargs.pop("backend", None) or manageovercloud.DropboxEmulatorBackend(str(tmp_path / "dropbox"))
+    os.makedirs(tmp_path / "local", exist_ok=True)
+    kwargs.setdefault("sync_state_path", str(tmp_path / "sync_state.json"))
+    mylc = manageovercloud.ManageOvercloud(use_localfs=use_localfs, use_dropbox=True, local_prefix=str(tmp_path / "local"),
+                                           cloud_prefix="/cloud", backend=emulator, **kwargs)
+    return mylc, emulator
+
+
+# --- metadata cache ---
+
+def test_metadata_cache_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(manageovercloud.time, "monotonic", lambda: now[0])
+    cache = manageovercloud.MetadataCache(maxsize=10, ttl=5)
+    cache.put("/Cloud/A.txt", "metadata")
+    cache.put("/cloud/gone.txt", None)
+    assert cache.get("/cloud/a.txt") == (True, "metadata")
+    assert cache.get("/cloud/gone.txt") == (True, None)     # "not found" is cached too
+    now[0] += 6
+    assert cache.get("/cloud/a.txt") == (False, None)
+    assert cache.get("/cloud/gone.txt") == (False, None)
+
+
+def test_metadata_cache_invalidates_a_folder_recursively():
+    cache = manageovercloud.MetadataCache(maxsize=10, ttl=60)
+    cache.put_listing("/cloud/dir", [])
+    cache.put("/cloud/dir/sub/a.txt", "a")
+    cache.put("/cloud/other.txt", "b")
+    assert cache.get("/cloud/dir/missing.txt") == (True, None)
+    cache.invalidate("/cloud/dir", recursive=True)
+    assert cache.get("/cloud/dir/sub/a.txt") == (False, None)
+    assert cache.get("/cloud/dir/missing.txt") == (False, None)
+    assert cache.get("/cloud/other.txt") == (True, "b")
+
+
+def test_path_isfile_is_answered_from_the_metadata_cache(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, metadata_cache_size=100)
+    lookups = []
+    get_metadata = emulator.get_metadata
+    emulator.get_metadata = lambda path: lookups.append(path) or get_metadata(path)
+    assert not mylc.path_isfile("/a.txt")
+    assert not mylc.path_isfile("/a.txt")
+    assert lookups == ["/cloud/a.txt"]
+    mylc.write(b"data", "/a.txt")       # replaces the cached "not found"
+    assert mylc.path_isfile("/a.txt") and not mylc.path_isdir("/a.txt")
+    mylc.remove("/a.txt")
+    assert not mylc.path_isfile("/a.txt")
+    assert lookups == ["/cloud/a.txt"]
+
+
+# --- read_many and prefetch ---
+
+def test_read_many_yields_every_file_and_the_failures(tmp_path):
+    mylc, _ = make_overcloud(tmp_path, use_localfs=False, io_workers=4)
+    for i in range(8):
+        mylc.write(b"%d" % i * 100, f"/f{i}.txt", use_gzip=True)
+    rel_paths = [f"/f{i}.txt.gz" for i in range(8)] + ["/missing.txt.gz"]
+    results = list(mylc.read_many(rel_paths, use_gzip=True, ordered=True))
+    assert [rel_path for rel_path, _ in results] == rel_paths
+    assert [data for _, data in results[:8]] == [b"%d" % i * 100 for i in range(8)]
+    assert isinstance(results[8][1], Exception)
+    assert dict(mylc.read_many(rel_paths[:8], read_mode="r", use_gzip=True))["/f3.txt.gz"] == "3" * 100
+
+
+def test_prefetch_downloads_only_missing_local_files(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    emulator.upload(b"a" * 10, "/cloud/dir/a.txt")
+    emulator.upload(b"b" * 10, "/cloud/dir/b.txt")
+    os.makedirs(tmp_path / "local" / "dir")
+    (tmp_path / "local" / "dir" / "b.txt").write_bytes(b"local")
+    futures = mylc.prefetch(["/dir/a.txt", "/dir/b.txt", "/dir/a.txt"])
+    assert {rel_path: future.result(10) for rel_path, future in futures.items()} == {"/dir/a.txt": True, "/dir/b.txt": False}
+    assert (tmp_path / "local" / "dir" / "a.txt").read_bytes() == b"a" * 10
+    assert (tmp_path / "local" / "dir" / "b.txt").read_bytes() == b"local"
+    with pytest.raises(Exception):
+        mylc.prefetch(["/dir/missing.txt"])["/dir/missing.txt"].result(10)
+
+
+# --- upload sessions ---
+
+def test_large_uploads_go_through_a_concurrent_upload_session(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, upload_session_threshold=1000, upload_concurrency=3,
+                                    upload_chunk_size=manageovercloud.DBX_SESSION_CHUNK_ALIGNMENT)
+    offsets, lock = [], threading.Lock()
+    append = emulator.upload_session_append
+
+    def _append(session_id, offset, data, close=False):
+        with lock:
+            offsets.append((offset, len(data), close))
+        return append(session_id, offset, data, close=close)
+    emulator.upload_session_append = _append
+    emulator.upload = lambda data, path: pytest.fail("a file above the threshold was sent in one upload")
+    chunk = manageovercloud.DBX_SESSION_CHUNK_ALIGNMENT
+    data = os.urandom(2 * chunk + 12345)
+    mylc.write(data, "/big.bin")
+    assert sorted(offsets) == [(0, chunk, False), (chunk, chunk, False), (2 * chunk, 12345, True)]
+    assert emulator.download("/cloud/big.bin")[1].content == data
+    with open(tmp_path / "source.bin", "wb") as f:
+        f.write(data)
+    with open(tmp_path / "source.bin", "rb") as f:       # a file object is read chunk by chunk
+        assert mylc.dbx_upload(f, "/cloud/from_file.bin").size == len(data)
+    assert emulator.download("/cloud/from_file.bin")[1].content == data
+
+
+def test_upload_session_retries_only_the_failed_chunk(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, upload_session_threshold=1000,
+                                    upload_chunk_size=manageovercloud.DBX_SESSION_CHUNK_ALIGNMENT)
+    mylc.rate_controller.backoff_base = 0.001
+    failed, sent = [], []
+    append = emulator.upload_session_append
+
+    def _append(session_id, offset, data, close=False):
+        if offset > 0 and not failed:
+            failed.append(offset)
+            raise ConnectionError("connection reset")
+        sent.append(offset)
+        return append(session_id, offset, data, close=close)
+    emulator.upload_session_append = _append
+    chunk = manageovercloud.DBX_SESSION_CHUNK_ALIGNMENT
+    data = os.urandom(chunk + 100)
+    mylc.write(data, "/big.bin")
+    assert failed == [chunk] and sorted(sent) == [0, chunk]
+    assert emulator.download("/cloud/big.bin")[1].content == data
+
+
+# --- streaming open() for reads ---
+
+def test_open_streams_and_decompresses_a_cloud_file(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False)
+    lines = [f"line {i}\n" for i in range(20000)]
+    emulator.upload(gzip.compress("".join(lines).encode()), "/cloud/lines.txt.gz")
+    with mylc.open("/lines.txt.gz", "rt", use_gzip=True, chunk_size=4096) as f:
+        assert f.readline() == lines[0]
+        assert list(f) == lines[1:]
+    with mylc.open("/lines.txt.gz", "rb", chunk_size=4096) as f:
+        assert gzip.decompress(f.read()) == "".join(lines).encode()
+
+
+def test_open_prefers_the_local_file_and_tees_a_missing_one(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, sync_if_missing_file=True)
+    emulator.upload(b"cloud", "/cloud/a.txt")
+    emulator.upload(b"only in cloud", "/cloud/b.txt")
+    (tmp_path / "local" / "a.txt").write_bytes(b"local")
+    with mylc.open("/a.txt") as f:
+        assert f.read() == b"local"
+    with mylc.open("/b.txt") as f:
+        assert f.read() == b"only in cloud"
+    assert (tmp_path / "local" / "b.txt").read_bytes() == b"only in cloud"
+    local_only = manageovercloud.ManageOvercloud(use_localfs=True, local_prefix=str(tmp_path / "local"))
+    with pytest.raises(FileNotFoundError):
+        local_only.open("/missing.txt")
+
+
+# --- streaming open() for writes ---
+
+def test_open_writes_gzip_to_both_tiers(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    with mylc.open("/out.csv", "wt", use_gzip=True) as f:
+        for i in range(10000):
+            f.write(f"{i},row\n")
+    expected = "".join(f"{i},row\n" for i in range(10000)).encode()
+    assert gzip.decompress((tmp_path / "local" / "out.csv.gz").read_bytes()) == expected
+    assert gzip.decompress(emulator.download("/cloud/out.csv.gz")[1].content) == expected
+    assert not os.path.exists(tmp_path / "local" / "out.csv.gz.part")
+
+
+def test_open_streams_a_large_write_through_an_upload_session(tmp_path):
+    chunk = manageovercloud.DBX_SESSION_CHUNK_ALIGNMENT
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, upload_chunk_size=chunk)
+    emulator.upload = lambda data, path: pytest.fail("a file above a chunk was sent in one upload")
+    data = os.urandom(2 * chunk + 10)
+    with mylc.open("/big.bin", "wb") as f:
+        for start in range(0, len(data), 1000000):
+            f.write(data[start:start + 1000000])
+    assert emulator.download("/cloud/big.bin")[1].content == data
+
+
+def test_open_discards_a_write_that_raises(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    with pytest.raises(RuntimeError):
+        with mylc.open("/partial.txt", "wb") as f:
+            f.write(b"half")
+            raise RuntimeError("interrupted")
+    with mylc.open("/aborted.txt", "wb") as f:
+        f.write(b"data")
+        f.abort()
+    assert [name for name in os.listdir(tmp_path / "local") if not name.startswith(".")] == []
+    with pytest.raises(dropbox.exceptions.ApiError):
+        emulator.get_metadata("/cloud/partial.txt")
+    with pytest.raises(dropbox.exceptions.ApiError):
+        emulator.get_metadata("/cloud/aborted.txt")
+
+
+# --- write_many ---
+
+def test_write_many_commits_small_files_in_batches(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    batches = []
+    finish_batch = emulator.upload_session_finish_batch
+    emulator.upload_session_finish_batch = lambda entries: batches.append(len(entries)) or finish_batch(entries)
+    items = {f"/many/{i}.txt": b"%d" % i for i in range(25)}
+    os.makedirs(tmp_path / "local" / "many")
+    assert mylc.write_many(items, batch_size=10) == {rel_path: True for rel_path in items}
+    assert batches == [10, 10, 5]
+    for rel_path, data in items.items():
+        assert (tmp_path / "local" / rel_path.lstrip("/")).read_bytes() == data
+        assert emulator.download("/cloud" + rel_path)[1].content == data
+
+
+def test_write_many_reports_the_failed_files(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, upload_session_threshold=1000)
+    emulator.create_folder("/cloud/taken")
+    alone = []
+    finish = emulator.upload_session_finish
+    emulator.upload_session_finish = lambda session_id, offset, path, data=b"": alone.append(path) or finish(session_id, offset, path, data)
+    results = mylc.write_many([("/ok.txt", "text"), ("/taken", b"x"), ("/big.bin", b"b" * 5000)], use_gzip=False)
+    assert results["/ok.txt"] is True and results["/big.bin"] is True
+    assert isinstance(results["/taken"], Exception)
+    assert alone == ["/cloud/big.bin"]          # above the threshold: uploaded on its own, not in the batch
+    assert emulator.download("/cloud/ok.txt")[1].content == b"text"
+
+
+
+# --- makedirs_many, rename_many and remove_many ---
+
+def test_makedirs_many_creates_each_leaf_once(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    batches = []
+    create_folder_batch = emulator.create_folder_batch
+    emulator.create_folder_batch = lambda paths: batches.append(sorted(paths)) or create_folder_batch(paths)
+    emulator.create_folder("/cloud/old")
+    results = mylc.makedirs_many(["/a/b", "/a", "/a/b/c", "/x/", "/old"])
+    assert results == {"/a/b": True, "/a": True, "/a/b/c": True, "/x/": True, "/old": True}
+    assert batches == [["/cloud/a/b/c", "/cloud/old", "/cloud/x"]]     # parents go with their leaf, one batch call
+    for path in ("a/b/c", "x", "old"):
+        assert (tmp_path / "local" / path).is_dir()
+        assert isinstance(emulator.get_metadata("/cloud/" + path), dropbox.files.FolderMetadata)
+
+
+def test_rename_many_moves_in_one_batch_and_reports_failures(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    batches = []
+    move_batch = emulator.move_batch
+    emulator.move_batch = lambda entries: batches.append(len(entries)) or move_batch(entries)
+    mylc.write_many({"/a.txt": b"a", "/b.txt": b"b"})
+    results = mylc.rename_many({"/a.txt": "/new/a.txt", "/b.txt": "/new/deeper/b.txt", "/missing.txt": "/new/m.txt"})
+    assert results["/a.txt"] is True and results["/b.txt"] is True
+    assert isinstance(results["/missing.txt"], Exception)
+    assert batches == [3]
+    assert (tmp_path / "local" / "new" / "deeper" / "b.txt").read_bytes() == b"b"
+    assert emulator.download("/cloud/new/a.txt")[1].content == b"a"
+    assert not os.path.exists(tmp_path / "local" / "a.txt")
+    assert mylc.path_isfile("/a.txt") is False
+
+
+def test_remove_many_leaves_paths_inside_deleted_folders_to_it(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False)
+    deleted = []
+    delete_batch = emulator.delete_batch
+    emulator.delete_batch = lambda paths: deleted.append(sorted(paths)) or delete_batch(paths)
+    mylc.write_many({"/d/1.txt": b"1", "/d/2.txt": b"2", "/e.txt": b"e"})
+    results = mylc.remove_many(["/d", "/d/1.txt", "/e.txt", "/nothing.txt"])
+    assert deleted == [["/cloud/d", "/cloud/e.txt", "/cloud/nothing.txt"]]
+    assert results["/d"] is True and results["/d/1.txt"] is True and results["/e.txt"] is True
+    assert isinstance(results["/nothing.txt"], Exception)
+    for path in ("/cloud/d", "/cloud/d/2.txt", "/cloud/e.txt"):
+        with pytest.raises(dropbox.exceptions.ApiError):
+            emulator.get_metadata(path)
+
+
+# --- AsyncManageOvercloud ---
+
+def test_async_facade_bounds_the_cloud_calls_in_flight(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False)
+    in_flight, peak, lock = [0], [0], threading.Lock()
+    download = emulator.download
+
+    def _download(path, *args, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            time.sleep(0.02)
+            return download(path, *args, **kwargs)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+    emulator.download = _download
+
+    async def _run():
+        async with manageovercloud.AsyncManageOvercloud(mylc, max_cloud_concurrency=2) as amo:
+            written = await amo.write_many({f"/{i}.txt": b"%d" % i for i in range(10)})
+            datas = await amo.read_many([f"/{i}.txt" for i in range(10)] + ["/missing.txt"])
+            found = await amo.path_isfile_many(["/3.txt", "/missing.txt"])
+        return written, datas, found
+    written, datas, found = asyncio.run(_run())
+    assert written == [None] * 10
+    assert datas[:10] == [b"%d" % i for i in range(10)] and isinstance(datas[10], Exception)
+    assert found == [True, False]
+    assert peak[0] == 2
+
+
+# --- operation stats ---
+
+def test_operation_stats_histogram_and_prometheus_text():
+    stats = manageovercloud.OperationStats()
+    stats.record("read", "cloud", 0.003, bytes_in=10)
+    stats.record("read", "cloud", 0.2, error=True)
+    stats.cache_access("metadata", True)
+    stats.cache_access("metadata", False)
+    read = stats.snapshot()["operations"]["read"]["cloud"]
+    assert (read["count"], read["errors"], read["bytes_in"]) == (2, 1, 10)
+    assert sum(count for _, count in read["histogram"]) == 2
+    assert read["p50"] == 0.005 and read["p99"] == 0.25
+    assert stats.snapshot()["caches"]["metadata"]["hit_ratio"] == 0.5
+    text = stats.prometheus_text()
+    assert 'overcloud_operations_total{operation="read",tier="cloud"} 2\n' in text
+    assert 'overcloud_operation_duration_seconds_bucket{operation="read",tier="cloud",le="0.005"} 1\n' in text
+    assert 'overcloud_operation_duration_seconds_bucket{operation="read",tier="cloud",le="+Inf"} 2\n' in text
+    assert 'overcloud_cache_misses_total{cache="metadata"} 1\n' in text
+    stats.reset()
+    assert stats.snapshot()["operations"] == {}
+
+
+def test_manager_stats_count_reads_and_writes_per_tier(tmp_path):
+    mylc, _ = make_overcloud(tmp_path)
+    mylc.write(b"x" * 100, "/a.txt")
+    mylc.read("/a.txt")
+    with pytest.raises(Exception):
+        mylc.dbx_download("/cloud/missing.txt")
+    operations = mylc.stats()["operations"]
+    assert operations["write"]["local"]["bytes_out"] == 100 and operations["write"]["cloud"]["bytes_out"] == 100
+    assert operations["read"]["local"]["bytes_in"] == 100 and "cloud" not in operations["read"]
+    assert operations["dbx_download"]["cloud"]["errors"] == 1
+    assert "overcloud_operations_total" in mylc.prometheus_metrics()
+    mylc.reset_stats()
+    assert mylc.stats()["operations"] == {}
+
+
+# --- local disk cache ---
+
+def test_cache_serves_repeated_reads_from_disk(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, local_cache_bytes=10000)
+    downloads = []
+    download = emulator.download
+    emulator.download = lambda path, *args, **kwargs: downloads.append(path) or download(path, *args, **kwargs)
+    mylc.write(b"first", "/a.txt")
+    assert mylc.read("/a.txt") == b"first"      # stored in the cache by write()
+    emulator.upload(b"b" * 100, "/cloud/b.txt")
+    for _ in range(3):
+        assert mylc.read("/b.txt") == b"b" * 100
+    assert downloads == ["/cloud/b.txt"]
+    mylc.write(b"second", "/b.txt")
+    assert mylc.read("/b.txt") == b"second"
+    hits = mylc.stats()["caches"]["local_disk"]
+    assert hits["hits"] >= 2 and hits["misses"] == 1
+
+
+def test_cache_evicts_the_least_recently_used_file(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, local_cache_bytes=1000)
+    for name in "abc":
+        emulator.upload(name.encode() * 400, f"/cloud/{name}.txt")
+    mylc.read("/a.txt")
+    mylc.read("/b.txt")
+    mylc.read("/a.txt")     # a is now more recently used than b
+    mylc.read("/c.txt")
+    assert mylc.local_cache.lookup("/a.txt") is not None and mylc.local_cache.lookup("/c.txt") is not None
+    assert mylc.local_cache.lookup("/b.txt") is None
+    assert mylc.local_cache.used_bytes == 800
+
+
+def test_cache_serves_files_larger_than_the_cache(tmp_path):
+    mylc, _ = make_overcloud(tmp_path, use_localfs=False, local_cache_bytes=1000)
+    data = os.urandom(5000)
+    mylc.write(data, "/big.bin")
+    assert mylc.read("/big.bin") == data
+    with mylc.open("/big.bin", "rb") as file:
+        assert file.read() == data
+    assert bytes(mylc.read_buffer("/big.bin")) == data
+    assert mylc.local_cache.used_bytes == 0
+    assert [name for name in os.listdir(tmp_path / "local") if not name.startswith(".")] == []
+
+
+def test_cache_pins_a_fetched_file_before_evicting(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, local_cache_bytes=1500)
+    for name in ("a", "b"):
+        emulator.upload(name.encode() * 1000, f"/cloud/{name}")
+    with mylc.open("/a", "rb") as file_a:
+        # Fetching b goes over the cap; a is pinned, so b (just fetched and pinned by its reader) must survive as well
+        with mylc.open("/b", "rb") as file_b:
+            assert file_b.read() == b"b" * 1000
+        assert file_a.read() == b"a" * 1000
+    assert mylc.local_cache.used_bytes <= 1500
+
+
+# --- sync_tree ---
+
+def test_sync_tree_up_creates_the_cloud_folder(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    os.makedirs(tmp_path / "local" / "tree" / "sub")
+    (tmp_path / "local" / "tree" / "a.txt").write_bytes(b"a" * 10)
+    (tmp_path / "local" / "tree" / "sub" / "b.txt").write_bytes(b"b" * 20)
+    summary = mylc.sync_tree("/tree", direction="up")
+    assert summary["uploaded"] == 2 and not summary["errors"]
+    assert mylc.backend.download("/cloud/tree/sub/b.txt")[1].content == b"b" * 20
+    # The next run lists the new folder and finds nothing to do
+    summary = mylc.sync_tree("/tree", direction="up")
+    assert summary["uploaded"] == 0 and summary["unchanged"] == 2
+
+
+def test_sync_tree_down_copies_only_the_changes(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    emulator.upload(b"a" * 10, "/cloud/tree/a.txt")
+    emulator.upload(b"b" * 20, "/cloud/tree/sub/b.txt")
+    summary = mylc.sync_tree("/tree", direction="down")
+    assert summary["downloaded"] == 2 and summary["bytes_down"] == 30 and not summary["errors"]
+    assert (tmp_path / "local" / "tree" / "sub" / "b.txt").read_bytes() == b"b" * 20
+    emulator.upload(b"c" * 5, "/cloud/tree/sub/b.txt")
+    summary = mylc.sync_tree("/tree", direction="down")
+    assert summary["downloaded"] == 1 and summary["unchanged"] == 1
+    assert (tmp_path / "local" / "tree" / "sub" / "b.txt").read_bytes() == b"c" * 5
+
+
+def test_sync_state_of_concurrent_instances_is_merged(tmp_path):
+    managers = [make_overcloud(tmp_path)[0] for _ in range(2)]     # separate instances: only the file lock is shared
+
+    def _save(mylc, n):
+        for i in range(30):
+            mylc._save_sync_state(f"/cloud/tree-{n}-{i}", {"cursor": None, "remote": {}, "local": {}})
+    threads = [threading.Thread(target=_save, args=(mylc, n)) for n, mylc in enumerate(managers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(tmp_path / "sync_state.json") as f:
+        assert len(json.load(f)) == 60
+
+
+# --- listings and the metadata cache ---
+
+def test_paged_listing_with_a_small_metadata_cache(tmp_path):
+    emulator = manageovercloud.DropboxEmulatorBackend(str(tmp_path / "dropbox"), page_size=3)
+    mylc, _ = make_overcloud(tmp_path, use_localfs=False, backend=emulator, metadata_cache_size=8)
+    names = [f"f{i}" for i in range(6)]
+    for name in names:
+        emulator.upload(b"x", f"/cloud/A/{name}")
+        emulator.upload(b"y", f"/cloud/B/{name}")
+    seen = []
+    for entry in mylc.scandir("/A"):
+        seen.append(entry.name)
+        assert mylc.path_isfile("/B/" + entry.name)     # evicts entries of /A while it is being listed
+    assert sorted(seen) == names
+    for name in names:
+        assert mylc.path_isfile("/A/" + name)
+    assert not mylc.path_isfile("/A/missing")
+    assert sorted(mylc.listdir("/A")) == names
+
+
+def test_listed_folder_answers_missing_paths_from_the_cache(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, metadata_cache_size=100)
+    emulator.upload(b"x", "/cloud/C/a")
+    assert mylc.listdir("/C") == ["a"]
+    assert not mylc.path_isfile("/C/missing")
+    assert "path_isfile" not in mylc.stats()["operations"]
+
+
+def test_path_checks_below_a_file_are_false(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False)
+    emulator.upload(b"x", "/cloud/file.txt")
+    assert mylc.path_isfile("/file.txt")
+    assert not mylc.path_isfile("/file.txt/inner")
+    assert not mylc.path_isdir("/file.txt/inner")
+    assert not mylc.path_isfile("/nothing/here")
+
+
+
+def test_cloud_walk_yields_each_folder_before_its_content(tmp_path):
+    emulator = manageovercloud.DropboxEmulatorBackend(str(tmp_path / "dropbox"), page_size=4)
+    mylc, _ = make_overcloud(tmp_path, use_localfs=False, backend=emulator)
+    for path in ("/a/b/c/1.txt", "/a/b/2.txt", "/a/3.txt", "/d/4.txt"):
+        emulator.upload(b"x", "/cloud/top" + path)
+
+    def _reversed(result):      # dropbox does not promise an order within a recursive listing
+        return dropbox.files.ListFolderResult(entries=result.entries[::-1], cursor=result.cursor, has_more=result.has_more)
+    list_folder, list_folder_continue = emulator.list_folder, emulator.list_folder_continue
+    emulator.list_folder = lambda *args, **kwargs: _reversed(list_folder(*args, **kwargs))
+    emulator.list_folder_continue = lambda cursor: _reversed(list_folder_continue(cursor))
+    paths = [entry.path for entry in mylc.walk("/top")]
+    assert sorted(paths) == ["/top/a", "/top/a/3.txt", "/top/a/b", "/top/a/b/2.txt", "/top/a/b/c", "/top/a/b/c/1.txt",
+                             "/top/d", "/top/d/4.txt"]
+    for path in paths:
+        parent = path.rsplit("/", 1)[0]
+        assert parent == "/top" or paths.index(parent) < paths.index(path)
+
+
+# --- cloud rate controller ---
+
+def test_rate_controllers_sharing_a_state_file_share_one_budget(tmp_path):
+    path = str(tmp_path / "rate.json")
+    first, second = (manageovercloud.CloudRateController(initial_concurrency=1, max_concurrency=1, shared_state_path=path)
+                     for _ in range(2))
+    started, release, order = threading.Event(), threading.Event(), []
+
+    def _slow():
+        started.set()
+        assert release.wait(10)
+        order.append("first")
+    thread = threading.Thread(target=first.call, args=(_slow,))
+    thread.start()
+    assert started.wait(10)
+    waiter = threading.Thread(target=second.call, args=(lambda: order.append("second"),))
+    waiter.start()
+    time.sleep(0.2)
+    assert order == []          # the one call in flight of the budget belongs to the first controller
+    release.set()
+    thread.join(10)
+    waiter.join(10)
+    assert order == ["first", "second"]
+    # A whole number of calls was the limit all along: the shared file was never rewritten
+    assert os.path.getsize(path) == 0
+
+
+def test_rate_controller_drops_the_calls_of_dead_processes(tmp_path):
+    path = str(tmp_path / "rate.json")
+    controller = manageovercloud.CloudRateController(initial_concurrency=2, max_concurrency=2, shared_state_path=path)
+    controller.call(lambda: None)
+    # The file of a process that died with calls in flight, whose pid is running again (this one): nobody holds its lock
+    with open(path + ".procs/proc-%d-0000dead" % os.getpid(), "w") as f:
+        f.write("%12d\n" % 5)
+    assert controller.call(lambda: "ok") == "ok"
+    assert sorted(os.listdir(path + ".procs")) == [controller._process_name]
+
+
+def test_rate_controller_shares_a_lowered_limit(tmp_path):
+    path = str(tmp_path / "rate.json")
+    first, second = (manageovercloud.CloudRateController(initial_concurrency=8, shared_state_path=path) for _ in range(2))
+    second.call(lambda: None)
+    first._acquire()
+    first._release("rate_limit", pause=0.0)
+    assert int(first.limit) == 4
+    second.call(lambda: None)
+    assert int(second.limit) == 4
+
+
+# --- file catalog ---
+
+class FlakyContinue(object):
+    """Backend wrapper whose list_folder_continue raises the queued exceptions first"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.errors = []
+        self.continues = 0
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def list_folder_continue(self, cursor):
+        self.continues += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.backend.list_folder_continue(cursor)
+
+
+def test_catalog_poll_failure_keeps_the_tree_stale(tmp_path):
+    emulator = manageovercloud.DropboxEmulatorBackend(str(tmp_path / "dropbox"))
+    emulator.upload(b"x", "/Tree/a")
+    backend = FlakyContinue(emulator)
+    catalog = manageovercloud.FileCatalog(str(tmp_path / "catalog.db"), backend, max_age=3600)
+    catalog.track("/Tree")
+    catalog.refresh("/tree", force=True)
+    polls = backend.continues
+    backend.errors.append(emulator._api_error(dropbox.files.ListFolderContinueError.path(dropbox.files.LookupError.not_found)))
+    with catalog._write() as conn:
+        conn.execute("UPDATE roots SET polled_at = 0")
+    assert catalog.lookup("/tree/a") == (False, None)     # the poll failed: the catalog does not answer
+    assert backend.continues == polls + 1
+    catalog.lookup("/tree/a")                             # still stale, so polled again
+    assert backend.continues == polls + 2
+
+
+def test_catalog_cursor_reset_keeps_the_display_path(tmp_path):
+    emulator = manageovercloud.DropboxEmulatorBackend(str(tmp_path / "dropbox"))
+    emulator.upload(b"x", "/Tree/a")
+    backend = FlakyContinue(emulator)
+    catalog = manageovercloud.FileCatalog(str(tmp_path / "catalog.db"), backend, max_age=3600)
+    catalog.track("/Tree")
+    backend.errors.append(emulator._api_error(dropbox.files.ListFolderContinueError.reset))
+    catalog.refresh("/tree", force=True)
+    assert catalog.entry("/tree")["path"] == "/Tree"
+    known, metadata = catalog.lookup("/tree/a")
+    assert known and metadata.path_display == "/Tree/a"
+
+
+# --- write-behind queue ---
+
+def test_write_behind_remove_waits_only_for_its_own_path(tmp_path):
+    release, uploaded = threading.Event(), []
+
+    def upload(rel_path):
+        if rel_path == "/slow.txt":
+            assert release.wait(10)
+        uploaded.append(rel_path)
+
+    queue = manageovercloud.WriteBehindQueue(upload, str(tmp_path / "journal"), workers=1)
+    try:
+        queue.submit("/slow.txt")
+        queue.submit("/gone/a.txt")
+        done = threading.Thread(target=queue.cancel, args=(["/gone"],))
+        done.start()
+        done.join(5)
+        assert not done.is_alive()      # did not wait for /slow.txt
+        release.set()
+        assert queue.flush() == {}
+        assert uploaded == ["/slow.txt"]
+    finally:
+        release.set()
+        queue.close()
+
+
+def test_write_behind_recovers_only_unlocked_journals(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    held = manageovercloud.WriteBehindQueue(lambda rel_path: None, journal_dir)
+    held._log("+", "/held.txt")
+    # A journal left by a process whose pid is running now (this one), but which holds no lock on it
+    with open(os.path.join(journal_dir, "journal-%d-0000abcd" % os.getpid()), "w") as f:
+        f.write('["+", "/a.txt"]\n["+", "/b.txt"]\n["-", "/a.txt"]\n')
+    uploaded = []
+    held._open_journals.discard(held.journal_path)      # as though another process held it
+    try:
+        queue = manageovercloud.WriteBehindQueue(uploaded.append, journal_dir)
+        assert queue.flush() == {}
+        queue.close()
+    finally:
+        held._open_journals.add(held.journal_path)
+        held.close()
+    assert uploaded == ["/b.txt"]
+
+
+
+def test_write_behind_uploads_are_resumed_on_the_next_start(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    mylc, emulator = make_overcloud(tmp_path, write_behind=True, write_behind_dir=journal_dir)
+    upload = emulator.upload
+
+    def _fail(data, path):
+        raise OSError("connection lost")
+    emulator.upload = _fail
+    mylc.write(b"pending", "/a.txt")
+    failures = mylc.close()
+    assert list(failures) == ["/a.txt"]
+    assert (tmp_path / "local" / "a.txt").read_bytes() == b"pending"
+    emulator.upload = upload
+    mylc, _ = make_overcloud(tmp_path, backend=emulator, write_behind=True, write_behind_dir=journal_dir)
+    assert mylc.flush() == {}
+    assert emulator.download("/cloud/a.txt")[1].content == b"pending"
+    mylc.close()
+    assert os.listdir(journal_dir) == []
+
+# --- parallel gzip ---
+
+def test_parallel_gzip_round_trips_and_is_deterministic():
+    data = os.urandom(100 * 1024) + b"compressible text " * 20000
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        parallel = manageovercloud.parallel_gzip_compress(data, 6, 64 * 1024, executor)
+        assert manageovercloud.parallel_gzip_compress(data, 6, 64 * 1024, executor) == parallel
+    assert manageovercloud.parallel_gzip_compress(data, 6, 64 * 1024) == parallel      # same bytes on one thread
+    assert gzip.decompress(parallel) == data
+    assert len(parallel) < len(gzip.compress(data, 6)) * 1.01
+    assert gzip.decompress(manageovercloud.parallel_gzip_compress(b"")) == b""
+
+
+def test_write_gzip_in_parallel_blocks(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, gzip_block_size=64 * 1024, gzip_threads=4)
+    data = b"line of a filing\n" * 50000
+    mylc.write(data, "/filing.txt", use_gzip=True)
+    assert mylc.read("/filing.txt.gz", use_gzip=True) == data
+    assert gzip.decompress(emulator.download("/cloud/filing.txt.gz")[1].content) == data
+
+
+def test_write_keeps_the_gz_suffix_for_data_that_is_gzip_already(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    payload = gzip.compress(b"hello")
+    mylc.write(payload, "/b.txt", use_gzip=True)
+    assert (tmp_path / "local" / "b.txt.gz").read_bytes() == payload      # stored as it is, not compressed twice
+    assert not os.path.exists(tmp_path / "local" / "b.txt")
+    assert emulator.download("/cloud/b.txt.gz")[1].content == payload
+    assert mylc.read("/b.txt.gz", use_gzip=True) == b"hello"
+    assert mylc.write_many({"/c.txt": payload}, use_gzip=True) == {"/c.txt": True}
+    assert (tmp_path / "local" / "c.txt.gz").read_bytes() == payload
+
+
+# --- gzip index ---
+
+def test_write_many_saves_the_gzip_index(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, gzip_index=True, gzip_block_size=64 * 1024, gzip_index_spacing=64 * 1024)
+    data = os.urandom(300 * 1024)
+    assert mylc.write_many({"/many.txt": data}, use_gzip=True) == {"/many.txt": True}
+    assert os.path.isfile(tmp_path / "local" / ("many.txt.gz" + manageovercloud.GZIP_INDEX_SUFFIX))
+    assert emulator.get_metadata("/cloud/many.txt.gz" + manageovercloud.GZIP_INDEX_SUFFIX).size > 0
+    mylc._gzip_indexes.clear()
+    assert mylc.read_range("/many.txt.gz", 200 * 1024, 1000) == data[200 * 1024:200 * 1024 + 1000]
+    assert mylc._gzip_indexes["/many.txt.gz"] is not None
+
+
+def test_missing_gzip_index_is_looked_up_once(tmp_path):
+    mylc, _ = make_overcloud(tmp_path)
+    mylc.write(b"x" * 10000, "/plain.txt", use_gzip=True)
+    lookups = []
+    read = mylc.read
+    mylc.read = lambda rel_path, *args, **kwargs: lookups.append(rel_path) or read(rel_path, *args, **kwargs)
+    for start in (0, 100, 5000):
+        assert mylc.read_range("/plain.txt.gz", start, 10) == b"x" * 10
+    assert lookups == ["/plain.txt.gz" + manageovercloud.GZIP_INDEX_SUFFIX]
+
+
+
+def test_read_range_uses_the_gzip_index_of_write(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False, gzip_index=True, gzip_block_size=64 * 1024, gzip_index_spacing=64 * 1024)
+    data = os.urandom(300 * 1024)
+    mylc.write(data, "/one.txt", use_gzip=True)
+    ranges = []
+    download = emulator.download
+    emulator.download = lambda path, byte_range=None: ranges.append(byte_range) or download(path, byte_range=byte_range)
+    mylc._gzip_indexes.clear()
+    assert mylc.read_range("/one.txt.gz", 250 * 1024, 1000) == data[250 * 1024:250 * 1024 + 1000]
+    assert ranges[-1] is not None and ranges[-1][0] > 0       # a ranged download from an access point
+
+
+def _gzip_index_places(tmp_path, emulator, rel_path):
+    """(local sidecar exists, cloud sidecar exists) of rel_path"""
+    sidecar = rel_path + manageovercloud.GZIP_INDEX_SUFFIX
+    try:
+        emulator.get_metadata("/cloud" + sidecar)
+        in_cloud = True
+    except dropbox.exceptions.ApiError:
+        in_cloud = False
+    return os.path.isfile(str(tmp_path / "local") + sidecar), in_cloud
+
+
+def test_gzip_index_follows_rename_and_remove(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, gzip_index=True, gzip_block_size=64 * 1024, gzip_index_spacing=64 * 1024)
+    data = os.urandom(300 * 1024)
+    mylc.write(data, "/a.txt", use_gzip=True)
+    assert _gzip_index_places(tmp_path, emulator, "/a.txt.gz") == (True, True)
+    mylc.rename("/a.txt.gz", "/b.txt.gz")
+    assert _gzip_index_places(tmp_path, emulator, "/a.txt.gz") == (False, False)
+    assert _gzip_index_places(tmp_path, emulator, "/b.txt.gz") == (True, True)
+    mylc._gzip_indexes.clear()
+    assert mylc.read_range("/b.txt.gz", 250 * 1024, 100) == data[250 * 1024:250 * 1024 + 100]
+    assert mylc._gzip_indexes["/b.txt.gz"] is not None
+    mylc.remove("/b.txt.gz")
+    assert _gzip_index_places(tmp_path, emulator, "/b.txt.gz") == (False, False)
+
+    assert mylc.write_many({"/c.txt": data, "/d.txt": data}, use_gzip=True) == {"/c.txt": True, "/d.txt": True}
+    assert mylc.rename_many({"/c.txt.gz": "/e.txt.gz", "/d.txt.gz": "/f.txt.gz"}) == {"/c.txt.gz": True, "/d.txt.gz": True}
+    assert [_gzip_index_places(tmp_path, emulator, path) for path in ("/c.txt.gz", "/e.txt.gz", "/f.txt.gz")] == \
+        [(False, False), (True, True), (True, True)]
+    assert mylc.remove_many(["/e.txt.gz", "/f.txt.gz"]) == {"/e.txt.gz": True, "/f.txt.gz": True}
+    assert [_gzip_index_places(tmp_path, emulator, path) for path in ("/e.txt.gz", "/f.txt.gz")] == [(False, False)] * 2
+
+
+def test_gzip_index_is_dropped_on_rewrite_and_hidden_from_listings(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, gzip_index=True, gzip_block_size=64 * 1024, gzip_index_spacing=64 * 1024)
+    mylc.makedirs("/d")
+    mylc.write(os.urandom(300 * 1024), "/d/a.txt", use_gzip=True)
+    assert mylc.listdir("/d") == ["a.txt.gz"]
+    assert [entry.name for entry in mylc.scandir("/d")] == ["a.txt.gz"]
+    assert [entry.path for entry in mylc.walk("/d")] == ["/d/a.txt.gz"]
+    mylc.use_localfs = False
+    assert mylc.listdir("/d") == ["a.txt.gz"]
+    assert [entry.path for entry in mylc.walk("/d")] == ["/d/a.txt.gz"]
+    mylc.use_localfs = True
+
+    mylc.gzip_index = False
+    with mylc.open("/d/a.txt.gz", "wb", use_gzip=True) as f:
+        f.write(b"short")
+    assert _gzip_index_places(tmp_path, emulator, "/d/a.txt.gz") == (False, False)
+    assert mylc.read_range("/d/a.txt.gz", 1, 3) == b"hor"
+
+
+
+# --- zero-copy reads ---
+
+def test_read_buffer_maps_the_local_file(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    (tmp_path / "local" / "a.txt").write_bytes(b"local bytes")
+    (tmp_path / "local" / "empty.txt").write_bytes(b"")
+    emulator.upload(b"cloud bytes", "/cloud/b.txt")
+    buffer = mylc.read_buffer("/a.txt")
+    assert isinstance(buffer.obj, mmap.mmap) and buffer.readonly
+    assert buffer == b"local bytes"
+    buffer.release()
+    assert mylc.read_buffer("/empty.txt") == b""
+    assert mylc.read_buffer("/b.txt") == b"cloud bytes"        # only in the cloud: downloaded
+
+
+def test_zero_copy_read_decompresses_and_decodes_from_the_buffer(tmp_path):
+    mylc, _ = make_overcloud(tmp_path, use_localfs=False, local_cache_bytes=1000000)
+    mylc.write("héllo " * 1000, "/t.txt", use_gzip=True)
+    assert mylc.read("/t.txt.gz", "rb", use_gzip=True, zero_copy=True) == ("héllo " * 1000).encode()
+    assert mylc.read("/t.txt.gz", "rt", use_gzip=True, zero_copy=True) == "héllo " * 1000
+    buffer = mylc.read("/t.txt.gz", zero_copy=True)
+    assert isinstance(buffer.obj, mmap.mmap)                  # mapped from the local disk cache
+    assert gzip.decompress(buffer) == ("héllo " * 1000).encode()
+
+
+def test_readinto_fills_the_callers_buffer(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path)
+    (tmp_path / "local" / "a.bin").write_bytes(b"a" * 1000)
+    emulator.upload(b"b" * 3000, "/cloud/b.bin")
+    buffer = bytearray(2000)
+    assert mylc.readinto("/a.bin", buffer) == 1000 and buffer[:1000] == b"a" * 1000
+    with pytest.raises(ValueError):
+        mylc.readinto("/b.bin", buffer)
+    assert buffer[1000:] == bytes(1000)         # nothing written before the size check
+    buffer = bytearray(4000)
+    assert mylc.readinto("/b.bin", buffer) == 3000 and buffer[:3000] == b"b" * 3000
+
+
+# --- dropbox emulator ---
+
+def test_emulator_renames_a_folder_to_another_case(tmp_path):
+    emulator = manageovercloud.DropboxEmulatorBackend(str(tmp_path / "dropbox"))
+    emulator.upload(b"data", "/docs/a.txt")
+    assert emulator.move("/docs", "/Docs").path_display == "/Docs"
+    assert emulator.get_metadata("/docs/a.txt").path_display == "/Docs/a.txt"
+    with pytest.raises(dropbox.exceptions.ApiError):
+        emulator.move("/Docs", "/docs/sub")
+
+
+def test_emulator_upload_limit_is_exclusive(tmp_path):
+    emulator = manageovercloud.DropboxEmulatorBackend(str(tmp_path / "dropbox"), upload_limit=10)
+    emulator.upload(b"x" * 9, "/nine.txt")
+    with pytest.raises(dropbox.exceptions.ApiError):
+        emulator.upload(b"x" * 10, "/ten.txt")
+
+
+def test_dbx_download_closes_the_response(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, use_localfs=False)
+    emulator.upload(b"data", "/cloud/a.txt")
+    closed = []
+    download = emulator.download
+
+    def _download(path, *args, **kwargs):
+        md, res = download(path, *args, **kwargs)
+        close = res.close
+        res.close = lambda: closed.append(path) or close()
+        return md, res
+    emulator.download = _download
+    assert mylc.dbx_download("/cloud/a.txt") == b"data"
+    assert closed == ["/cloud/a.txt"]
+
+
+# --- dropbox backend ---
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_dropbox_backend_lock_is_made_again_after_fork(tmp_path):
+    backend = manageovercloud.DropboxBackend(connect=lambda: os.getpid())
+    assert backend.dbx == os.getpid()
+    backend._lock.acquire()     # as though another thread was connecting when the process forked
+    try:
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if backend.dbx == os.getpid() else 1)
+    finally:
+        backend._lock.release()
+    assert _exit_code_of_child(pid) == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_write_behind_queue_starts_over_after_fork(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    uploads = tmp_path / "uploads"
+    queue = manageovercloud.WriteBehindQueue(lambda rel_path: uploads.open("a").write(f"{os.getpid()} {rel_path}\n"), journal_dir)
+    parent_journal = queue.journal_path
+    queue._cond.acquire()       # as though a worker held the lock when the process forked
+    try:
+        pid = os.fork()
+        if pid == 0:
+            ok = queue.pending == 0 and queue.journal_path is None
+            queue.submit("/child.txt")
+            ok = ok and queue.flush() == {} and queue.journal_path != parent_journal
+            queue.close()
+            os._exit(0 if ok else 1)
+    finally:
+        queue._cond.release()
+    assert _exit_code_of_child(pid) == 0
+    assert uploads.read_text() == f"{pid} /child.txt\n"
+    with open(parent_journal) as f:
+        assert manageovercloud._lock_file(f, blocking=False) is False      # still held by the parent only
+    queue.submit("/parent.txt")
+    assert queue.flush() == {}
+    queue.close()
+    assert uploads.read_text().endswith(f"{os.getpid()} /parent.txt\n")
+    assert os.listdir(journal_dir) == []
+
+
+def _exit_code_of_child(pid):
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status)
+        time.sleep(0.05)
+    os.kill(pid, 9)
+    os.waitpid(pid, 0)
+    pytest.fail("the child deadlocked on a lock held at fork time")
+
+
+# --- benchmark ---
+
+def test_synthetic_corpus_is_reproducible():
+    corpus = manageovercloud.synthetic_edgar_corpus(20, mean_size=4096, seed=3)
+    assert corpus == manageovercloud.synthetic_edgar_corpus(20, mean_size=4096, seed=3)
+    assert corpus != manageovercloud.synthetic_edgar_corpus(20, mean_size=4096, seed=4)
+    assert len(corpus) == 20 and all(rel_path.startswith("/edgar/data/") for rel_path, _ in corpus)
+    with pytest.raises(ValueError):
+        manageovercloud.synthetic_edgar_corpus(20, size_distribution="pareto")
+
+
+def test_bench_command_writes_a_json_report(tmp_path):
+    workloads = ["write", "read", "sync"]
+    subprocess.run([sys.executable, manageovercloud.__file__, "bench", "--files", "6", "--concurrency", "2", "--modes", "dual",
+                    "--workloads", *workloads, "--latency", "0", "--workdir", str(tmp_path / "work"), "--label", "test",
+                    "--output", str(tmp_path / "bench.json")], check=True, timeout=120)
+    report = json.loads((tmp_path / "bench.json").read_text())
+    assert report["label"] == "test" and report["config"]["files"] == 6 and report["corpus"]["files"] == 6
+    assert [(result["mode"], result["concurrency"], result["workload"]) for result in report["results"]] == \
+        [("dual", 2, workload) for workload in workloads]
+    for result in report["results"]:
+        assert result["errors"] == 0 and result["ops"] > 0
+
+
+# --- skip_unchanged ---
+
+def _count_uploads(emulator):
+    """Replace the upload calls of emulator with counting ones; returns the counts, by call"""
+    counts = collections.Counter()
+    for name in ("upload", "upload_session_start", "upload_session_finish", "upload_session_finish_batch"):
+        def _counted(*args, _call=getattr(emulator, name), _name=name, **kwargs):
+            counts[_name] += 1
+            return _call(*args, **kwargs)
+        setattr(emulator, name, _counted)
+    return counts
+
+
+def test_write_skips_unchanged_copies(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, skip_unchanged=True)
+    mylc.write("same text " * 100, "/a.txt", use_gzip=True)
+    mtime = os.stat(tmp_path / "local" / "a.txt.gz").st_mtime_ns
+    counts = _count_uploads(emulator)
+    mylc.write("same text " * 100, "/a.txt", use_gzip=True)
+    assert not counts and os.stat(tmp_path / "local" / "a.txt.gz").st_mtime_ns == mtime
+    assert mylc.stats()["skipped"]["local"]["files"] == 1 and mylc.stats()["skipped"]["cloud"]["files"] == 1
+    mylc.write("new text", "/a.txt", use_gzip=True)
+    assert counts["upload"] == 1 and mylc.read("/a.txt.gz", "rt", use_gzip=True) == "new text"
+
+
+def test_write_many_skips_unchanged_copies(tmp_path):
+    mylc, emulator = make_overcloud(tmp_path, skip_unchanged=True, upload_session_threshold=1000)
+    items = {"/small.txt": b"s" * 100, "/big.txt": b"b" * 5000}
+    assert mylc.write_many(items) == {"/small.txt": True, "/big.txt": True}
+    counts = _count_uploads(emulator)
+    assert mylc.write_many(items) == {"/small.txt": True, "/big.txt": True}
+    assert not counts
+    assert mylc.stats()["skipped"]["local"]["files"] == 2 and mylc.stats()["skipped"]["cloud"]["files"] == 2
+    assert mylc.write_many({"/small.txt": b"changed", "/big.txt": b"b" * 5000}) == {"/small.txt": True, "/big.txt": True}
+    assert counts["upload_session_finish_batch"] == 1 and counts["upload_session_finish"] == 0
+    assert emulator.download("/cloud/small.txt")[1].content == b"changed"
+
+
+def test_open_for_writing_skips_unchanged_copies(tmp_path):
+    chunk = manageovercloud.DBX_SESSION_CHUNK_ALIGNMENT
+    mylc, emulator = make_overcloud(tmp_path, skip_unchanged=True, upload_chunk_size=chunk)
+    data = {"/small.bin": os.urandom(1000), "/big.bin": os.urandom(2 * chunk + 10)}    # the big one goes through a session
+    for rel_path, content in data.items():
+        with mylc.open(rel_path, "wb") as f:
+            f.write(content)
+    revisions = {rel_path: emulator.get_metadata("/cloud" + rel_path).rev for rel_path in data}
+    mtimes = {rel_path: os.stat(str(tmp_path / "local") + rel_path).st_mtime_ns for rel_path in data}
+    counts = _count_uploads(emulator)
+    for rel_path, content in data.items():
+        with mylc.open(rel_path, "wb") as f:
+            f.write(content)
+    assert counts["upload"] == 0 and counts["upload_session_finish"] == 0
+    assert {rel_path: emulator.get_metadata("/cloud" + rel_path).rev for rel_path in data} == revisions
+    assert {rel_path: os.stat(str(tmp_path / "local") + rel_path).st_mtime_ns for rel_path in data} == mtimes
+    assert not [name for name in os.listdir(tmp_path / "local") if name.endswith(".part")]
+    assert mylc.stats()["skipped"]["local"]["files"] == 2 and mylc.stats()["skipped"]["cloud"]["files"] == 2